@@ -0,0 +1,124 @@
+"""
+Login-storm benchmark for a running API server.
+
+Probes a cheap endpoint on its own, then again while many clients log in at once, and
+reports login throughput, requests shed with 503 and the probe latency in both phases.
+With password hashing on the auth pool the probe latency should stay about flat.
+
+    python auth_benchmark.py --url http://localhost:8001 --email bench@example.com --password secret --register
+"""
+import argparse
+import asyncio
+import logging
+import time
+from typing import Dict, List
+
+import httpx
+import numpy as np
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+def latency_summary(samples: List[float]) -> Dict[str, float]:
+    """p50/p95/p99/max of latencies, in milliseconds"""
+    if not samples:
+        return {}
+    ms = np.array(samples) * 1000
+    return {
+        "p50": round(float(np.percentile(ms, 50)), 2),
+        "p95": round(float(np.percentile(ms, 95)), 2),
+        "p99": round(float(np.percentile(ms, 99)), 2),
+        "max": round(float(ms.max()), 2)
+    }
+
+async def probe(client: httpx.AsyncClient, path: str, headers: dict, stop: asyncio.Event, interval: float) -> List[float]:
+    """Latency of sequential requests to ``path`` until ``stop`` is set"""
+    samples = []
+    while not stop.is_set():
+        started = time.perf_counter()
+        response = await client.get(path, headers=headers)
+        samples.append(time.perf_counter() - started)
+        if response.status_code >= 500:
+            logger.warning(f"Probe {path} returned {response.status_code}")
+        await asyncio.sleep(interval)
+    return samples
+
+async def login_loop(client: httpx.AsyncClient, credentials: dict, stop: asyncio.Event, counts: Dict[str, int]):
+    while not stop.is_set():
+        response = await client.post('/api/auth/login', json=credentials)
+        if response.status_code == 200:
+            counts['ok'] += 1
+        elif response.status_code == 503:
+            counts['shed'] += 1
+            await asyncio.sleep(float(response.headers.get('Retry-After', '1')))
+        else:
+            counts['failed'] += 1
+
+async def run_benchmark(
+    url: str,
+    email: str,
+    password: str,
+    register: bool = False,
+    clients: int = 50,
+    seconds: float = 10.0,
+    probe_path: str = '/api/health',
+    interval: float = 0.05
+) -> dict:
+    credentials = {"email": email, "password": password}
+    limits = httpx.Limits(max_connections=clients + 4)
+    async with httpx.AsyncClient(base_url=url, timeout=60, limits=limits) as client:
+        if register:
+            response = await client.post('/api/auth/register', json={**credentials, "full_name": "Benchmark User"})
+            if response.status_code not in (200, 400):
+                raise RuntimeError(f"Registration failed: {response.status_code} {response.text}")
+        response = await client.post('/api/auth/login', json=credentials)
+        if response.status_code != 200:
+            raise RuntimeError(f"Login failed: {response.status_code} {response.text}")
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        stop = asyncio.Event()
+        probing = asyncio.create_task(probe(client, probe_path, headers, stop, interval))
+        await asyncio.sleep(seconds / 2)
+        stop.set()
+        baseline = await probing
+        logger.info(f"Baseline {probe_path}: {latency_summary(baseline)} over {len(baseline)} requests")
+
+        stop = asyncio.Event()
+        counts = {"ok": 0, "shed": 0, "failed": 0}
+        started = time.perf_counter()
+        storm = [asyncio.create_task(login_loop(client, credentials, stop, counts)) for _ in range(clients)]
+        probing = asyncio.create_task(probe(client, probe_path, headers, stop, interval))
+        await asyncio.sleep(seconds)
+        stop.set()
+        during = await probing
+        await asyncio.gather(*storm)
+        elapsed = time.perf_counter() - started
+
+    result = {
+        "clients": clients,
+        "logins_per_second": round(counts['ok'] / elapsed, 1),
+        "logins": counts['ok'],
+        "shed": counts['shed'],
+        "failed": counts['failed'],
+        "probe_baseline_ms": latency_summary(baseline),
+        "probe_during_storm_ms": latency_summary(during)
+    }
+    logger.info(f"Login storm: {result['logins_per_second']} logins/s with {clients} clients, "
+                f"{counts['shed']} shed (503), {counts['failed']} failed")
+    logger.info(f"During storm {probe_path}: {result['probe_during_storm_ms']} over {len(during)} requests")
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure endpoint latency under a login storm")
+    parser.add_argument('--url', default='http://localhost:8001')
+    parser.add_argument('--email', required=True)
+    parser.add_argument('--password', required=True)
+    parser.add_argument('--register', action='store_true', help="Register the user first (ignored if it exists)")
+    parser.add_argument('--clients', type=int, default=50, help="Concurrent login loops")
+    parser.add_argument('--seconds', type=float, default=10.0, help="Storm duration (the baseline runs half as long)")
+    parser.add_argument('--probe', default='/api/health', help="Endpoint whose latency is measured")
+    args = parser.parse_args()
+    asyncio.run(run_benchmark(args.url, args.email, args.password, args.register, args.clients, args.seconds, args.probe))
+
+if __name__ == "__main__":
+    main()
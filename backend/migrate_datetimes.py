@@ -0,0 +1,145 @@
+"""
+Online migration of created_at from ISO strings to native BSON dates.
+
+Older alerts, comments and tags were written with ``created_at`` as an ISO string. This
+rewrites them in small batches while the API keeps serving: each update only applies if
+the document still holds the string that was read, so concurrent writes are never
+clobbered, and the run can be stopped and restarted at any point. Once a collection has no
+string dates left, the single-field indexes that the compound keyset indexes replace are
+dropped.
+
+    python migrate_datetimes.py --dry-run
+    python migrate_datetimes.py --batch-size 500 --pause 0.1
+"""
+import argparse
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+from pymongo import ASCENDING, DESCENDING, MongoClient, UpdateOne
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env', override=True)
+
+# Indexes the server creates at startup, and the older ones each of them makes redundant
+KEYSET_INDEXES = {
+    "alerts": [
+        [("created_at", DESCENDING), ("id", DESCENDING)],
+        [("status", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)]
+    ],
+    "comments": [[("entity_type", ASCENDING), ("entity_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)]],
+    "tags": [[("entity_type", ASCENDING), ("entity_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)]]
+}
+SUPERSEDED_INDEXES = {
+    "alerts": ["status_1", "created_at_-1"],
+    "comments": ["entity_type_1_entity_id_1"],
+    "tags": ["entity_type_1_entity_id_1"]
+}
+STRING_DATES = {"created_at": {"$type": "string"}}
+
+def parse_created_at(value: str) -> Optional[datetime]:
+    """ISO string as a UTC datetime (naive strings are taken as UTC), or None if unparseable"""
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    return parsed.astimezone(timezone.utc) if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+def migrate_collection(collection, batch_size: int = 500, pause: float = 0.0) -> Dict[str, int]:
+    """Rewrite string created_at values in _id order, one bulk write per batch"""
+    counts = {"converted": 0, "skipped": 0, "unparseable": 0}
+    last_id = None
+    while True:
+        query = dict(STRING_DATES)
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        docs = list(collection.find(query, {"created_at": 1}).sort("_id", ASCENDING).limit(batch_size))
+        if not docs:
+            break
+        last_id = docs[-1]["_id"]
+
+        updates: List[UpdateOne] = []
+        for doc in docs:
+            created_at = parse_created_at(doc["created_at"])
+            if created_at is None:
+                logger.warning(f"{collection.name} {doc['_id']}: cannot parse created_at {doc['created_at']!r}")
+                counts["unparseable"] += 1
+                continue
+            # Matching on the old value leaves documents changed since the read untouched
+            updates.append(UpdateOne({"_id": doc["_id"], "created_at": doc["created_at"]}, {"$set": {"created_at": created_at}}))
+        if updates:
+            result = collection.bulk_write(updates, ordered=False)
+            counts["converted"] += result.modified_count
+            counts["skipped"] += len(updates) - result.modified_count
+        logger.info(f"{collection.name}: {counts['converted']} converted so far")
+        if pause:
+            time.sleep(pause)
+    return counts
+
+def finish_indexes(collection, keep_old: bool = False):
+    """Make sure the keyset indexes exist, then drop the ones they supersede"""
+    for keys in KEYSET_INDEXES[collection.name]:
+        collection.create_index(keys)
+    if keep_old:
+        return
+    existing = collection.index_information()
+    for name in SUPERSEDED_INDEXES[collection.name]:
+        if name in existing:
+            collection.drop_index(name)
+            logger.info(f"{collection.name}: dropped index {name}")
+
+def run_migration(
+    mongo_url: str,
+    db_name: str,
+    collections: List[str],
+    batch_size: int = 500,
+    pause: float = 0.0,
+    dry_run: bool = False,
+    keep_old_indexes: bool = False
+) -> Dict[str, dict]:
+    client = MongoClient(mongo_url, tz_aware=True)
+    db = client[db_name]
+    summary = {}
+    try:
+        for name in collections:
+            collection = db[name]
+            pending = collection.count_documents(STRING_DATES)
+            if dry_run:
+                logger.info(f"{name}: {pending} documents with string created_at")
+                summary[name] = {"pending": pending}
+                continue
+
+            started = time.perf_counter()
+            counts = migrate_collection(collection, batch_size, pause)
+            remaining = collection.count_documents(STRING_DATES)
+            logger.info(f"{name}: {counts['converted']} converted, {counts['skipped']} changed underneath, "
+                        f"{counts['unparseable']} unparseable in {time.perf_counter() - started:.1f}s; {remaining} left")
+            if remaining == 0:
+                finish_indexes(collection, keep_old_indexes)
+            else:
+                logger.warning(f"{name}: keeping the old indexes until every created_at is a date (rerun to retry)")
+            summary[name] = {**counts, "remaining": remaining}
+    finally:
+        client.close()
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert created_at strings to BSON dates while the API is running")
+    parser.add_argument('--collections', nargs='+', default=list(KEYSET_INDEXES), choices=list(KEYSET_INDEXES))
+    parser.add_argument('--batch-size', type=int, default=500, help="Documents per bulk write")
+    parser.add_argument('--pause', type=float, default=0.0, help="Seconds to sleep between batches")
+    parser.add_argument('--dry-run', action='store_true', help="Only count documents that still need converting")
+    parser.add_argument('--keep-old-indexes', action='store_true', help="Do not drop the superseded single-field indexes")
+    args = parser.parse_args()
+    run_migration(os.environ['MONGO_URL'], os.environ['DB_NAME'], args.collections,
+                  args.batch_size, args.pause, args.dry_run, args.keep_old_indexes)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1361 @@
+"""
+Clinical data preprocessing pipeline.
+
+Importable, command-line version of "Code for Data Cleaning and Preprocessing.ipynb".
+It combines the per-study QC files, builds the patient-level view (``unified_df``),
+the site summary with Risk_Score/Risk_Level and the high-risk site list, using
+vectorized column operations instead of row-wise ``apply`` and a single join for
+all per-subject metrics.
+
+    python pipeline.py combine --source "QC Anonymized Study Files"
+    python pipeline.py run --source "QC Anonymized Study Files" --output .
+    python pipeline.py publish --source "QC Anonymized Study Files" --target sqlite:published.db
+    python pipeline.py benchmark --subjects 1000000
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+SOURCE_DIR = Path(os.getenv('PIPELINE_SOURCE_DIR', 'QC Anonymized Study Files'))
+OUTPUT_DIR = Path(os.getenv('PIPELINE_OUTPUT_DIR', '.'))
+
+# ==================== COMBINE STUDY FILES ====================
+# Study files are parsed in a process pool and each parsed file is cached as Parquet,
+# so a re-run only parses the Excel files that changed. Combined datasets are written
+# as Parquet too.
+
+# Parsed-file cache; defaults to a hidden folder inside the source folder
+CACHE_DIR = os.getenv('PIPELINE_CACHE_DIR')
+INGEST_WORKERS = int(os.getenv('PIPELINE_WORKERS', '0')) or os.cpu_count() or 1
+# Row group size of written Parquet files; bounds what a streaming read holds at once
+PARQUET_ROW_GROUP_ROWS = int(os.getenv('PIPELINE_ROW_GROUP_ROWS', '100000'))
+
+# Dataset keyword found in the per-study file names -> combined output file
+DATASETS = {
+    "Compiled_EDRR": "Combined_Compiled_EDRR_updated.parquet",
+    "CPID_EDC_Metrics": "Combined_CPID_EDC_Metrics.parquet",
+    "eSAE Dashboard": "Combined_eSAE_Dashboard.parquet",
+    "GlobalCodingReport_MedDRA": "Combined_GlobalCodingReport_MedDRA.parquet",
+    "GlobalCodingReport_WHODD": "Combined_GlobalCodingReport_WHODD.parquet",
+    "Inactivated Forms": "Combined_Inactivated_Forms.parquet",
+    "Missing_Lab_Name": "Combined_Missing_Lab_Ranges.parquet",
+    "Missing_Pages_Report": "Combined_Missing_Pages.parquet",
+    "Visit Projection Tracker": "Combined_Visit_Projection.parquet"
+}
+
+# Frames used by the integration step, by the dataset keyword they come from
+INPUTS = {
+    'edc_metrics': "CPID_EDC_Metrics",
+    'edrr': "Compiled_EDRR",
+    'meddra': "GlobalCodingReport_MedDRA",
+    'whodd': "GlobalCodingReport_WHODD",
+    'missing_lab': "Missing_Lab_Name",
+    'missing_pages': "Missing_Pages_Report"
+}
+
+def study_files(source_dir: Path, keyword: str) -> List[tuple]:
+    """(study name, path) of every Excel file for one dataset across the study folders"""
+    files = []
+    for folder in sorted(p for p in source_dir.iterdir() if p.is_dir() and not p.name.startswith('.')):
+        study = folder.name.split("_")[0].strip()
+        for path in sorted(folder.iterdir()):
+            if keyword in path.name and path.suffix in ('.xlsx', '.xls'):
+                files.append((study, path))
+    return files
+
+def content_hash(path: Path) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def write_parquet(df: pd.DataFrame, path: Path):
+    """Atomically write a frame as Parquet; Excel columns mixing text and numbers are stored as text"""
+    df.columns = [str(c) for c in df.columns]
+    tmp_path = path.with_name(path.name + '.tmp')
+    try:
+        df.to_parquet(tmp_path, index=False, row_group_size=PARQUET_ROW_GROUP_ROWS)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        for column in df.columns[df.dtypes == object]:
+            values = df[column]
+            df[column] = values.where(values.isna(), values.astype(str))
+        df.to_parquet(tmp_path, index=False, row_group_size=PARQUET_ROW_GROUP_ROWS)
+    os.replace(tmp_path, path)
+
+def parse_excel(path: str, target: str) -> int:
+    """Parse one Excel file into a Parquet file (runs in a worker process)"""
+    df = pd.read_excel(path)
+    write_parquet(df, Path(target))
+    return len(df)
+
+class ParquetCache:
+    """Parsed study files as Parquet, keyed by source path, mtime and content hash.
+
+    A file whose path, mtime and size match the manifest is not even read. Otherwise
+    its content hash is computed, and only new content is parsed; Parquet files are
+    named by content hash, so a touched-but-unchanged file is not parsed again.
+    """
+    MANIFEST = 'manifest.json'
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self.directory.mkdir(parents=True, exist_ok=True)
+        manifest_path = directory / self.MANIFEST
+        self.manifest: Dict[str, dict] = json.loads(manifest_path.read_text()) if manifest_path.exists() else {}
+
+    def save(self):
+        tmp_path = self.directory / (self.MANIFEST + '.tmp')
+        tmp_path.write_text(json.dumps(self.manifest, indent=1, sort_keys=True))
+        os.replace(tmp_path, self.directory / self.MANIFEST)
+
+    def ensure(self, paths: List[Path], workers: int = INGEST_WORKERS) -> Dict[Path, Path]:
+        """Parquet file of every parseable path, parsing changed files in a process pool"""
+        parquet: Dict[Path, Path] = {}
+        pending: Dict[Path, Path] = {}
+        for path in paths:
+            key = str(path.resolve())
+            stat = path.stat()
+            entry = self.manifest.get(key)
+            if entry and entry['mtime_ns'] == stat.st_mtime_ns and entry['size'] == stat.st_size:
+                target = self.directory / entry['parquet']
+                if target.exists():
+                    parquet[path] = target
+                    continue
+            digest = content_hash(path)
+            target = self.directory / f"{digest}.parquet"
+            if not target.exists():
+                pending[path] = target
+            parquet[path] = target
+            self.manifest[key] = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "hash": digest, "parquet": target.name}
+
+        logger.info(f"{len(paths) - len(pending)} of {len(paths)} study files cached, parsing {len(pending)}")
+        failed = []
+        if len(pending) > 1 and workers > 1:
+            with ProcessPoolExecutor(max_workers=min(workers, len(pending))) as pool:
+                futures = {path: pool.submit(parse_excel, str(path), str(target)) for path, target in pending.items()}
+                for path, future in futures.items():
+                    try:
+                        logger.info(f"Parsed: {path} ({future.result()} rows)")
+                    except Exception as e:
+                        logger.error(f"Error reading {path}: {e}")
+                        failed.append(path)
+        else:
+            for path, target in pending.items():
+                try:
+                    logger.info(f"Parsed: {path} ({parse_excel(str(path), str(target))} rows)")
+                except Exception as e:
+                    logger.error(f"Error reading {path}: {e}")
+                    failed.append(path)
+        for path in failed:
+            del parquet[path]
+            self.manifest.pop(str(path.resolve()), None)
+        self.save()
+        self.prune()
+        return parquet
+
+    def prune(self):
+        """Delete parsed files no longer referenced by any source file"""
+        referenced = {entry['parquet'] for entry in self.manifest.values()}
+        for path in self.directory.glob('*.parquet'):
+            if path.name not in referenced:
+                path.unlink()
+
+class StudyFiles(NamedTuple):
+    files: Dict[str, List[tuple]]    # dataset keyword -> [(study, Excel path)]
+    parquet: Dict[Path, Path]        # Excel path -> parsed Parquet file
+    cache: ParquetCache
+
+    def frame(self, study: str, path: Path) -> pd.DataFrame:
+        df = pd.read_parquet(self.parquet[path])
+        df["Study"] = study
+        return df
+
+    def combined(self, keyword: str) -> Optional[pd.DataFrame]:
+        frames = [self.frame(study, path) for study, path in self.files[keyword] if path in self.parquet]
+        return pd.concat(frames, ignore_index=True) if frames else None
+
+def parse_study_files(
+    source_dir: Path,
+    keywords: List[str],
+    workers: int = INGEST_WORKERS,
+    cache_dir: Optional[Path] = None
+) -> StudyFiles:
+    """Find the study files of the given datasets and make sure each one is parsed"""
+    cache = ParquetCache(Path(cache_dir or CACHE_DIR or source_dir / '.parquet_cache'))
+    files = {keyword: study_files(source_dir, keyword) for keyword in keywords}
+    parquet = cache.ensure([path for found in files.values() for _, path in found], workers)
+    return StudyFiles(files, parquet, cache)
+
+def combine_all(source_dir: Path = SOURCE_DIR, workers: int = INGEST_WORKERS, cache_dir: Optional[Path] = None) -> Dict[str, Path]:
+    """Write the combined Parquet file of every dataset into ``source_dir``"""
+    parsed = parse_study_files(source_dir, list(DATASETS), workers, cache_dir)
+    written = {}
+    for keyword, output_name in DATASETS.items():
+        combined = parsed.combined(keyword)
+        if combined is None:
+            logger.warning(f"No files found for keyword: {keyword}")
+            continue
+        output_path = source_dir / output_name
+        write_parquet(combined, output_path)
+        logger.info(f"Saved combined file: {output_path} ({len(combined)} rows)")
+        written[keyword] = output_path
+    return written
+
+def read_combined(source_dir: Path, keyword: str) -> pd.DataFrame:
+    """A combined dataset, falling back to the notebook's .xlsx output when there is no Parquet file"""
+    path = source_dir / DATASETS[keyword]
+    if path.exists():
+        return pd.read_parquet(path)
+    return pd.read_excel(path.with_suffix('.xlsx'))
+
+def load_inputs(source_dir: Path = SOURCE_DIR) -> Dict[str, pd.DataFrame]:
+    """Read the combined files the integration step needs"""
+    return {name: read_combined(source_dir, keyword) for name, keyword in INPUTS.items()}
+
+# ==================== INTEGRATION ====================
+
+BASE_COLUMNS = ['Study', 'Region', 'Country', 'Site_ID', 'Subject_ID']
+SUBJECT_KEY = ['Study', 'Subject_ID']
+METRIC_COLUMNS = ['missing_pages_count', 'total_open_issues', 'uncoded_meddra_terms',
+                  'uncoded_whodd_terms', 'missing_lab_count']
+SITE_COLUMNS = ['Study', 'Region', 'Country', 'Site_ID']
+ISSUE_COLUMNS = ['Total_Missing_Pages', 'Total_Open_Issues', 'Total_Uncoded_MedDRA',
+                 'Total_Uncoded_WHODD', 'Total_Lab_Issues']
+RISK_LABELS = {4: ['Low', 'Medium', 'High', 'Critical'], 3: ['Low', 'Medium', 'High'], 2: ['Low', 'High'], 1: ['Low']}
+
+# DQI weights per issue family; each count is capped at 10 before weighting
+DQI_WEIGHTS = {'missing_pages': 0.30, 'open_issues': 0.30, 'uncoded_terms': 0.20, 'lab_issues': 0.20}
+DQI_CAP = 10
+
+class PipelineResult(NamedTuple):
+    unified: pd.DataFrame
+    sites: pd.DataFrame
+    high_risk: pd.DataFrame
+
+def patient_base(edc_metrics: pd.DataFrame) -> pd.DataFrame:
+    """One row per subject from the EDC metrics, with standardized key column names"""
+    edc_metrics = edc_metrics.rename(columns={
+        'Project Name': 'Study',
+        'Site ID': 'Site_ID',
+        'Subject ID': 'Subject_ID'
+    })
+    edc_metrics = edc_metrics.loc[:, ~edc_metrics.columns.duplicated()]
+    available = [c for c in BASE_COLUMNS if c in edc_metrics.columns]
+    return edc_metrics[available].drop_duplicates()
+
+class SubjectIndex:
+    """Dense integer codes for (Study, Subject_ID) pairs.
+
+    Study and subject values are factorized separately and combined into one int64
+    key, so resolving a source's rows is two hash lookups on plain indexes rather than
+    a MultiIndex merge. Pairs with a missing part get code -1.
+    """
+
+    def __init__(self, studies, subjects):
+        study_codes, self.studies = pd.factorize(np.asarray(studies, dtype=object))
+        subject_codes, self.subjects = pd.factorize(np.asarray(subjects, dtype=object))
+        self.studies, self.subjects = pd.Index(self.studies), pd.Index(self.subjects)
+        self.row_codes, self.keys = self._factorize(self._combine(study_codes, subject_codes))
+
+    def _combine(self, study_codes: np.ndarray, subject_codes: np.ndarray) -> np.ndarray:
+        combined = study_codes.astype(np.int64) * len(self.subjects) + subject_codes
+        return np.where((study_codes < 0) | (subject_codes < 0), -1, combined)
+
+    @staticmethod
+    def _factorize(combined: np.ndarray) -> tuple:
+        codes, keys = pd.factorize(np.where(combined < 0, np.nan, combined).astype(np.float64))
+        return codes, pd.Index(keys.astype(np.int64))
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def lookup(self, studies, subjects) -> np.ndarray:
+        """Code of every (study, subject) pair, -1 if the pair is unknown"""
+        combined = self._combine(
+            self.studies.get_indexer(np.asarray(studies, dtype=object)),
+            self.subjects.get_indexer(np.asarray(subjects, dtype=object))
+        )
+        codes = self.keys.get_indexer(combined)
+        return np.where(combined < 0, -1, codes)
+
+# Per-subject metric -> (input frame, subject column, site column or None, column summed
+# per subject or None to count rows). Sources the notebook grouped by site only count
+# rows with a site number, as its groupby dropped the rest.
+METRIC_SOURCES = {
+    'missing_pages_count': ('missing_pages', 'SubjectName', 'SiteNumber', None),
+    'total_open_issues': ('edrr', 'Subject', None, 'Total Open issue Count per subject'),
+    'uncoded_meddra_terms': ('meddra', 'Subject', None, None),
+    'uncoded_whodd_terms': ('whodd', 'Subject', None, None),
+    'missing_lab_count': ('missing_lab', 'Subject', 'Site number', None)
+}
+# Coding reports only count terms that still require coding
+CODING_INPUTS = ('meddra', 'whodd')
+
+def metric_rows(metric: str, df: pd.DataFrame) -> tuple:
+    """(studies, subjects, weights) of the source rows that feed one metric; weights None means count"""
+    name, subject_column, site_column, summed = METRIC_SOURCES[metric]
+    if name in CODING_INPUTS:
+        df = df[df['Require Coding'] == 'Yes']
+    if site_column:
+        # A file without the column has no site numbers at all
+        df = df[df[site_column].notna()] if site_column in df.columns else df.iloc[:0]
+    weights = np.nan_to_num(df[summed].to_numpy(dtype=np.float64)) if summed else None
+    return df['Study'].to_numpy(dtype=object), df[subject_column].to_numpy(dtype=object), weights
+
+def subject_metrics(inputs: Dict[str, pd.DataFrame], index: SubjectIndex) -> np.ndarray:
+    """Per-subject issue counts (one row per ``index`` key, columns as METRIC_COLUMNS).
+
+    Each source is resolved against the same subject index and counted with bincount,
+    instead of a groupby and a merge per source. Rows for unknown subjects are
+    ignored, as the notebook's left merges did.
+    """
+    columns = []
+    for metric in METRIC_COLUMNS:
+        studies, subjects, weights = metric_rows(metric, inputs[METRIC_SOURCES[metric][0]])
+        codes = index.lookup(studies, subjects)
+        known = codes >= 0
+        columns.append(np.bincount(codes[known], weights=None if weights is None else weights[known], minlength=len(index)))
+    return np.column_stack(columns).astype(np.int64)
+
+def attach_metrics(base: pd.DataFrame, inputs: Dict[str, pd.DataFrame]) -> pd.DataFrame:
+    """Patient base plus every per-subject metric column, in one pass; absent counts are 0"""
+    index = SubjectIndex(base['Study'], base['Subject_ID'])
+    return with_metrics(base, index, subject_metrics(inputs, index))
+
+def with_metrics(base: pd.DataFrame, index: SubjectIndex, metrics: np.ndarray) -> pd.DataFrame:
+    """Spread per-key metric rows onto the base rows of ``index``"""
+    codes = index.row_codes
+    values = np.where((codes >= 0)[:, None], metrics[np.maximum(codes, 0)], 0)
+    unified = base.reset_index(drop=True)
+    unified[METRIC_COLUMNS] = pd.DataFrame(values, columns=METRIC_COLUMNS)
+    return unified
+
+def clean_status(df: pd.DataFrame) -> np.ndarray:
+    """'Clean' when a subject has no missing pages, open issues or uncoded terms"""
+    clean = ((df['missing_pages_count'].to_numpy() == 0)
+             & (df['total_open_issues'].to_numpy() == 0)
+             & (df['uncoded_meddra_terms'].to_numpy() == 0)
+             & (df['uncoded_whodd_terms'].to_numpy() == 0))
+    return np.where(clean, 'Clean', 'Not Clean').astype(object)
+
+def data_quality_index(df: pd.DataFrame) -> np.ndarray:
+    """DQI 0-100 (100 = no issues): weighted, capped issue counts"""
+    def score(counts) -> np.ndarray:
+        return np.minimum(np.asarray(counts, dtype=np.float64), DQI_CAP) / DQI_CAP
+
+    raw = (score(df['missing_pages_count']) * DQI_WEIGHTS['missing_pages']
+           + score(df['total_open_issues']) * DQI_WEIGHTS['open_issues']
+           + score(df['uncoded_meddra_terms'].to_numpy() + df['uncoded_whodd_terms'].to_numpy()) * DQI_WEIGHTS['uncoded_terms']
+           + score(df['missing_lab_count']) * DQI_WEIGHTS['lab_issues'])
+    return np.round((1 - raw) * 100, 2)
+
+def site_summary(unified: pd.DataFrame) -> pd.DataFrame:
+    """Per-site totals, average DQI and clean patient counts"""
+    group_columns = [c for c in SITE_COLUMNS if c in unified.columns]
+    sites = unified.assign(
+        _clean=unified['Clean_Patient_Status'].to_numpy() == 'Clean'
+    ).groupby(group_columns).agg(
+        Total_Subjects=('Subject_ID', 'count'),
+        Total_Missing_Pages=('missing_pages_count', 'sum'),
+        Total_Open_Issues=('total_open_issues', 'sum'),
+        Total_Uncoded_MedDRA=('uncoded_meddra_terms', 'sum'),
+        Total_Uncoded_WHODD=('uncoded_whodd_terms', 'sum'),
+        Total_Lab_Issues=('missing_lab_count', 'sum'),
+        Avg_DQI=('Data_Quality_Index', 'mean'),
+        Clean_Patients_Count=('_clean', 'sum')
+    ).reset_index()
+    sites['Clean_Patients_Count'] = sites['Clean_Patients_Count'].astype(int)
+    sites['Clean_Patient_Percentage'] = round(sites['Clean_Patients_Count'] / sites['Total_Subjects'] * 100, 2)
+    return sites
+
+def risk_score(sites: pd.DataFrame) -> pd.Series:
+    """Weighted site risk: open issues weigh most, then missing pages, uncoded terms and low DQI"""
+    return (
+        sites['Total_Missing_Pages'] * 0.25 +
+        sites['Total_Open_Issues'] * 0.35 +
+        (sites['Total_Uncoded_MedDRA'] + sites['Total_Uncoded_WHODD']) * 0.20 +
+        (100 - sites['Avg_DQI']) * 0.20
+    )
+
+def risk_bins(quartiles) -> List[float]:
+    """Bin edges from the 25/50/75th percentiles, dropping repeated edges"""
+    bins = [-float('inf')]
+    for q in quartiles:
+        if q > bins[-1]:
+            bins.append(float(q))
+    bins.append(float('inf'))
+    return bins
+
+def risk_level(scores: pd.Series) -> pd.Series:
+    """Percentile-based Low/Medium/High/Critical binning of risk scores"""
+    if scores.empty:
+        return pd.Series([], dtype=object, index=scores.index)
+    quartiles = scores.quantile([0.25, 0.50, 0.75]).to_numpy()
+    bins = risk_bins(quartiles)
+    if scores.max() > scores.min() and len(bins) > 2:
+        return pd.cut(scores, bins=bins, labels=RISK_LABELS[len(bins) - 1])
+    return pd.Series('Low', index=scores.index)
+
+def high_risk_sites(sites: pd.DataFrame, threshold: Optional[float] = None) -> pd.DataFrame:
+    """High/Critical sites plus any above the 75th percentile (or ``threshold``), riskiest first (top 10 if none)"""
+    if threshold is None:
+        threshold = sites['Risk_Score'].quantile(0.75)
+    flagged = sites[
+        sites['Risk_Level'].isin(['High', 'Critical']) |
+        (sites['Risk_Score'] > threshold)
+    ].sort_values('Risk_Score', ascending=False)
+    if len(flagged) == 0:
+        logger.info("No sites meet High/Critical criteria, using the top 10 sites by Risk Score")
+        flagged = sites.nlargest(min(10, len(sites)), 'Risk_Score')
+    return flagged
+
+def integrate(inputs: Dict[str, pd.DataFrame]) -> PipelineResult:
+    """Build unified_df, site_summary and the high-risk site list from the combined inputs"""
+    return summarize(attach_metrics(patient_base(inputs['edc_metrics']), inputs))
+
+def summarize(unified: pd.DataFrame) -> PipelineResult:
+    """Score the patients of a unified table and derive the site summary and high-risk sites"""
+    unified['Clean_Patient_Status'] = clean_status(unified)
+    unified['Data_Quality_Index'] = data_quality_index(unified)
+
+    sites = site_summary(unified)
+    sites['Risk_Score'] = risk_score(sites)
+    sites['Risk_Level'] = risk_level(sites['Risk_Score'])
+    return PipelineResult(unified, sites, high_risk_sites(sites))
+
+def drop_incomplete_rows(unified: pd.DataFrame) -> pd.DataFrame:
+    """Patient rows without any missing or blank values (the notebook's _CLEAN.csv)"""
+    return unified.dropna().replace(r'^\s*$', pd.NA, regex=True).dropna()
+
+# ==================== RISK QUANTILE SKETCH ====================
+# Risk_Level bins are the 25/50/75th percentiles of all site risk scores. The update
+# path keeps those percentiles in per-study sketches that are adjusted as sites change
+# and merged for the programme, instead of sorting every score on each refresh.
+
+RISK_SKETCH_ALPHA = float(os.getenv('PIPELINE_RISK_SKETCH_ALPHA', '0.01'))
+RISK_QUANTILES = (0.25, 0.50, 0.75)
+
+class QuantileSketch:
+    """Mergeable quantile sketch with a relative-error guarantee (DDSketch).
+
+    Values are counted in logarithmic buckets: bucket i holds |x| in (γ^(i-1), γ^i]
+    with γ = (1 + α) / (1 - α), and is reported as 2γ^i / (γ + 1). So the value
+    returned for quantile q is within a factor (1 ± α) of the exact order statistic
+    x_(⌊q(n-1)⌋); exact zeros are kept apart and returned exactly. Adding, removing
+    (negative counts) and merging are all bucket-count additions, so the sketch can
+    follow sites as they change and be combined across studies.
+    """
+
+    def __init__(self, alpha: float = RISK_SKETCH_ALPHA):
+        self.alpha = alpha
+        self.gamma = (1 + alpha) / (1 - alpha)
+        self.log_gamma = np.log(self.gamma)
+        self.positive: Dict[int, int] = {}
+        self.negative: Dict[int, int] = {}
+        self.zero = 0
+
+    def __len__(self) -> int:
+        return self.zero + sum(self.positive.values()) + sum(self.negative.values())
+
+    def add(self, values, counts=1):
+        """Count ``values`` (``counts`` may be negative to remove them); NaN is ignored"""
+        values = np.atleast_1d(np.asarray(values, dtype=np.float64))
+        counts = np.broadcast_to(np.asarray(counts, dtype=np.int64), values.shape)
+        keep = ~np.isnan(values)
+        values, counts = values[keep], counts[keep]
+        zero = values == 0
+        self.zero += int(counts[zero].sum())
+        for store, sign in ((self.positive, values > 0), (self.negative, values < 0)):
+            if not sign.any():
+                continue
+            buckets = np.ceil(np.log(np.abs(values[sign])) / self.log_gamma).astype(np.int64)
+            keys, inverse = np.unique(buckets, return_inverse=True)
+            totals = np.bincount(inverse.ravel(), weights=counts[sign], minlength=len(keys))
+            for key, total in zip(keys.tolist(), totals.astype(np.int64).tolist()):
+                count = store.get(key, 0) + total
+                if count:
+                    store[key] = count
+                else:
+                    store.pop(key, None)
+
+    def merge(self, other: "QuantileSketch") -> "QuantileSketch":
+        if other.alpha != self.alpha:
+            raise ValueError("Only sketches with the same alpha can be merged")
+        for mine, theirs in ((self.positive, other.positive), (self.negative, other.negative)):
+            for key, count in theirs.items():
+                mine[key] = mine.get(key, 0) + count
+        self.zero += other.zero
+        return self
+
+    def _buckets(self) -> List[tuple]:
+        """(representative value, count) of every non-empty bucket in ascending value order"""
+        value = lambda key: 2 * self.gamma ** key / (self.gamma + 1)
+        buckets = [(-value(key), count) for key, count in sorted(self.negative.items(), reverse=True)]
+        if self.zero:
+            buckets.append((0.0, self.zero))
+        buckets += [(value(key), count) for key, count in sorted(self.positive.items())]
+        return buckets
+
+    def quantiles(self, qs) -> List[float]:
+        """Approximate quantiles, one pass over the buckets; NaN when the sketch is empty"""
+        buckets, total = self._buckets(), len(self)
+        if not total:
+            return [float('nan')] * len(qs)
+        results = []
+        for q in qs:
+            rank, seen = int(q * (total - 1)), 0
+            for value, count in buckets:
+                seen += count
+                if seen > rank:
+                    results.append(value)
+                    break
+        return results
+
+    def spread(self) -> bool:
+        """Whether the values fall in more than one bucket (else every site is 'Low')"""
+        return len(self.positive) + len(self.negative) + (1 if self.zero else 0) > 1
+
+    def to_dict(self) -> dict:
+        return {"alpha": self.alpha, "zero": self.zero,
+                "positive": {str(k): v for k, v in self.positive.items()},
+                "negative": {str(k): v for k, v in self.negative.items()}}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "QuantileSketch":
+        sketch = cls(data['alpha'])
+        sketch.zero = data['zero']
+        sketch.positive = {int(k): v for k, v in data['positive'].items()}
+        sketch.negative = {int(k): v for k, v in data['negative'].items()}
+        return sketch
+
+class RiskBinner:
+    """Risk_Level binning from per-study sketches of site Risk_Scores.
+
+    A site's level can differ from the exact binning only when its score lies within
+    a relative α of a bin edge. Assigning a level is a search over at most three
+    edges, so after an update only the changed sites are re-labelled unless the
+    merged edges moved.
+    """
+
+    def __init__(self, sketches: Optional[Dict[str, QuantileSketch]] = None, alpha: float = RISK_SKETCH_ALPHA,
+                 edges: Optional[List[float]] = None):
+        self.alpha = alpha
+        self.sketches = sketches or {}
+        self.edges = edges
+
+    @classmethod
+    def from_sites(cls, sites: pd.DataFrame, alpha: float = RISK_SKETCH_ALPHA) -> "RiskBinner":
+        binner = cls(alpha=alpha)
+        binner.update(sites['Study'], None, sites['Risk_Score'])
+        return binner
+
+    def update(self, studies, old_scores, new_scores):
+        """Replace ``old_scores`` (None when adding) by ``new_scores`` for sites of the given studies"""
+        studies = np.asarray(studies).astype(str)
+        for study in np.unique(studies):
+            rows = studies == study
+            sketch = self.sketches.setdefault(study, QuantileSketch(self.alpha))
+            if old_scores is not None:
+                sketch.add(np.asarray(old_scores, dtype=np.float64)[rows], -1)
+            sketch.add(np.asarray(new_scores, dtype=np.float64)[rows], 1)
+
+    def merged(self) -> QuantileSketch:
+        merged = QuantileSketch(self.alpha)
+        for sketch in self.sketches.values():
+            merged.merge(sketch)
+        return merged
+
+    @staticmethod
+    def bins(merged: QuantileSketch, quartiles: List[float]) -> List[float]:
+        """Bin edges as in ``risk_level``; one bin when every score falls in the same bucket"""
+        if not len(merged) or not merged.spread():
+            return [-float('inf'), float('inf')]
+        return risk_bins(quartiles)
+
+    @staticmethod
+    def levels(scores, bins: List[float]) -> pd.Categorical:
+        """Level of every score for the given edges (right-inclusive, like pd.cut)"""
+        scores = np.asarray(scores, dtype=np.float64)
+        codes = np.searchsorted(np.asarray(bins[1:-1]), scores, side='left')
+        codes[np.isnan(scores)] = -1
+        return pd.Categorical.from_codes(codes, categories=RISK_LABELS[len(bins) - 1], ordered=True)
+
+    def relabel(self, result: PipelineResult, rows: Optional[np.ndarray] = None) -> PipelineResult:
+        """Risk_Level and high-risk sites from the sketched quartiles.
+
+        With ``rows`` (site positions whose score changed) and unchanged edges only
+        those sites get a new level; otherwise every site is re-binned.
+        """
+        sites = result.sites
+        merged = self.merged()
+        quartiles = merged.quantiles(RISK_QUANTILES)
+        bins = self.bins(merged, quartiles)
+        labels = RISK_LABELS[len(bins) - 1]
+        if rows is not None and bins == self.edges and 'Risk_Level' in sites.columns:
+            codes = pd.Categorical(sites['Risk_Level'], categories=labels, ordered=True).codes.copy()
+            codes[rows] = self.levels(sites['Risk_Score'].to_numpy()[rows], bins).codes
+            sites['Risk_Level'] = pd.Categorical.from_codes(codes, categories=labels, ordered=True)
+            logger.info(f"Risk bins unchanged, re-labelled {len(rows)} sites")
+        else:
+            sites['Risk_Level'] = self.levels(sites['Risk_Score'], bins)
+        self.edges = bins
+        return PipelineResult(result.unified, sites, high_risk_sites(sites, quartiles[2]))
+
+    def to_dict(self) -> dict:
+        return {"alpha": self.alpha, "edges": self.edges,
+                "sketches": {study: sketch.to_dict() for study, sketch in self.sketches.items()}}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "RiskBinner":
+        sketches = {study: QuantileSketch.from_dict(d) for study, d in data['sketches'].items()}
+        return cls(sketches, data['alpha'], data['edges'])
+
+# ==================== STREAMING ====================
+# Memory-bounded integration: sources are read straight from the parsed study files in
+# record batches and folded into per-subject running totals, so peak memory follows
+# the number of subjects rather than the number of raw report rows.
+
+STREAM_BATCH_ROWS = int(os.getenv('PIPELINE_BATCH_ROWS', '100000'))
+EDC_COLUMNS = ['Project Name', 'Site ID', 'Subject ID'] + BASE_COLUMNS
+
+def iter_batches(parsed: StudyFiles, keyword: str, columns: List[str], batch_rows: int = STREAM_BATCH_ROWS, fill: bool = True):
+    """DataFrames of at most ``batch_rows`` rows with ``columns`` and Study, file by file.
+
+    Columns a file lacks are added as missing values when ``fill`` is set, as
+    concatenating the files would have done.
+    """
+    for study, path in parsed.files[keyword]:
+        if path not in parsed.parquet:
+            continue
+        source = pq.ParquetFile(parsed.parquet[path])
+        # Keep the file's column order: the EDC base keeps the first of duplicated names
+        names = [name for name in source.schema_arrow.names if name in columns]
+        for batch in source.iter_batches(batch_size=batch_rows, columns=names):
+            df = batch.to_pandas()
+            for name in columns if fill else []:
+                if name not in df.columns and name != 'Study':
+                    df[name] = np.nan
+            df["Study"] = study
+            yield df
+
+def stream_integrate(parsed: StudyFiles, batch_rows: int = STREAM_BATCH_ROWS) -> PipelineResult:
+    """``integrate`` over the parsed study files, one record batch at a time"""
+    parts = [patient_base(df) for df in iter_batches(parsed, EDC_KEYWORD, EDC_COLUMNS, batch_rows, fill=False)]
+    if not parts:
+        raise FileNotFoundError(f"No {EDC_KEYWORD} files found")
+    base = pd.concat(parts, ignore_index=True).drop_duplicates()
+    del parts
+    index = SubjectIndex(base['Study'], base['Subject_ID'])
+    logger.info(f"Patient base: {len(base)} rows, {len(index)} subjects")
+
+    totals = np.zeros((len(index), len(METRIC_COLUMNS)))
+    for j, metric in enumerate(METRIC_COLUMNS):
+        name, subject_column, site_column, summed = METRIC_SOURCES[metric]
+        columns = [subject_column] + [c for c in (site_column, summed) if c] + (['Require Coding'] if name in CODING_INPUTS else [])
+        rows = 0
+        for df in iter_batches(parsed, INPUTS[name], columns, batch_rows):
+            studies, subjects, weights = metric_rows(metric, df)
+            codes = index.lookup(studies, subjects)
+            known = codes >= 0
+            totals[:, j] += np.bincount(codes[known], weights=None if weights is None else weights[known], minlength=len(index))
+            rows += len(df)
+        logger.info(f"Folded {rows} {INPUTS[name]} rows into {metric}")
+    return summarize(with_metrics(base, index, totals.astype(np.int64)))
+
+# ==================== INCREMENTAL UPDATES ====================
+# The pipeline state records what every study file contributed to the per-subject
+# metrics, next to the last unified and site tables. When metric files change, only
+# their subjects and those subjects' sites are recomputed. A change to the EDC metrics
+# (the patient base) still triggers a full build.
+
+STATE_DIR = os.getenv('PIPELINE_STATE_DIR')
+STATE_MANIFEST = 'state.json'
+EDC_KEYWORD = INPUTS['edc_metrics']
+# Dataset keyword -> the per-subject metric its files feed
+KEYWORD_METRICS = {INPUTS[name]: metric for metric, (name, _, _, _) in METRIC_SOURCES.items()}
+CONTRIBUTION_COLUMNS = ['file', 'metric', 'Study', 'Subject_ID', 'value']
+
+def empty_input(name: str) -> pd.DataFrame:
+    """Stand-in for a dataset without any study files"""
+    columns = ['Study']
+    for source, subject_column, site_column, summed in METRIC_SOURCES.values():
+        if source == name:
+            columns += [subject_column] + [c for c in (site_column, summed) if c]
+    if name in CODING_INPUTS:
+        columns.append('Require Coding')
+    return pd.DataFrame(columns=columns)
+
+def file_contributions(file_key: str, metric: str, df: pd.DataFrame) -> pd.DataFrame:
+    """Per-subject amount one study file adds to its metric"""
+    studies, subjects, weights = metric_rows(metric, df)
+    keep = pd.notna(studies) & pd.notna(subjects)
+    values = np.ones(int(keep.sum())) if weights is None else weights[keep]
+    rows = pd.DataFrame({'Study': studies[keep], 'Subject_ID': subjects[keep], 'value': values})
+    totals = rows.groupby(SUBJECT_KEY, sort=False)['value'].sum().reset_index()
+    totals.insert(0, 'metric', metric)
+    totals.insert(0, 'file', file_key)
+    return totals[CONTRIBUTION_COLUMNS]
+
+def state_directory(source_dir: Path, state_dir: Optional[Path] = None) -> Path:
+    return Path(state_dir or STATE_DIR or source_dir / '.pipeline_state')
+
+def file_key(path: Path) -> str:
+    return str(path.resolve())
+
+class PipelineState:
+    """Persisted outputs, per-file metric contributions and the content hash of every study file"""
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self.files: Dict[str, dict] = {}
+        self.result: Optional[PipelineResult] = None
+        self.contributions = pd.DataFrame(columns=CONTRIBUTION_COLUMNS)
+        self.binner: Optional[RiskBinner] = None
+
+    def load(self) -> bool:
+        manifest = self.directory / STATE_MANIFEST
+        if not manifest.exists():
+            return False
+        data = json.loads(manifest.read_text())
+        self.files = data['files']
+        unified = pd.read_parquet(self.directory / 'unified.parquet')
+        sites = pd.read_parquet(self.directory / 'sites.parquet')
+        self.result = PipelineResult(unified, sites, None)
+        if 'risk' in data:
+            self.binner = RiskBinner.from_dict(data['risk'])
+        else:
+            self.binner = RiskBinner.from_sites(sites)
+        self.result = self.binner.relabel(self.result)
+        self.contributions = pd.read_parquet(self.directory / 'contributions.parquet')
+        return True
+
+    def save(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        write_parquet(self.result.unified.copy(), self.directory / 'unified.parquet')
+        write_parquet(self.result.sites.copy(), self.directory / 'sites.parquet')
+        write_parquet(self.contributions.copy(), self.directory / 'contributions.parquet')
+        # The manifest goes last: it only ever describes complete state files
+        tmp_path = self.directory / (STATE_MANIFEST + '.tmp')
+        manifest = {"files": self.files, "risk": self.binner.to_dict()}
+        tmp_path.write_text(json.dumps(manifest, indent=1, sort_keys=True))
+        os.replace(tmp_path, self.directory / STATE_MANIFEST)
+
+def full_build(parsed: StudyFiles) -> tuple:
+    """(result, contributions) computed from every parsed study file"""
+    inputs, contributions = {}, []
+    for name, keyword in INPUTS.items():
+        frames = []
+        for study, path in parsed.files[keyword]:
+            if path not in parsed.parquet:
+                continue
+            df = parsed.frame(study, path)
+            frames.append(df)
+            if keyword in KEYWORD_METRICS:
+                contributions.append(file_contributions(file_key(path), KEYWORD_METRICS[keyword], df))
+        if not frames and name == 'edc_metrics':
+            raise FileNotFoundError(f"No {keyword} files found")
+        inputs[name] = pd.concat(frames, ignore_index=True) if frames else empty_input(name)
+    contributions = pd.concat(contributions, ignore_index=True) if contributions else pd.DataFrame(columns=CONTRIBUTION_COLUMNS)
+    return integrate(inputs), contributions
+
+def apply_changes(
+    result: PipelineResult,
+    old: pd.DataFrame,
+    new: pd.DataFrame,
+    binner: Optional[RiskBinner] = None
+) -> PipelineResult:
+    """Move the outputs from ``old`` to ``new`` contributions, touching only affected subjects and sites.
+
+    With a ``binner`` the risk levels come from its sketches, which follow the
+    recomputed site scores; otherwise every site is re-binned exactly.
+    """
+    parts = [frame for frame in (new, old.assign(value=-old['value'])) if len(frame)]
+    if not parts:
+        return result
+    delta = pd.concat(parts, ignore_index=True)
+    delta = delta.groupby(SUBJECT_KEY + ['metric'], sort=False)['value'].sum()
+    delta = delta[delta != 0].unstack('metric', fill_value=0).reindex(columns=METRIC_COLUMNS, fill_value=0)
+    if delta.empty:
+        return result
+    # Whole columns are replaced below, so the patient table can share its data
+    unified, sites = result.unified.copy(deep=False), result.sites.copy()
+
+    # Unified rows of the changed subjects (a subject may have several base rows),
+    # searched only among the rows of the studies involved
+    studies = delta.index.get_level_values(0)
+    candidates = np.flatnonzero(unified['Study'].isin(studies.unique()).to_numpy())
+    index = SubjectIndex(unified['Study'].to_numpy()[candidates], unified['Subject_ID'].to_numpy()[candidates])
+    codes = index.lookup(studies, delta.index.get_level_values(1))
+    delta_of_key = np.full(len(index) + 1, -1)
+    delta_of_key[codes[codes >= 0]] = np.flatnonzero(codes >= 0)
+    delta_of_candidate = delta_of_key[np.where(index.row_codes >= 0, index.row_codes, len(index))]
+    affected = delta_of_candidate >= 0
+    rows, delta_of_row = candidates[affected], delta_of_candidate[affected]
+    logger.info(f"{len(delta)} subjects changed, {len(rows)} patient rows affected")
+    if not len(rows):
+        return result
+
+    metrics = unified[METRIC_COLUMNS].to_numpy()
+    metrics[rows] = (metrics[rows] + delta.to_numpy()[delta_of_row]).astype(np.int64)
+    unified[METRIC_COLUMNS] = metrics
+    changed = unified.iloc[rows]
+    status = unified['Clean_Patient_Status'].to_numpy().copy()
+    dqi = unified['Data_Quality_Index'].to_numpy().copy()
+    status[rows] = clean_status(changed)
+    dqi[rows] = data_quality_index(changed)
+    unified['Clean_Patient_Status'] = status
+    unified['Data_Quality_Index'] = dqi
+
+    # Every row of a touched Site_ID is re-aggregated, so the recomputed site rows are exact
+    group_columns = [c for c in SITE_COLUMNS if c in unified.columns]
+    site_ids = changed['Site_ID'].unique()
+    touched = unified[unified['Site_ID'].isin(site_ids)]
+    fresh = site_summary(touched)
+    fresh['Risk_Score'] = risk_score(fresh)
+    site_rows = np.flatnonzero(sites['Site_ID'].isin(site_ids).to_numpy())
+    positions = site_rows[
+        pd.MultiIndex.from_frame(sites.iloc[site_rows][group_columns]).get_indexer(pd.MultiIndex.from_frame(fresh[group_columns]))
+    ]
+    value_columns = [c for c in fresh.columns if c not in group_columns]
+    old_scores = sites['Risk_Score'].to_numpy()[positions]
+    sites.iloc[positions, [sites.columns.get_loc(c) for c in value_columns]] = fresh[value_columns].to_numpy()
+    sites[value_columns] = sites[value_columns].astype(fresh[value_columns].dtypes.to_dict())
+    logger.info(f"{len(fresh)} sites recomputed")
+
+    if binner is not None:
+        binner.update(fresh['Study'], old_scores, fresh['Risk_Score'])
+        return binner.relabel(PipelineResult(unified, sites, result.high_risk), positions)
+    # Quartile bins depend on every site's score
+    sites['Risk_Level'] = risk_level(sites['Risk_Score'])
+    return PipelineResult(unified, sites, high_risk_sites(sites))
+
+def update(
+    source_dir: Path = SOURCE_DIR,
+    state_dir: Optional[Path] = None,
+    workers: int = INGEST_WORKERS,
+    cache_dir: Optional[Path] = None
+) -> PipelineResult:
+    """Bring the persisted outputs up to date with the study files, incrementally where possible"""
+    started = time.perf_counter()
+    parsed = parse_study_files(source_dir, list(INPUTS.values()), workers, cache_dir)
+    current, paths = {}, {}
+    for keyword, found in parsed.files.items():
+        for study, path in found:
+            if path in parsed.parquet:
+                key = file_key(path)
+                current[key] = {"hash": parsed.cache.manifest[key]['hash'], "keyword": keyword, "study": study}
+                paths[key] = path
+
+    state = PipelineState(state_directory(source_dir, state_dir))
+    if state.load():
+        changed = sorted(k for k in set(current) | set(state.files) if current.get(k) != state.files.get(k))
+    else:
+        changed = None
+    if changed == []:
+        logger.info("No study files changed")
+        return state.result
+
+    if changed is None:
+        logger.info("No pipeline state yet, running a full build")
+    elif any((current.get(k) or state.files[k])['keyword'] == EDC_KEYWORD for k in changed):
+        logger.info("Patient base (EDC metrics) changed, running a full build")
+        changed = None
+    if changed is None:
+        state.result, state.contributions = full_build(parsed)
+        state.binner = RiskBinner.from_sites(state.result.sites)
+        state.result = state.binner.relabel(state.result)
+    else:
+        logger.info(f"{len(changed)} study files changed, updating incrementally")
+        new = [
+            file_contributions(key, KEYWORD_METRICS[current[key]['keyword']], parsed.frame(current[key]['study'], paths[key]))
+            for key in changed if key in current
+        ]
+        new = [frame for frame in new if len(frame)]
+        new = pd.concat(new, ignore_index=True) if new else pd.DataFrame(columns=CONTRIBUTION_COLUMNS)
+        is_changed = state.contributions['file'].isin(changed)
+        state.result = apply_changes(state.result, state.contributions[is_changed], new, state.binner)
+        kept = state.contributions[~is_changed]
+        state.contributions = pd.concat([kept, new], ignore_index=True) if len(new) else kept.reset_index(drop=True)
+    state.files = current
+    state.save()
+    logger.info(f"Pipeline state updated in {time.perf_counter() - started:.2f}s")
+    return state.result
+
+# ==================== OUTPUTS ====================
+
+OUTPUT_FILES = {
+    'unified': "Output_Patient_Level_Unified.xlsx",
+    'sites': "Output_Site_Level_Summary.xlsx",
+    'high_risk': "Output_High_Risk_Sites.xlsx"
+}
+CLEAN_PATIENT_FILE = "Output_Patient_Level_Unified_CLEAN.csv"
+
+def write_outputs(result: PipelineResult, output_dir: Path = OUTPUT_DIR) -> List[Path]:
+    output_dir.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for name, file_name in OUTPUT_FILES.items():
+        path = output_dir / file_name
+        getattr(result, name).to_excel(path, index=False)
+        paths.append(path)
+    clean_path = output_dir / CLEAN_PATIENT_FILE
+    drop_incomplete_rows(result.unified).to_csv(clean_path, index=False)
+    paths.append(clean_path)
+    for path in paths:
+        logger.info(f"Wrote {path}")
+    return paths
+
+def log_summary(result: PipelineResult):
+    unified, sites = result.unified, result.sites
+    clean = int((unified['Clean_Patient_Status'] == 'Clean').sum())
+    logger.info(f"Total Patients Analyzed: {len(unified)}")
+    logger.info(f"Clean Patients: {clean} ({round(clean / max(len(unified), 1) * 100, 2)}%)")
+    logger.info(f"Total Sites: {len(sites)}")
+    logger.info(f"High/Critical Risk Sites: {int(sites['Risk_Level'].isin(['High', 'Critical']).sum())}")
+    logger.info(f"Sites in High-Risk Report: {len(result.high_risk)}")
+    logger.info(f"Average Data Quality Index: {round(unified['Data_Quality_Index'].mean(), 2)}")
+    logger.info(f"Total Open Issues: {int(unified['total_open_issues'].sum())}")
+    logger.info(f"Total Missing Pages: {int(unified['missing_pages_count'].sum())}")
+    logger.info(f"Risk level distribution: {sites['Risk_Level'].value_counts().sort_index().to_dict()}")
+
+# ==================== PUBLISHING ====================
+# Pushes the outputs to the tables the backend serves. Each table is diffed by content
+# hash against what was last published to the same target, only new or changed rows
+# are upserted (in batches, a few at a time), removed rows are deleted, and a new
+# snapshot version is recorded that the backend watches to refresh its cache.
+
+PUBLISH_TABLES = {'unified': 'Patient Data', 'sites': 'Sites Data', 'high_risk': 'High Risk Sites'}
+# Unique key of each published table; the target tables need a unique constraint on them
+PUBLISH_KEYS = {'unified': BASE_COLUMNS, 'sites': SITE_COLUMNS, 'high_risk': SITE_COLUMNS}
+PUBLISH_TARGET = os.getenv('PIPELINE_PUBLISH_TARGET', 'supabase')
+PUBLISH_VERSION_TABLE = os.getenv('PIPELINE_VERSION_TABLE', 'Pipeline Versions')
+PUBLISH_BATCH_ROWS = int(os.getenv('PIPELINE_PUBLISH_BATCH_ROWS', '5000'))
+PUBLISH_CONCURRENCY = int(os.getenv('PIPELINE_PUBLISH_CONCURRENCY', '4'))
+PUBLISH_RETRIES = int(os.getenv('PIPELINE_PUBLISH_RETRIES', '3'))
+# Stamped on every upserted row, so the backend's incremental sync only fetches those
+SYNC_COLUMN = os.getenv('SUPABASE_SYNC_COLUMN', 'updated_at')
+
+class SupabaseTarget:
+    """Publishes to the Supabase tables read by the backend"""
+
+    def __init__(self, url: Optional[str] = None, key: Optional[str] = None):
+        from supabase import create_client
+
+        url, key = url or os.getenv('SUPABASE_URL', ''), key or os.getenv('SUPABASE_KEY', '')
+        if not url or not key:
+            raise ValueError("SUPABASE_URL and SUPABASE_KEY must be set to publish to Supabase")
+        self.client = create_client(url, key)
+        self.name = 'supabase-' + hashlib.blake2b(url.encode('utf-8'), digest_size=6).hexdigest()
+
+    def upsert(self, table: str, keys: List[str], rows: List[dict]):
+        self.client.table(table).upsert(rows, on_conflict=','.join(keys)).execute()
+
+    def delete(self, table: str, keys: List[str], rows: List[dict]):
+        # One request per combination of the leading key columns, matching the last one with IN
+        groups: Dict[tuple, list] = {}
+        for row in rows:
+            groups.setdefault(tuple(row[k] for k in keys[:-1]), []).append(row[keys[-1]])
+        for prefix, values in groups.items():
+            query = self.client.table(table).delete()
+            for name, value in zip(keys, prefix):
+                query = query.eq(name, value)
+            query.in_(keys[-1], values).execute()
+
+    def latest_version(self) -> int:
+        response = self.client.table(PUBLISH_VERSION_TABLE).select('version').order('version', desc=True).limit(1).execute()
+        return response.data[0]['version'] if response.data else 0
+
+    def record_version(self, record: dict):
+        self.client.table(PUBLISH_VERSION_TABLE).insert(record).execute()
+
+class SQLiteTarget:
+    """Local stand-in for the serving store: one SQLite table per published table, rows kept as JSON"""
+
+    def __init__(self, path: Path):
+        import sqlite3
+        import threading
+
+        self.path = Path(path)
+        self.name = 'sqlite-' + hashlib.blake2b(str(self.path.resolve()).encode('utf-8'), digest_size=6).hexdigest()
+        self.connection = sqlite3.connect(str(self.path), check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock, self.connection:
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS "{}" (version INTEGER PRIMARY KEY, published_at TEXT, tables TEXT)'.format(PUBLISH_VERSION_TABLE)
+            )
+
+    def _table(self, table: str) -> str:
+        self.connection.execute(f'CREATE TABLE IF NOT EXISTS "{table}" (key TEXT PRIMARY KEY, row TEXT NOT NULL)')
+        return f'"{table}"'
+
+    def upsert(self, table: str, keys: List[str], rows: List[dict]):
+        values = [(json.dumps([row[k] for k in keys]), json.dumps(row)) for row in rows]
+        with self.lock, self.connection:
+            self.connection.executemany(
+                f'INSERT INTO {self._table(table)} (key, row) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET row = excluded.row', values
+            )
+
+    def delete(self, table: str, keys: List[str], rows: List[dict]):
+        with self.lock, self.connection:
+            self.connection.executemany(
+                f'DELETE FROM {self._table(table)} WHERE key = ?', [(json.dumps([row[k] for k in keys]),) for row in rows]
+            )
+
+    def rows(self, table: str) -> List[dict]:
+        with self.lock, self.connection:
+            return [json.loads(row) for row, in self.connection.execute(f'SELECT row FROM {self._table(table)}')]
+
+    def latest_version(self) -> int:
+        with self.lock:
+            row = self.connection.execute(f'SELECT MAX(version) FROM "{PUBLISH_VERSION_TABLE}"').fetchone()
+        return row[0] or 0
+
+    def record_version(self, record: dict):
+        with self.lock, self.connection:
+            self.connection.execute(
+                f'INSERT INTO "{PUBLISH_VERSION_TABLE}" (version, published_at, tables) VALUES (?, ?, ?)',
+                (record['version'], record['published_at'], json.dumps(record['tables']))
+            )
+
+def publish_target(spec: str = PUBLISH_TARGET):
+    """'supabase' or 'sqlite:PATH'"""
+    if spec == 'supabase':
+        return SupabaseTarget()
+    if spec.startswith('sqlite:'):
+        return SQLiteTarget(Path(spec[len('sqlite:'):]))
+    raise ValueError(f"Unknown publish target: {spec}")
+
+def publish_frame(name: str, result: PipelineResult) -> pd.DataFrame:
+    """The rows published for one output (the patient table without incomplete rows, as in the CSV export)"""
+    df = drop_incomplete_rows(result.unified) if name == 'unified' else getattr(result, name)
+    return df.drop(columns=[SYNC_COLUMN], errors='ignore').reset_index(drop=True)
+
+def row_hashes(df: pd.DataFrame, columns: Optional[List[str]] = None) -> np.ndarray:
+    return pd.util.hash_pandas_object(df[columns] if columns else df, index=False).to_numpy()
+
+def to_records(df: pd.DataFrame) -> List[dict]:
+    """JSON-ready records with missing values as None"""
+    return df.astype(object).where(df.notna(), None).to_dict('records')
+
+def publish_diff(df: pd.DataFrame, keys: List[str], previous: Optional[pd.DataFrame]) -> tuple:
+    """(published state, positions of rows to upsert, key rows to delete) against the last published state"""
+    state = df[keys].copy()
+    state['_key'] = row_hashes(df, keys)
+    state['_row'] = row_hashes(df)
+    duplicated = state['_key'].duplicated(keep='last').to_numpy()
+    if duplicated.any():
+        logger.warning(f"{int(duplicated.sum())} rows repeat a key, publishing the last of each")
+        state = state[~duplicated]
+    if previous is None or previous.empty:
+        return state, state.index.to_numpy(), previous.iloc[:0] if previous is not None else state.iloc[:0]
+    old = pd.Index(previous['_key'])
+    found = old.get_indexer(state['_key'])
+    old_rows = previous['_row'].to_numpy()
+    changed = (found < 0) | (old_rows[np.maximum(found, 0)] != state['_row'].to_numpy())
+    removed = previous[~previous['_key'].isin(state['_key'])]
+    return state, state.index.to_numpy()[changed], removed[keys]
+
+def run_batches(action, table: str, keys: List[str], rows: List[dict], batch_rows: int, concurrency: int):
+    """Apply ``action`` to the rows in batches, ``concurrency`` at a time, retrying failed batches with backoff"""
+    def attempt(batch: List[dict]):
+        for retry in range(PUBLISH_RETRIES + 1):
+            try:
+                return action(table, keys, batch)
+            except Exception as e:
+                if retry == PUBLISH_RETRIES:
+                    raise
+                logger.warning(f"Batch of {len(batch)} rows for {table} failed ({e}), retrying")
+                time.sleep(2 ** retry)
+
+    batches = [rows[i:i + batch_rows] for i in range(0, len(rows), batch_rows)]
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        # list() re-raises the first batch that still failed after its retries
+        list(pool.map(attempt, batches))
+
+def publish(
+    result: PipelineResult,
+    target,
+    state_dir: Path,
+    batch_rows: int = PUBLISH_BATCH_ROWS,
+    concurrency: int = PUBLISH_CONCURRENCY
+) -> Optional[dict]:
+    """Upsert the changed rows of every output into ``target`` and record a new version.
+
+    The hashes of what was published are kept in ``state_dir`` and only replaced once
+    the target accepted every batch, so a failed publish is retried in full next time.
+    Returns the version record, or None when nothing changed.
+    """
+    started = time.perf_counter()
+    directory = state_dir / 'published' / target.name
+    published_at = datetime.now(timezone.utc).isoformat()
+    states, tables = {}, {}
+    for name, table in PUBLISH_TABLES.items():
+        df = publish_frame(name, result)
+        keys = [k for k in PUBLISH_KEYS[name] if k in df.columns]
+        previous_path = directory / f"{name}.parquet"
+        previous = pd.read_parquet(previous_path) if previous_path.exists() else None
+        states[name], changed, removed = publish_diff(df, keys, previous)
+        upserts = to_records(df.iloc[changed])
+        for row in upserts:
+            row[SYNC_COLUMN] = published_at
+        run_batches(target.upsert, table, keys, upserts, batch_rows, concurrency)
+        run_batches(target.delete, table, keys, to_records(removed), batch_rows, concurrency)
+        tables[table] = {"rows": len(states[name]), "upserted": len(upserts), "deleted": len(removed)}
+        logger.info(f"Published {table}: {len(upserts)} rows upserted, {len(removed)} deleted, {len(states[name])} total")
+
+    record = None
+    if any(t['upserted'] or t['deleted'] for t in tables.values()):
+        record = {"version": target.latest_version() + 1, "published_at": published_at, "tables": tables}
+        target.record_version(record)
+        logger.info(f"Published snapshot version {record['version']} in {time.perf_counter() - started:.2f}s")
+    else:
+        logger.info("Published outputs are up to date")
+    directory.mkdir(parents=True, exist_ok=True)
+    for name, state in states.items():
+        write_parquet(state, directory / f"{name}.parquet")
+    return record
+
+# ==================== BENCHMARK ====================
+
+def synthetic_inputs(subjects: int, sites: int = 0, seed: int = 0) -> Dict[str, pd.DataFrame]:
+    """Combined input frames with the raw column names for a synthetic study of ``subjects`` subjects"""
+    rng = np.random.default_rng(seed)
+    sites = sites or max(1, subjects // 5)
+    site_of = rng.integers(0, sites, subjects)
+    study_of_site = rng.integers(1, 26, sites)
+    region_of_site = rng.choice(np.array(['AMER', 'EMEA', 'APAC'], dtype=object), sites)
+    country_of_site = rng.choice(np.array(['USA', 'CAN', 'DEU', 'FRA', 'GBR', 'JPN', 'IND', 'AUS'], dtype=object), sites)
+
+    study = np.char.add('Study ', study_of_site[site_of].astype(str)).astype(object)
+    site_id = np.char.add('Site ', site_of.astype(str)).astype(object)
+    subject_id = np.char.add('Subject ', np.arange(subjects).astype(str)).astype(object)
+    edc_metrics = pd.DataFrame({
+        'Project Name': study,
+        'Region': region_of_site[site_of],
+        'Country': country_of_site[site_of],
+        'Site ID': site_id,
+        'Subject ID': subject_id,
+        'Subject Status (Source: PRIMARY Form)': 'Enrolled'
+    })
+
+    def issue_rows(rate: float, max_per_subject: int) -> np.ndarray:
+        """Subject positions repeated once per issue row, for a fraction ``rate`` of subjects"""
+        affected = np.flatnonzero(rng.random(subjects) < rate)
+        return np.repeat(affected, rng.integers(1, max_per_subject + 1, len(affected)))
+
+    def site_numbers(rows: np.ndarray) -> np.ndarray:
+        """Site of each issue row, with some left blank as in the raw reports"""
+        values = site_id[rows].copy()
+        values[rng.random(len(rows)) < 0.05] = None
+        return values
+
+    pages = issue_rows(0.08, 4)
+    edrr_rows = np.flatnonzero(rng.random(subjects) < 0.10)
+    meddra_rows = issue_rows(0.05, 3)
+    whodd_rows = issue_rows(0.06, 3)
+    lab_rows = issue_rows(0.12, 3)
+    page_sites, lab_sites = site_numbers(pages), site_numbers(lab_rows)
+    return {
+        'edc_metrics': edc_metrics,
+        'missing_pages': pd.DataFrame({'Study': study[pages], 'SiteNumber': page_sites, 'SubjectName': subject_id[pages]}),
+        'edrr': pd.DataFrame({
+            'Study': study[edrr_rows],
+            'Subject': subject_id[edrr_rows],
+            'Total Open issue Count per subject': rng.integers(0, 6, len(edrr_rows))
+        }),
+        'meddra': pd.DataFrame({
+            'Study': study[meddra_rows],
+            'Subject': subject_id[meddra_rows],
+            'Require Coding': rng.choice(np.array(['Yes', 'No'], dtype=object), len(meddra_rows))
+        }),
+        'whodd': pd.DataFrame({
+            'Study': study[whodd_rows],
+            'Subject': subject_id[whodd_rows],
+            'Require Coding': rng.choice(np.array(['Yes', 'No'], dtype=object), len(whodd_rows))
+        }),
+        'missing_lab': pd.DataFrame({'Study': study[lab_rows], 'Subject': subject_id[lab_rows], 'Site number': lab_sites})
+    }
+
+def notebook_integrate(inputs: Dict[str, pd.DataFrame]) -> PipelineResult:
+    """The notebook's original integration: five separate merges and row-wise apply (benchmark baseline)"""
+    base = patient_base(inputs['edc_metrics'])
+    missing_pages, edrr, meddra, whodd, missing_lab = (
+        inputs['missing_pages'], inputs['edrr'], inputs['meddra'], inputs['whodd'], inputs['missing_lab']
+    )
+    missing_pages_count = missing_pages.groupby(['Study', 'SiteNumber', 'SubjectName']).size().reset_index(name='missing_pages_count')
+    missing_pages_count.columns = ['Study', 'Site_ID', 'Subject_ID', 'missing_pages_count']
+    open_issues = edrr.groupby(['Study', 'Subject']).agg({'Total Open issue Count per subject': 'sum'}).reset_index()
+    open_issues.columns = ['Study', 'Subject_ID', 'total_open_issues']
+    uncoded_meddra = meddra[meddra['Require Coding'] == 'Yes'].groupby(['Study', 'Subject']).size().reset_index(name='uncoded_meddra_terms')
+    uncoded_meddra.columns = ['Study', 'Subject_ID', 'uncoded_meddra_terms']
+    uncoded_whodd = whodd[whodd['Require Coding'] == 'Yes'].groupby(['Study', 'Subject']).size().reset_index(name='uncoded_whodd_terms')
+    uncoded_whodd.columns = ['Study', 'Subject_ID', 'uncoded_whodd_terms']
+    lab_issues = missing_lab.groupby(['Study', 'Subject', 'Site number']).size().reset_index(name='missing_lab_count')
+    lab_issues.columns = ['Study', 'Subject_ID', 'Site_ID', 'missing_lab_count']
+
+    unified = base.copy()
+    unified = unified.merge(missing_pages_count.groupby(SUBJECT_KEY)['missing_pages_count'].sum().reset_index(), on=SUBJECT_KEY, how='left')
+    unified = unified.merge(open_issues, on=SUBJECT_KEY, how='left')
+    unified = unified.merge(uncoded_meddra, on=SUBJECT_KEY, how='left')
+    unified = unified.merge(uncoded_whodd, on=SUBJECT_KEY, how='left')
+    unified = unified.merge(lab_issues.groupby(SUBJECT_KEY)['missing_lab_count'].sum().reset_index(), on=SUBJECT_KEY, how='left')
+    for col in METRIC_COLUMNS:
+        unified[col] = unified[col].fillna(0).astype(int)
+
+    def calculate_clean_status(row):
+        if (row['missing_pages_count'] == 0 and row['total_open_issues'] == 0 and
+                row['uncoded_meddra_terms'] == 0 and row['uncoded_whodd_terms'] == 0):
+            return 'Clean'
+        return 'Not Clean'
+
+    def calculate_dqi(row):
+        missing_score = min(row['missing_pages_count'], 10) / 10
+        issues_score = min(row['total_open_issues'], 10) / 10
+        uncoded_score = min(row['uncoded_meddra_terms'] + row['uncoded_whodd_terms'], 10) / 10
+        lab_score = min(row['missing_lab_count'], 10) / 10
+        raw_score = (missing_score * DQI_WEIGHTS['missing_pages'] + issues_score * DQI_WEIGHTS['open_issues'] +
+                     uncoded_score * DQI_WEIGHTS['uncoded_terms'] + lab_score * DQI_WEIGHTS['lab_issues'])
+        return round((1 - raw_score) * 100, 2)
+
+    unified['Clean_Patient_Status'] = unified.apply(calculate_clean_status, axis=1)
+    unified['Data_Quality_Index'] = unified.apply(calculate_dqi, axis=1)
+
+    group_columns = [c for c in SITE_COLUMNS if c in unified.columns]
+    sites = unified.groupby(group_columns).agg({
+        'Subject_ID': 'count',
+        'missing_pages_count': 'sum',
+        'total_open_issues': 'sum',
+        'uncoded_meddra_terms': 'sum',
+        'uncoded_whodd_terms': 'sum',
+        'missing_lab_count': 'sum',
+        'Data_Quality_Index': 'mean',
+        'Clean_Patient_Status': lambda x: (x == 'Clean').sum()
+    }).reset_index()
+    sites.columns = group_columns + ['Total_Subjects'] + ISSUE_COLUMNS + ['Avg_DQI', 'Clean_Patients_Count']
+    sites['Clean_Patient_Percentage'] = round(sites['Clean_Patients_Count'] / sites['Total_Subjects'] * 100, 2)
+    sites['Risk_Score'] = risk_score(sites)
+    sites['Risk_Level'] = risk_level(sites['Risk_Score'])
+    return PipelineResult(unified, sites, high_risk_sites(sites))
+
+def assert_same_outputs(expected: PipelineResult, actual: PipelineResult):
+    """Raise if two pipeline results differ in content (dtypes of count columns may differ)"""
+    for name in PipelineResult._fields:
+        pd.testing.assert_frame_equal(
+            getattr(expected, name).reset_index(drop=True), getattr(actual, name).reset_index(drop=True),
+            check_dtype=False, check_categorical=False
+        )
+
+def benchmark(subjects: int = 1_000_000, seed: int = 0, check: bool = True) -> Dict[str, float]:
+    """Time the notebook's integration against ``integrate`` on a synthetic study"""
+    started = time.perf_counter()
+    inputs = synthetic_inputs(subjects, seed=seed)
+    logger.info(f"Generated {subjects} synthetic subjects in {time.perf_counter() - started:.2f}s")
+
+    started = time.perf_counter()
+    vectorized = integrate(inputs)
+    vectorized_seconds = time.perf_counter() - started
+    logger.info(f"Vectorized pipeline: {vectorized_seconds:.2f}s")
+
+    started = time.perf_counter()
+    reference = notebook_integrate(inputs)
+    notebook_seconds = time.perf_counter() - started
+    logger.info(f"Notebook pipeline:   {notebook_seconds:.2f}s")
+
+    if check:
+        assert_same_outputs(reference, vectorized)
+        logger.info("Outputs are identical")
+    speedup = notebook_seconds / vectorized_seconds if vectorized_seconds else float('inf')
+    logger.info(f"Speed-up: {speedup:.1f}x on {subjects} subjects, {len(vectorized.sites)} sites")
+
+    # Sketched binning (used by `update`) against the exact quartiles
+    sites = vectorized.sites
+    exact = sites['Risk_Score'].quantile(list(RISK_QUANTILES)).to_numpy()
+    binner = RiskBinner.from_sites(sites)
+    sketched = np.array(binner.merged().quantiles(RISK_QUANTILES))
+    quartile_error = float(np.max(np.abs(sketched - exact) / np.maximum(np.abs(exact), 1e-12)))
+    levels = binner.levels(sites['Risk_Score'], binner.bins(binner.merged(), list(sketched)))
+    agreement = float(np.mean(levels.astype(str) == sites['Risk_Level'].astype(str).to_numpy()))
+    logger.info(f"Risk sketch (alpha={binner.alpha}): max quartile error {quartile_error:.4%}, "
+                f"{agreement:.2%} of sites get the exact Risk_Level")
+    return {"subjects": subjects, "notebook_seconds": notebook_seconds, "vectorized_seconds": vectorized_seconds,
+            "speedup": speedup, "risk_quartile_error": quartile_error, "risk_level_agreement": agreement}
+
+# ==================== CLI ====================
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Clinical data preprocessing pipeline")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    combine = commands.add_parser('combine', help="Combine each dataset across the study folders")
+    combine.add_argument('--source', type=Path, default=SOURCE_DIR, help="Folder holding one sub-folder per study")
+    combine.add_argument('--workers', type=int, default=INGEST_WORKERS, help="Excel parsing processes")
+    combine.add_argument('--cache-dir', type=Path, default=None, help="Parsed-file cache (default: SOURCE/.parquet_cache)")
+
+    run = commands.add_parser('run', help="Build the patient, site and high-risk outputs from the combined files")
+    run.add_argument('--source', type=Path, default=SOURCE_DIR, help="Folder holding the Combined_* files")
+    run.add_argument('--output', type=Path, default=OUTPUT_DIR)
+    run.add_argument('--stream', action='store_true',
+                     help="Read the study files in record batches with bounded memory instead of the combined files")
+    run.add_argument('--batch-rows', type=int, default=STREAM_BATCH_ROWS)
+    run.add_argument('--workers', type=int, default=INGEST_WORKERS, help="Excel parsing processes (with --stream)")
+
+    incremental = commands.add_parser('update', help="Update the persisted outputs, recomputing only what changed")
+    incremental.add_argument('--source', type=Path, default=SOURCE_DIR, help="Folder holding one sub-folder per study")
+    incremental.add_argument('--state-dir', type=Path, default=None, help="Pipeline state (default: SOURCE/.pipeline_state)")
+    incremental.add_argument('--output', type=Path, default=None, help="Also write the output files here")
+    incremental.add_argument('--workers', type=int, default=INGEST_WORKERS, help="Excel parsing processes")
+    incremental.add_argument('--cache-dir', type=Path, default=None, help="Parsed-file cache (default: SOURCE/.parquet_cache)")
+
+    publisher = commands.add_parser('publish', help="Update the outputs and upsert the changed rows into the serving tables")
+    publisher.add_argument('--source', type=Path, default=SOURCE_DIR, help="Folder holding one sub-folder per study")
+    publisher.add_argument('--state-dir', type=Path, default=None, help="Pipeline state (default: SOURCE/.pipeline_state)")
+    publisher.add_argument('--target', default=PUBLISH_TARGET, help="'supabase' or 'sqlite:PATH'")
+    publisher.add_argument('--batch-rows', type=int, default=PUBLISH_BATCH_ROWS, help="Rows per upsert request")
+    publisher.add_argument('--concurrency', type=int, default=PUBLISH_CONCURRENCY, help="Upsert requests in flight")
+    publisher.add_argument('--workers', type=int, default=INGEST_WORKERS, help="Excel parsing processes")
+    publisher.add_argument('--cache-dir', type=Path, default=None, help="Parsed-file cache (default: SOURCE/.parquet_cache)")
+
+    bench = commands.add_parser('benchmark', help="Compare against the notebook's row-wise approach on synthetic data")
+    bench.add_argument('--subjects', type=int, default=1_000_000)
+    bench.add_argument('--seed', type=int, default=0)
+    bench.add_argument('--no-check', action='store_true', help="Skip comparing the two outputs")
+
+    args = parser.parse_args(argv)
+    if args.command == 'combine':
+        combine_all(args.source, args.workers, args.cache_dir)
+    elif args.command == 'run':
+        if args.stream:
+            parsed = parse_study_files(args.source, list(INPUTS.values()), args.workers)
+            result = stream_integrate(parsed, args.batch_rows)
+        else:
+            result = integrate(load_inputs(args.source))
+        log_summary(result)
+        write_outputs(result, args.output)
+    elif args.command == 'update':
+        result = update(args.source, args.state_dir, args.workers, args.cache_dir)
+        log_summary(result)
+        if args.output:
+            write_outputs(result, args.output)
+    elif args.command == 'publish':
+        result = update(args.source, args.state_dir, args.workers, args.cache_dir)
+        publish(result, publish_target(args.target), state_directory(args.source, args.state_dir), args.batch_rows, args.concurrency)
+    elif args.command == 'benchmark':
+        benchmark(args.subjects, args.seed, check=not args.no_check)
+
+if __name__ == "__main__":
+    main()
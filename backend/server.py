@@ -1,5 +1,6 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Query, Request, Response, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.responses import StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
@@ -7,15 +8,39 @@ import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict, EmailStr
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Set
 import uuid
+import random
+import base64
+import re
+import json
 from datetime import datetime, timezone, timedelta
 import bcrypt
 import jwt
 from supabase import create_client, Client
+from supabase.lib.client_options import SyncClientOptions
+from postgrest import CountMethod
+import httpx
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from openai import AsyncOpenAI
 import boto3
 from botocore.exceptions import ClientError
+import numpy as np
+import gzip
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+import hashlib
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
 # Logging Configuration
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -34,7 +59,8 @@ client = AsyncIOMotorClient(
     connectTimeoutMS=10000,  # Connection timeout
     serverSelectionTimeoutMS=10000,  # Server selection timeout
     retryWrites=True,
-    w='majority'
+    w='majority',
+    tz_aware=True  # Dates come back as UTC-aware datetimes, matching what the models write
 )
 db = client[os.environ['DB_NAME']]
 
@@ -42,35 +68,228 @@ db = client[os.environ['DB_NAME']]
 supabase_url = os.getenv('SUPABASE_URL', '')
 supabase_key = os.getenv('SUPABASE_KEY', '')
 
+# Paginated loader settings: rows per request and how many requests run at once
+SUPABASE_PAGE_SIZE = int(os.getenv('SUPABASE_PAGE_SIZE', '1000'))
+SUPABASE_FETCH_CONCURRENCY = int(os.getenv('SUPABASE_FETCH_CONCURRENCY', '8'))
+
+# One shared HTTP connection pool for all Supabase requests, sized to the fetch concurrency
+supabase_http_client = httpx.Client(
+    limits=httpx.Limits(
+        max_connections=SUPABASE_FETCH_CONCURRENCY,
+        max_keepalive_connections=SUPABASE_FETCH_CONCURRENCY
+    ),
+    timeout=120,
+    follow_redirects=True,
+    http2=True
+)
+# The Supabase client is synchronous, so page requests run on this pool instead of the event loop
+supabase_executor = ThreadPoolExecutor(max_workers=SUPABASE_FETCH_CONCURRENCY, thread_name_prefix='supabase')
+
 supabase: Optional[Client] = None
 if supabase_url and supabase_key and supabase_url != 'YOUR_SUPABASE_PROJECT_URL_HERE':
-    supabase = create_client(supabase_url, supabase_key)
+    supabase = create_client(supabase_url, supabase_key, options=SyncClientOptions(httpx_client=supabase_http_client))
 
 # ==================== CACHING ====================
-# Simple in-memory cache for frequently accessed data
+# Bounded in-memory cache for frequently accessed data
 from functools import lru_cache
+from collections import OrderedDict
+import sys
+import threading
 import time
 
-# Cache store with TTL
-_cache_store = {}
-_cache_ttl = {}  # Store expiry times
 CACHE_TTL_SECONDS = 60  # Cache for 60 seconds
+# Expired entries keep being served (while a refresh runs) for up to this long past their TTL
+CACHE_MAX_STALE_SECONDS = int(os.getenv('CACHE_MAX_STALE_SECONDS', '600'))
+# How often the background refresher checks the warmed tables
+CACHE_REFRESH_INTERVAL_SECONDS = int(os.getenv('CACHE_REFRESH_INTERVAL_SECONDS', '15'))
+# Upper bounds on what the cache may hold; least recently used entries are evicted first
+CACHE_MAX_BYTES = int(os.getenv('CACHE_MAX_BYTES', str(512 * 1024 * 1024)))
+CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', '1024'))
+
+def estimate_size(value, sample: int = 64) -> int:
+    """Rough byte size of a cached payload.
+
+    Large lists and dicts are sampled and extrapolated so that sizing a table with
+    hundreds of thousands of rows stays cheap. Objects exposing ``nbytes`` (NumPy
+    arrays, columnar tables) report that directly.
+    """
+    nbytes = getattr(value, 'nbytes', None)
+    if isinstance(nbytes, int):
+        return nbytes
+    if isinstance(value, (list, tuple)):
+        size = sys.getsizeof(value)
+        if not value:
+            return size
+        step = max(1, len(value) // sample)
+        picked = value[::step]
+        return size + int(sum(estimate_size(v, sample) for v in picked) * len(value) / len(picked))
+    if isinstance(value, dict):
+        size = sys.getsizeof(value)
+        if not value:
+            return size
+        items = list(value.items())
+        step = max(1, len(items) // sample)
+        picked = items[::step]
+        per_item = sum(estimate_size(k, sample) + estimate_size(v, sample) for k, v in picked) / len(picked)
+        return size + int(per_item * len(items))
+    return sys.getsizeof(value)
+
+class _CacheEntry:
+    __slots__ = ('value', 'expires_at', 'size')
+
+    def __init__(self, value, expires_at: float, size: int):
+        self.value = value
+        self.expires_at = expires_at
+        self.size = size
+
+class BoundedCache:
+    """LRU cache with per-key TTLs, a byte budget and hit/miss/eviction statistics.
+
+    Keys are ``"<namespace>:<name>"`` so related entries (e.g. every Supabase table)
+    can be invalidated together. Entries stay readable as stale for ``max_stale``
+    seconds past their TTL to support stale-while-revalidate.
+    """
+
+    def __init__(self, max_bytes: int, max_entries: int, default_ttl: int, max_stale: int):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.max_stale = max_stale
+        self._entries: "OrderedDict[str, _CacheEntry]" = OrderedDict()
+        self._lock = threading.RLock()
+        self.bytes = 0
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.rejected = 0
+
+    @staticmethod
+    def namespace_of(key: str) -> str:
+        return key.split(':', 1)[0]
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key)
+        self.bytes -= entry.size
+
+    def _lookup(self, key: str, allow_stale: bool):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None, False
+        now = time.time()
+        if now < entry.expires_at:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry.value, False
+        if allow_stale and now < entry.expires_at + self.max_stale:
+            self.stale_hits += 1
+            self._entries.move_to_end(key)
+            return entry.value, True
+        if now >= entry.expires_at + self.max_stale:
+            # Too stale to ever serve again
+            self._remove(key)
+            self.expirations += 1
+        self.misses += 1
+        return None, False
+
+    def get(self, key: str):
+        """Get value if not expired"""
+        with self._lock:
+            return self._lookup(key, allow_stale=False)[0]
+
+    def get_or_stale(self, key: str):
+        """Get (value, is_stale); expired entries are returned as stale until max_stale runs out"""
+        with self._lock:
+            return self._lookup(key, allow_stale=True)
+
+    def set(self, key: str, value, ttl: Optional[int] = None):
+        """Store value with a TTL, evicting least recently used entries to stay in budget"""
+        size = estimate_size(value)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if size > self.max_bytes:
+                self.rejected += 1
+                logger.warning(f"Not caching {key}: ~{size} bytes exceeds the {self.max_bytes} byte budget")
+                return
+            self._entries[key] = _CacheEntry(value, time.time() + (self.default_ttl if ttl is None else ttl), size)
+            self.bytes += size
+            while self.bytes > self.max_bytes or len(self._entries) > self.max_entries:
+                evicted, entry = self._entries.popitem(last=False)
+                self.bytes -= entry.size
+                self.evictions += 1
+                logger.info(f"Evicted {evicted} from cache")
+
+    def peek(self, key: str):
+        """Current value regardless of TTL, without touching LRU order or statistics"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry.value if entry else None
+
+    def expires_in(self, key: str) -> float:
+        """Seconds until the entry's TTL runs out (negative once stale, -inf if absent)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry.expires_at - time.time() if entry else float('-inf')
+
+    def invalidate(self, key: str) -> bool:
+        with self._lock:
+            if key not in self._entries:
+                return False
+            self._remove(key)
+            return True
+
+    def invalidate_namespace(self, namespace: str) -> int:
+        """Drop every entry whose key starts with ``namespace:``"""
+        with self._lock:
+            keys = [k for k in self._entries if self.namespace_of(k) == namespace]
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
+    def clear(self) -> int:
+        with self._lock:
+            count = len(self._entries)
+            self._entries.clear()
+            self.bytes = 0
+            return count
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        with self._lock:
+            namespaces: Dict[str, int] = {}
+            for key in self._entries:
+                ns = self.namespace_of(key)
+                namespaces[ns] = namespaces.get(ns, 0) + 1
+            lookups = self.hits + self.stale_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.hits + self.stale_hits) / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "rejected": self.rejected,
+                "namespaces": namespaces
+            }
+
+cache = BoundedCache(CACHE_MAX_BYTES, CACHE_MAX_ENTRIES, CACHE_TTL_SECONDS, CACHE_MAX_STALE_SECONDS)
 
 def get_cached(key: str):
     """Get value from cache if not expired"""
-    if key in _cache_store:
-        if time.time() < _cache_ttl.get(key, 0):
-            return _cache_store[key]
-        else:
-            # Expired, remove from cache
-            del _cache_store[key]
-            del _cache_ttl[key]
-    return None
+    return cache.get(key)
 
 def set_cached(key: str, value, ttl: int = CACHE_TTL_SECONDS):
     """Store value in cache with TTL"""
-    _cache_store[key] = value
-    _cache_ttl[key] = time.time() + ttl
+    cache.set(key, value, ttl)
 
 # JWT Config
 JWT_SECRET = os.getenv('JWT_SECRET', 'your-super-secret-jwt-key-change-in-production')
@@ -129,6 +348,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Total-Count", "X-Next-Cursor"],
 )
 
 api_router = APIRouter(prefix="/api")
@@ -223,48 +443,940 @@ class EmailReportRequest(BaseModel):
     report_content: str
     subject: Optional[str] = None
 
+# ==================== JSON ENCODING ====================
+
+def dump_json(obj) -> bytes:
+    """Compact JSON bytes, using orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+# ==================== COLUMNAR TABLE STORE ====================
+# Cached Supabase tables are held column by column instead of as one dict per row.
+# Numeric columns are NumPy arrays and string columns are dictionary-encoded
+# (int32 codes into a list of distinct values), so aggregates run vectorized and
+# repeated keys/values such as Risk_Level or Country are stored once.
+
+class Column:
+    """One column of a ColumnarTable.
+
+    kind is 'int' or 'float' (``data`` is int64/float64, ``nulls`` marks missing ints),
+    'category' (``data`` holds int32 codes, -1 for missing, into ``categories``) or
+    'object' for anything else (booleans, JSON values, mixed types).
+    """
+    __slots__ = ('kind', 'data', 'nulls', 'categories')
+
+    def __init__(self, kind: str, data: np.ndarray, nulls: Optional[np.ndarray] = None, categories: Optional[np.ndarray] = None):
+        self.kind = kind
+        self.data = data
+        self.nulls = nulls
+        self.categories = categories
+
+    @classmethod
+    def from_values(cls, values: list) -> "Column":
+        types = set(map(type, values))
+        types.discard(type(None))
+        if types and types <= {int, float} and bool not in types:
+            as_float = np.array(values, dtype=np.float64)
+            if types == {int}:
+                nulls = np.isnan(as_float)
+                if nulls.any():
+                    return cls('int', np.where(nulls, 0, as_float).astype(np.int64), nulls=nulls)
+                return cls('int', np.array(values, dtype=np.int64))
+            return cls('float', as_float)
+        if types == {str}:
+            mapping: Dict[str, int] = {}
+            codes = np.fromiter(
+                (-1 if v is None else mapping.setdefault(v, len(mapping)) for v in values),
+                dtype=np.int32, count=len(values)
+            )
+            # Trailing None so that code -1 decodes to None with a plain take()
+            categories = np.empty(len(mapping) + 1, dtype=object)
+            categories[:len(mapping)] = list(mapping)
+            return cls('category', codes, categories=categories)
+        data = np.empty(len(values), dtype=object)
+        data[:] = values
+        return cls('object', data)
+
+    @property
+    def nbytes(self) -> int:
+        size = self.data.nbytes
+        if self.nulls is not None:
+            size += self.nulls.nbytes
+        if self.categories is not None:
+            size += self.categories.nbytes + sum(sys.getsizeof(c) for c in self.categories)
+        if self.kind == 'object' and len(self.data):
+            # The array only holds references; sample the referenced objects
+            sample = self.data[::max(1, len(self.data) // 64)].tolist()
+            size += sum(estimate_size(v) for v in sample) * len(self.data) // len(sample)
+        return size
+
+    def as_float(self) -> np.ndarray:
+        """Numeric view with NaN for missing values"""
+        if self.kind == 'float':
+            return self.data
+        if self.kind == 'int':
+            values = self.data.astype(np.float64)
+            if self.nulls is not None:
+                values[self.nulls] = np.nan
+            return values
+        raise TypeError(f"Column of kind '{self.kind}' is not numeric")
+
+    def isnull(self, indices) -> np.ndarray:
+        """Boolean mask of missing values at the given positions"""
+        if self.kind == 'float':
+            return np.isnan(self.data[indices])
+        if self.kind == 'int':
+            return self.nulls[indices] if self.nulls is not None else np.zeros(len(indices), dtype=bool)
+        if self.kind == 'category':
+            return self.data[indices] < 0
+        return np.array([v is None for v in self.data[indices].tolist()], dtype=bool)
+
+    def decode(self, indices=None) -> np.ndarray:
+        """Object array of the original Python values (optionally only at indices)"""
+        data = self.data if indices is None else self.data[indices]
+        if self.kind == 'category':
+            return self.categories[data]
+        if self.kind == 'int' and self.nulls is not None:
+            nulls = self.nulls if indices is None else self.nulls[indices]
+            values = data.astype(object)
+            values[nulls] = None
+            return values
+        if self.kind == 'float':
+            values = data.astype(object)
+            values[np.isnan(data)] = None
+            return values
+        return data
+
+    def to_list(self, indices=None) -> list:
+        data = self.data if indices is None else self.data[indices]
+        if self.kind == 'int' and self.nulls is None:
+            return data.tolist()
+        if self.kind == 'float' and not np.isnan(data).any():
+            return data.tolist()
+        return self.decode(indices).tolist()
+
+    def eq_mask(self, value) -> np.ndarray:
+        if self.kind == 'category':
+            # Compare integer codes, not strings
+            matches = np.flatnonzero(self.categories[:-1] == value)
+            if not len(matches):
+                return np.zeros(len(self.data), dtype=bool)
+            return self.data == matches[0]
+        return self.decode() == value
+
+    def with_updates(self, positions: np.ndarray, updated: list, appended: list) -> "Column":
+        """New column with ``updated`` written at ``positions`` and ``appended`` added at the end.
+
+        Works on the encoded arrays so the cost is a copy of the arrays plus the changed
+        values; only a value that does not fit the column's kind forces a full re-encode.
+        """
+        values = updated + appended
+        if not values:
+            return self
+        types = set(map(type, values))
+        types.discard(type(None))
+        split = len(updated)
+        size = len(self.data)
+
+        if self.kind in ('int', 'float') and types <= {int, float} and bool not in types and (self.kind == 'float' or types <= {int}):
+            as_float = np.array(values, dtype=np.float64)
+            if self.kind == 'float':
+                data = np.concatenate([self.data, as_float[split:]])
+                data[positions] = as_float[:split]
+                return Column('float', data)
+            missing = np.isnan(as_float)
+            ints = np.where(missing, 0, as_float).astype(np.int64) if missing.any() else np.array(values, dtype=np.int64)
+            data = np.concatenate([self.data, ints[split:]])
+            data[positions] = ints[:split]
+            if self.nulls is None and not missing.any():
+                return Column('int', data)
+            nulls = np.concatenate([self.nulls if self.nulls is not None else np.zeros(size, dtype=bool), missing[split:]])
+            nulls[positions] = missing[:split]
+            return Column('int', data, nulls=nulls)
+
+        if self.kind == 'category' and types <= {str}:
+            labels = self.categories[:-1]
+            lookup = {c: i for i, c in enumerate(labels.tolist())}
+            codes = np.fromiter(
+                (-1 if v is None else lookup.setdefault(v, len(lookup)) for v in values),
+                dtype=np.int32, count=len(values)
+            )
+            categories = np.empty(len(lookup) + 1, dtype=object)
+            categories[:len(labels)] = labels
+            categories[len(labels):len(lookup)] = list(lookup)[len(labels):]
+            data = np.concatenate([self.data, codes[split:]])
+            data[positions] = codes[:split]
+            return Column('category', data, categories=categories)
+
+        merged = self.decode().tolist()
+        for position, value in zip(positions.tolist(), updated):
+            merged[position] = value
+        return Column.from_values(merged + appended)
+
+    def isin_mask(self, values: list) -> np.ndarray:
+        """Rows whose value is one of ``values`` (strings are coerced for numeric columns)"""
+        if self.kind == 'category':
+            wanted = set(values)
+            codes = [i for i, c in enumerate(self.categories[:-1]) if c in wanted]
+            return np.isin(self.data, codes)
+        if self.kind in ('int', 'float'):
+            numbers = []
+            for v in values:
+                try:
+                    numbers.append(float(v))
+                except (TypeError, ValueError):
+                    pass
+            return np.isin(self.as_float(), numbers)
+        return np.isin(self.decode(), values)
+
+    def sort_key(self) -> np.ndarray:
+        """Float key that orders rows by this column, NaN for missing values"""
+        if self.kind in ('int', 'float'):
+            return self.as_float()
+        if self.kind == 'category':
+            # Rank each distinct value once, then look ranks up by code
+            labels = self.categories[:-1]
+            ranks = np.empty(len(labels) + 1, dtype=np.float64)
+            ranks[np.argsort(labels.astype(str), kind='stable')] = np.arange(len(labels))
+            ranks[-1] = np.nan
+            return ranks[self.data]
+        values = self.decode()
+        keys = np.full(len(values), np.nan)
+        present = np.flatnonzero(values != None)  # noqa: E711 (elementwise comparison)
+        keys[present[np.argsort(values[present].astype(str), kind='stable')]] = np.arange(len(present))
+        return keys
+
+class HashIndex:
+    """Key tuple -> row positions. Rows are grouped in one argsort, so a lookup is a
+    dict probe plus an array slice."""
+    __slots__ = ('groups', 'order', 'starts', 'counts')
+
+    def __init__(self, groups: Dict[tuple, int], order: np.ndarray, starts: np.ndarray, counts: np.ndarray):
+        self.groups = groups
+        self.order = order
+        self.starts = starts
+        self.counts = counts
+
+    @classmethod
+    def build(cls, table: "ColumnarTable", names: List[str]) -> "HashIndex":
+        codes, keys = table.group_keys(names, missing=None)
+        if not table.length:
+            keys = []
+        order = np.argsort(codes, kind='stable')
+        counts = np.bincount(codes, minlength=len(keys))
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1])).astype(np.int64)
+        return cls({key: i for i, key in enumerate(keys)}, order, starts, counts)
+
+    def __len__(self) -> int:
+        return len(self.groups)
+
+    def get(self, key: tuple) -> np.ndarray:
+        """Row positions holding ``key`` (empty if there are none)"""
+        group = self.groups.get(key)
+        if group is None:
+            return self.order[:0]
+        start = self.starts[group]
+        return self.order[start:start + self.counts[group]]
+
+    @property
+    def nbytes(self) -> int:
+        return self.order.nbytes + self.starts.nbytes + self.counts.nbytes + estimate_size(self.groups)
+
+class ColumnarTable:
+    """A cached table stored column by column, preserving row order and column order"""
+
+    def __init__(self, columns: Dict[str, Column], length: int):
+        self.columns = columns
+        self.length = length
+        # Snapshots never change, so sort orders are computed once per (column, direction)
+        self._orders: Dict[tuple, np.ndarray] = {}
+        self._indexes: Dict[tuple, "HashIndex"] = {}
+        self._version: Optional[str] = None
+
+    @classmethod
+    def from_records(cls, records: List[dict]) -> "ColumnarTable":
+        names: Dict[str, None] = dict.fromkeys(records[0]) if records else {}
+        for record in records:
+            # PostgREST rows share one key set; only widen on the odd row that differs
+            if record.keys() != names.keys():
+                names.update(dict.fromkeys(record))
+        columns = {name: Column.from_values([r.get(name) for r in records]) for name in names}
+        return cls(columns, len(records))
+
+    def __len__(self) -> int:
+        return self.length
+
+    @property
+    def names(self) -> List[str]:
+        return list(self.columns)
+
+    @property
+    def nbytes(self) -> int:
+        return (sum(column.nbytes for column in self.columns.values())
+                + sum(index.nbytes for index in self._indexes.values()))
+
+    @property
+    def version(self) -> str:
+        """Content fingerprint of the snapshot; identical data gives the same version"""
+        if self._version is None:
+            digest = hashlib.blake2b(digest_size=12)
+            digest.update(str(self.length).encode())
+            for name, column in self.columns.items():
+                digest.update(f"\x1e{name}\x1f{column.kind}".encode('utf-8'))
+                digest.update(column.data.tobytes() if column.kind != 'object' else dump_json(column.data.tolist()))
+                if column.nulls is not None:
+                    digest.update(column.nulls.tobytes())
+                if column.categories is not None:
+                    digest.update('\x1f'.join(column.categories[:-1]).encode('utf-8'))
+            self._version = digest.hexdigest()
+        return self._version
+
+    def has(self, name: str) -> bool:
+        return name in self.columns
+
+    def numeric(self, name: str, fill: Optional[float] = None) -> np.ndarray:
+        """Float64 values of a column; missing values become NaN (or ``fill``)"""
+        if name not in self.columns:
+            return np.full(self.length, np.nan if fill is None else fill)
+        values = self.columns[name].as_float()
+        if fill is not None:
+            values = np.where(np.isnan(values), fill, values)
+        return values
+
+    def mask_eq(self, name: str, value) -> np.ndarray:
+        if name not in self.columns:
+            return np.zeros(self.length, dtype=bool)
+        return self.columns[name].eq_mask(value)
+
+    def count_eq(self, name: str, value) -> int:
+        return int(np.count_nonzero(self.mask_eq(name, value)))
+
+    def mask_in(self, name: str, values: list) -> np.ndarray:
+        if name not in self.columns:
+            return np.zeros(self.length, dtype=bool)
+        return self.columns[name].isin_mask(values)
+
+    def mask_range(self, name: str, low: Optional[float] = None, high: Optional[float] = None) -> np.ndarray:
+        """Rows with low <= value <= high; missing values never match"""
+        values = self.numeric(name)
+        mask = ~np.isnan(values)
+        if low is not None:
+            mask &= values >= low
+        if high is not None:
+            mask &= values <= high
+        return mask
+
+    def order_by(self, name: str, descending: bool = False) -> np.ndarray:
+        """Row indices sorted by a column (stable, missing values last)"""
+        key = (name, descending)
+        if key not in self._orders:
+            values = self.columns[name].sort_key()
+            values = np.where(np.isnan(values), np.inf, -values if descending else values)
+            self._orders[key] = np.argsort(values, kind='stable')
+        return self._orders[key]
+
+    def group_index(self, name: str, missing: str = 'Unknown') -> tuple:
+        """(codes, labels): a group number 0..k-1 for every row and the label of each group"""
+        column = self.columns.get(name)
+        if column is None:
+            return np.zeros(self.length, dtype=np.int64), ([missing] if self.length else [])
+        if column.kind == 'category':
+            labels = column.categories[:-1].tolist()
+            codes = column.data.astype(np.int64)
+            if (codes < 0).any():
+                codes[codes < 0] = len(labels)
+                labels.append(missing)
+            return codes, labels
+        lookup: Dict[Any, int] = {}
+        codes = np.fromiter(
+            (lookup.setdefault(missing if v is None else v, len(lookup)) for v in column.decode().tolist()),
+            dtype=np.int64, count=self.length
+        )
+        return codes, list(lookup)
+
+    def group_keys(self, names: List[str], rows: Optional[np.ndarray] = None, missing: Any = 'Unknown') -> tuple:
+        """(codes, keys): a dense group number per row (of ``rows``) and the key tuple of every group"""
+        n = self.length if rows is None else len(rows)
+        if not names:
+            return np.zeros(n, dtype=np.int64), [()]
+        combined = np.zeros(n, dtype=np.int64)
+        all_labels = []
+        for name in names:
+            codes, labels = self.group_index(name, missing)
+            if rows is not None:
+                codes = codes[rows]
+            combined = combined * max(len(labels), 1) + codes
+            all_labels.append(labels)
+        unique, inverse = np.unique(combined, return_inverse=True)
+        keys = []
+        for value in unique.tolist():
+            key = []
+            for labels in reversed(all_labels):
+                value, code = divmod(value, max(len(labels), 1))
+                key.append(labels[code])
+            keys.append(tuple(reversed(key)))
+        return inverse.astype(np.int64).ravel(), keys
+
+    def index(self, *names: str) -> "HashIndex":
+        """Hash index on one or more key columns, built once per snapshot"""
+        if names not in self._indexes:
+            self._indexes[names] = HashIndex.build(self, list(names))
+        return self._indexes[names]
+
+    def max_value(self, name: str):
+        """Largest non-missing value of a column (strings compare lexicographically), or None"""
+        column = self.columns.get(name)
+        if column is None or not self.length:
+            return None
+        if column.kind in ('int', 'float'):
+            values = column.as_float()
+            if np.isnan(values).all():
+                return None
+            top = np.nanmax(values)
+            return int(top) if column.kind == 'int' else float(top)
+        present = [v for v in column.decode().tolist() if v is not None]
+        return max(present) if present else None
+
+    def key_positions(self, keys: List[str], wanted: List[tuple]) -> Dict[tuple, int]:
+        """Row positions of the given key tuples (missing keys are left out)"""
+        mask = np.ones(self.length, dtype=bool)
+        for i, name in enumerate(keys):
+            mask &= self.mask_in(name, list({key[i] for key in wanted}))
+        candidates = np.flatnonzero(mask)
+        decoded = [self.columns[name].decode(candidates).tolist() for name in keys]
+        wanted_set = set(wanted)
+        return {key: position for position, key in zip(candidates.tolist(), zip(*decoded)) if key in wanted_set}
+
+    def merge(self, delta: "ColumnarTable", keys: List[str]) -> "ColumnarTable":
+        """New snapshot where delta rows replace rows with the same key and new keys are appended.
+
+        ``delta`` must have the same columns as this table.
+        """
+        delta_keys = list(zip(*[delta.columns[name].decode().tolist() for name in keys]))
+        latest: Dict[tuple, int] = {}
+        for row, key in enumerate(delta_keys):
+            latest[key] = row  # the last occurrence of a repeated key wins
+        positions = self.key_positions(keys, list(latest))
+        updated_rows = [row for key, row in latest.items() if key in positions]
+        appended_rows = [row for key, row in latest.items() if key not in positions]
+        update_positions = np.array([positions[delta_keys[row]] for row in updated_rows], dtype=np.int64)
+
+        columns = {}
+        for name, column in self.columns.items():
+            values = delta.columns[name].decode().tolist()
+            columns[name] = column.with_updates(
+                update_positions, [values[row] for row in updated_rows], [values[row] for row in appended_rows]
+            )
+        return ColumnarTable(columns, self.length + len(appended_rows))
+
+    def value_counts(self, name: str, missing: str = 'Unknown') -> Dict[Any, int]:
+        """Row count per distinct value, in first-seen order"""
+        if name not in self.columns:
+            return {missing: self.length} if self.length else {}
+        column = self.columns[name]
+        if column.kind == 'category':
+            # Shift codes by one so missing (-1) lands in bucket 0
+            counts = np.bincount(column.data + 1, minlength=len(column.categories))
+            result = {column.categories[i]: int(c) for i, c in enumerate(counts[1:]) if c}
+            if counts[0]:
+                result[missing] = int(counts[0])
+            return result
+        result: Dict[Any, int] = {}
+        for value in column.decode().tolist():
+            key = missing if value is None else value
+            result[key] = result.get(key, 0) + 1
+        return result
+
+    def to_records(self, indices=None, fields: Optional[List[str]] = None) -> List[dict]:
+        """Materialize rows as dicts (all rows, or those at ``indices``, in that order)"""
+        names = [f for f in (fields or self.names) if f in self.columns]
+        values = [self.columns[name].to_list(indices) for name in names]
+        return [dict(zip(names, row)) for row in zip(*values)]
+
+# ==================== SNAPSHOTS ====================
+# Cached tables are also written to Arrow IPC files. On startup they are memory-mapped
+# and served straight away while a background refresh reconciles them with Supabase.
+# SNAPSHOT_ONLY=true serves the data endpoints from these files without Supabase.
+
+SNAPSHOT_DIR = os.getenv('SNAPSHOT_DIR', str(ROOT_DIR / 'snapshots'))
+SNAPSHOT_ONLY = os.getenv('SNAPSHOT_ONLY', 'false').lower() in ('1', 'true', 'yes')
+SNAPSHOTS_ENABLED = bool(SNAPSHOT_DIR) and pa is not None
+if SNAPSHOT_DIR and pa is None:
+    logger.warning("pyarrow is not installed, table snapshots are disabled")
+
+_written_snapshot_versions: Dict[str, str] = {}
+
+def snapshot_path(table_name: str) -> Path:
+    return Path(SNAPSHOT_DIR) / f"{table_name.replace(' ', '_')}.arrow"
+
+def table_to_arrow(table: ColumnarTable, table_name: str) -> "pa.Table":
+    arrays, fields = [], []
+    for name, column in table.columns.items():
+        metadata = None
+        if column.kind in ('int', 'float'):
+            array = pa.array(column.data, mask=column.nulls)
+        elif column.kind == 'category':
+            indices = pa.array(column.data, mask=column.data < 0)
+            array = pa.DictionaryArray.from_arrays(indices, pa.array(column.categories[:-1].tolist(), type=pa.string()))
+        else:
+            # Booleans and JSON values are kept as JSON text
+            array = pa.array([None if v is None else dump_json(v).decode('utf-8') for v in column.data.tolist()], type=pa.string())
+            metadata = {b'encoding': b'json'}
+        arrays.append(array)
+        fields.append(pa.field(name, array.type, metadata=metadata))
+    schema = pa.schema(fields, metadata={
+        b'table': table_name.encode('utf-8'),
+        b'version': table.version.encode('ascii'),
+        b'saved_at': datetime.now(timezone.utc).isoformat().encode('ascii')
+    })
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+def table_from_arrow(arrow_table: "pa.Table") -> ColumnarTable:
+    """Build a ColumnarTable over Arrow buffers; numeric columns without nulls are zero-copy views"""
+    columns = {}
+    for field, chunked in zip(arrow_table.schema, arrow_table.columns):
+        array = chunked.chunk(0) if chunked.num_chunks == 1 else chunked.combine_chunks()
+        if field.metadata and field.metadata.get(b'encoding') == b'json':
+            values = [None if v is None else json.loads(v) for v in array.to_pylist()]
+            data = np.empty(len(values), dtype=object)
+            data[:] = values
+            columns[field.name] = Column('object', data)
+        elif pa.types.is_dictionary(field.type):
+            codes = array.indices.fill_null(-1).to_numpy(zero_copy_only=False).astype(np.int32, copy=False)
+            labels = array.dictionary.to_pylist()
+            categories = np.empty(len(labels) + 1, dtype=object)
+            categories[:len(labels)] = labels
+            columns[field.name] = Column('category', codes, categories=categories)
+        elif pa.types.is_integer(field.type):
+            if array.null_count:
+                nulls = array.is_null().to_numpy(zero_copy_only=False)
+                columns[field.name] = Column('int', array.fill_null(0).to_numpy(), nulls=nulls)
+            else:
+                columns[field.name] = Column('int', array.to_numpy())
+        else:
+            columns[field.name] = Column('float', array.to_numpy(zero_copy_only=False).astype(np.float64, copy=False))
+    table = ColumnarTable(columns, arrow_table.num_rows)
+    version = (arrow_table.schema.metadata or {}).get(b'version')
+    if version:
+        table._version = version.decode('ascii')
+    return table
+
+def save_snapshot(table_name: str, table: ColumnarTable):
+    """Write a table snapshot atomically (blocking; skipped if this version is already on disk)"""
+    if not SNAPSHOTS_ENABLED or _written_snapshot_versions.get(table_name) == table.version:
+        return
+    path = snapshot_path(table_name)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix('.arrow.tmp')
+    arrow_table = table_to_arrow(table, table_name)
+    with pa.OSFile(str(tmp_path), 'wb') as sink:
+        with pa.ipc.new_file(sink, arrow_table.schema) as writer:
+            writer.write_table(arrow_table)
+    os.replace(tmp_path, path)
+    _written_snapshot_versions[table_name] = table.version
+    logger.info(f"Saved snapshot of {table_name} ({len(table)} rows) to {path}")
+
+def load_snapshot(table_name: str) -> Optional[ColumnarTable]:
+    """Memory-map a table snapshot from disk (blocking), or None if there is none"""
+    if not SNAPSHOTS_ENABLED:
+        return None
+    path = snapshot_path(table_name)
+    if not path.exists():
+        return None
+    try:
+        with pa.memory_map(str(path), 'r') as source:
+            arrow_table = pa.ipc.open_file(source).read_all()
+        table = table_from_arrow(arrow_table)
+        _written_snapshot_versions[table_name] = table.version
+        build_table_indexes(table_name, table)
+        logger.info(f"Loaded snapshot of {table_name} ({len(table)} rows) from {path}")
+        return table
+    except Exception as e:
+        logger.warning(f"Failed to load snapshot {path}: {e}")
+        return None
+
+# Primary-key hash indexes built whenever a snapshot is loaded or refreshed
+TABLE_INDEXES = {
+    'Sites Data': [('Site_ID',), ('Study', 'Site_ID')],
+    'High Risk Sites': [('Site_ID',), ('Study', 'Site_ID')],
+    'Patient Data': [('Subject_ID',), ('Study', 'Subject_ID'), ('Study', 'Site_ID')]
+}
+
+# Rank indexes (memoized sort orders) backing /data/rankings, with each metric's default
+# direction: highest risk and most issues first, lowest data quality first
+TABLE_RANKINGS = {
+    'Sites Data': {
+        'Risk_Score': True,
+        'Avg_DQI': False,
+        'Total_Missing_Pages': True,
+        'Total_Open_Issues': True,
+        'Total_Uncoded_MedDRA': True,
+        'Total_Uncoded_WHODD': True,
+        'Total_Lab_Issues': True
+    },
+    'Patient Data': {
+        'Data_Quality_Index': False,
+        'total_open_issues': True,
+        'missing_pages_count': True,
+        'missing_lab_count': True
+    }
+}
+
+def build_table_indexes(table_name: str, table: ColumnarTable):
+    """Build the configured hash and rank indexes of a table (blocking)"""
+    for names in TABLE_INDEXES.get(table_name, []):
+        if all(table.has(name) for name in names):
+            table.index(*names)
+    for name, descending in TABLE_RANKINGS.get(table_name, {}).items():
+        if table.has(name):
+            table.order_by(name, descending)
+
+def data_source_configured() -> bool:
+    return supabase is not None or SNAPSHOT_ONLY
+
 # ==================== SUPABASE HELPER ====================
 
-async def fetch_all_supabase_data(table_name: str, batch_size: int = 1000, use_cache: bool = True):
-    """Fetch data from Supabase with caching support"""
-    cache_key = f"supabase_{table_name}"
-    
-    # Check cache first
-    if use_cache:
-        cached = get_cached(cache_key)
-        if cached is not None:
-            logger.info(f"Cache hit for {table_name}")
-            return cached
-    
-    all_data = []
-    start = 0
+def _fetch_supabase_page(table_name: str, start: int, end: int, with_count: bool = False):
+    """Fetch one inclusive row range from a Supabase table (blocking, runs in supabase_executor)"""
+    query = supabase.table(table_name).select('*', count=CountMethod.exact if with_count else None)
+    return query.range(start, end).execute()
+
+def _postgrest_value(value) -> str:
+    """A filter value quoted for a PostgREST or=() list (timestamps contain reserved characters)"""
+    escaped = str(value).replace('\\', '\\\\').replace('"', '\\"')
+    return f'"{escaped}"'
+
+def _keyset_filter(columns: List[str], after: list) -> str:
+    """PostgREST or=() filter for rows sorting strictly after ``after`` by ``columns``.
+
+    Columns are ordered ascending with NULLs last: a null key equals only ``is.null``,
+    nothing sorts after it, and a null sorts after every non-null value.
+    """
+    terms = []
+    for i, column in enumerate(columns):
+        if after[i] is None:
+            continue
+        conditions = [f"{c}.is.null" if v is None else f"{c}.eq.{_postgrest_value(v)}" for c, v in zip(columns[:i], after[:i])]
+        conditions.append(f"or({column}.gt.{_postgrest_value(after[i])},{column}.is.null)")
+        terms.append(conditions[0] if len(conditions) == 1 else f"and({','.join(conditions)})")
+    return ','.join(terms)
+
+def _fetch_supabase_changes(table_name: str, columns: List[str], since, after: Optional[list], limit: int):
+    """Fetch the next page of rows with columns[0] >= ``since``, ordered by ``columns`` (blocking)"""
+    query = supabase.table(table_name).select('*').gte(columns[0], since)
+    if after is not None:
+        query = query.or_(_keyset_filter(columns, after))
+    for column in columns:
+        query = query.order(column, nullsfirst=False)
+    return query.limit(limit).execute()
+
+async def load_supabase_changes(table_name: str, sync_column: str, since, keys: List[str], batch_size: int = SUPABASE_PAGE_SIZE) -> list:
+    """Rows whose ``sync_column`` is at or past ``since``, paged by (sync_column, *keys).
+
+    Many rows can share one sync value, so offsets over that column alone are not
+    stable between requests. Each page instead continues after the last row of the
+    previous one in the full key order, which neither skips nor repeats rows.
+    """
+    loop = asyncio.get_running_loop()
+    columns = [sync_column] + keys
+    all_data: list = []
+    after = None
     while True:
         try:
-            # Fetch a batch
-            response = supabase.table(table_name).select('*').range(start, start + batch_size - 1).execute()
-            batch_data = response.data
-            
-            if not batch_data:
-                break
-                
+            result = await loop.run_in_executor(
+                supabase_executor, _fetch_supabase_changes, table_name, columns, since, after, batch_size
+            )
+        except Exception as e:
+            # The rows so far are a prefix in sync order, so the next sync picks up from there
+            logger.error(f"Error fetching changes from {table_name}: {str(e)}")
+            return all_data
+        batch_data = result.data or []
+        all_data.extend(batch_data)
+        if len(batch_data) < batch_size:
+            return all_data
+        after = [batch_data[-1].get(column) for column in columns]
+
+async def load_supabase_table(table_name: str, batch_size: int = SUPABASE_PAGE_SIZE) -> list:
+    """Load a whole table with concurrent page requests.
+
+    The first page also asks for the exact row count, so every remaining range can be
+    requested at once; the executor caps how many are in flight. If the count is not
+    available (or the table grew meanwhile) we keep fetching in waves until a short page.
+    """
+    loop = asyncio.get_running_loop()
+
+    def fetch(start: int, with_count: bool = False):
+        return loop.run_in_executor(
+            supabase_executor, _fetch_supabase_page, table_name, start, start + batch_size - 1, with_count
+        )
+
+    try:
+        first = await fetch(0, with_count=True)
+    except Exception as e:
+        logger.error(f"Error fetching first batch from {table_name}: {str(e)}")
+        return []
+
+    all_data = list(first.data or [])
+    if len(all_data) < batch_size:
+        return all_data
+
+    total = first.count
+    if total is not None:
+        starts = list(range(batch_size, total, batch_size))
+    else:
+        starts = [batch_size * i for i in range(1, SUPABASE_FETCH_CONCURRENCY + 1)]
+
+    while starts:
+        results = await asyncio.gather(*(fetch(start) for start in starts), return_exceptions=True)
+        for start, result in zip(starts, results):
+            if isinstance(result, Exception):
+                # Keep the rows contiguous: stop at the first failed page
+                logger.error(f"Error fetching batch {start} from {table_name}: {str(result)}")
+                return all_data
+            batch_data = result.data or []
             all_data.extend(batch_data)
-            
-            # If we got less than batch_size, we've reached the end
             if len(batch_data) < batch_size:
-                break
-                
-            start += batch_size
-        except Exception as e:
-            logger.error(f"Error fetching batch from {table_name}: {str(e)}")
+                return all_data
+
+        if total is not None and len(all_data) >= total:
             break
-    
-    # Store in cache
-    if use_cache and all_data:
-        set_cached(cache_key, all_data)
-        logger.info(f"Cached {len(all_data)} records from {table_name}")
-            
+        # Every page came back full and the count was unknown or exceeded, so keep going
+        next_start = starts[-1] + batch_size
+        starts = [next_start + batch_size * i for i in range(SUPABASE_FETCH_CONCURRENCY)]
+
     return all_data
 
+class SingleFlight:
+    """Coalesce concurrent loads of the same key into one shared task.
+
+    The first caller for a key starts the load; callers arriving while it is still
+    running await the same task instead of starting their own.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.loads = 0
+        self.coalesced = 0
+        self.coalesced_by_key: Dict[str, int] = {}
+
+    def start(self, key: str, load) -> asyncio.Task:
+        """Start a load for key unless one is already running, and return its task"""
+        task = self._inflight.get(key)
+        if task is None:
+            self.loads += 1
+            task = asyncio.ensure_future(load())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return task
+
+    async def do(self, key: str, load):
+        if key in self._inflight:
+            self.coalesced += 1
+            self.coalesced_by_key[key] = self.coalesced_by_key.get(key, 0) + 1
+        # Shield so a cancelled request does not cancel the load other callers wait on
+        return await asyncio.shield(self.start(key, load))
+
+    def stats(self) -> dict:
+        return {
+            "loads": self.loads,
+            "coalesced_waiters": self.coalesced,
+            "coalesced_by_key": dict(self.coalesced_by_key),
+            "in_flight": list(self._inflight)
+        }
+
+supabase_loads = SingleFlight()
+
+def supabase_cache_key(table_name: str) -> str:
+    return f"supabase:{table_name}"
+
+# Incremental sync: rows whose SUPABASE_SYNC_COLUMN (an updated-at timestamp or a
+# monotonic key) is at or past the cached snapshot's high-water mark are pulled and
+# merged into the snapshot by the table's key columns.
+SUPABASE_SYNC_COLUMN = os.getenv('SUPABASE_SYNC_COLUMN', 'updated_at')
+SUPABASE_TABLE_KEYS = {
+    'Patient Data': ['Study', 'Subject_ID'],
+    'Sites Data': ['Study', 'Site_ID'],
+    'High Risk Sites': ['Study', 'Site_ID']
+}
+supabase_sync_state: Dict[str, dict] = {}
+# Delta refreshes and full resyncs of a table run one at a time. A delta merged onto the
+# snapshot a resync has since replaced would otherwise bring back rows it deleted.
+supabase_table_locks: Dict[str, asyncio.Lock] = {}
+
+def _sync_keys(table_name: str, snapshot: ColumnarTable) -> List[str]:
+    """Key columns to merge on, or [] if the snapshot cannot be synced incrementally"""
+    keys = SUPABASE_TABLE_KEYS.get(table_name)
+    if not keys or not snapshot.has(SUPABASE_SYNC_COLUMN) or not snapshot.has(keys[-1]):
+        return []
+    return [k for k in keys if snapshot.has(k)]
+
+def _supabase_table_loader(table_name: str, batch_size: int = SUPABASE_PAGE_SIZE, use_cache: bool = True, full: bool = False):
+    """Build the coroutine function that loads a table and refreshes its cache entry.
+
+    With a cached snapshot that has the sync column, only changed rows are fetched and
+    merged; a full reload happens when there is no snapshot, the columns changed, or
+    ``full`` is requested.
+    """
+    cache_key = supabase_cache_key(table_name)
+
+    async def load():
+        # The lock is taken before the snapshot is read, so a load always starts from
+        # whatever the previous one stored
+        async with supabase_table_locks.setdefault(table_name, asyncio.Lock()):
+            return await locked_load()
+
+    async def locked_load():
+        started = time.perf_counter()
+        if SNAPSHOT_ONLY:
+            table = await asyncio.to_thread(load_snapshot, table_name) or ColumnarTable({}, 0)
+            if use_cache and len(table):
+                set_cached(cache_key, table)
+            return table
+
+        table = None
+        mode = 'full'
+        previous = cache.peek(cache_key) if use_cache and not full else None
+        if previous is None and use_cache and not full:
+            # After a restart the on-disk snapshot is the base for an incremental sync
+            previous = await asyncio.to_thread(load_snapshot, table_name)
+        keys = _sync_keys(table_name, previous) if previous is not None else []
+        high_water_mark = previous.max_value(SUPABASE_SYNC_COLUMN) if keys else None
+
+        if high_water_mark is not None:
+            records = await load_supabase_changes(table_name, SUPABASE_SYNC_COLUMN, high_water_mark, keys, batch_size)
+            delta = await asyncio.to_thread(ColumnarTable.from_records, records)
+            if not len(delta):
+                table, mode = previous, 'delta'
+            elif set(delta.names) != set(previous.names):
+                logger.info(f"Schema change detected in {table_name}, running a full resync")
+            else:
+                table = await asyncio.to_thread(previous.merge, delta, keys)
+                mode = 'delta'
+            changed = len(delta)
+
+        if table is None:
+            records = await load_supabase_table(table_name, batch_size)
+            # Column conversion is CPU-bound, keep it off the event loop
+            table = await asyncio.to_thread(ColumnarTable.from_records, records)
+            changed = len(table)
+            if not len(table) and previous is not None and len(previous):
+                logger.warning(f"Supabase returned no rows for {table_name}, keeping the previous snapshot")
+                table = previous
+        await asyncio.to_thread(lambda: table.version)
+        await asyncio.to_thread(build_table_indexes, table_name, table)
+        logger.info(f"Loaded {table_name} ({mode}, {changed} rows fetched, {len(table)} total) in {time.perf_counter() - started:.2f}s")
+        supabase_sync_state[table_name] = {
+            "mode": mode,
+            "rows_fetched": changed,
+            "rows": len(table),
+            "high_water_mark": table.max_value(SUPABASE_SYNC_COLUMN),
+            "synced_at": datetime.now(timezone.utc).isoformat()
+        }
+        
+        # Store in cache
+        if use_cache and len(table):
+            set_cached(cache_key, table)
+            logger.info(f"Cached {len(table)} records from {table_name} (~{table.nbytes // 1024} KiB columnar)")
+            try:
+                await asyncio.to_thread(save_snapshot, table_name, table)
+            except Exception as e:
+                logger.warning(f"Failed to save snapshot of {table_name}: {e}")
+        return table
+
+    return load
+
+def refresh_supabase_table(table_name: str) -> asyncio.Task:
+    """Refresh a table's cache entry in the background (joins a refresh already running)"""
+    return supabase_loads.start(supabase_cache_key(table_name), _supabase_table_loader(table_name))
+
+async def resync_supabase_table(table_name: str) -> ColumnarTable:
+    """Reload a table in full, discarding incremental state"""
+    return await supabase_loads.do(f"{supabase_cache_key(table_name)}:full", _supabase_table_loader(table_name, full=True))
+
+async def fetch_all_supabase_data(table_name: str, batch_size: int = SUPABASE_PAGE_SIZE, use_cache: bool = True) -> ColumnarTable:
+    """Fetch a Supabase table as a ColumnarTable with caching support.
+
+    Expired entries are served stale while one background task refreshes them; only a
+    missing entry (or one past CACHE_MAX_STALE_SECONDS) makes the caller wait for a load.
+    """
+    cache_key = supabase_cache_key(table_name)
+    load = _supabase_table_loader(table_name, batch_size, use_cache)
+
+    if not use_cache:
+        return await load()
+
+    # Check cache first
+    cached, is_stale = cache.get_or_stale(cache_key)
+    if cached is not None:
+        if is_stale:
+            logger.info(f"Serving stale cache for {table_name}, refreshing in background")
+            supabase_loads.start(cache_key, load)
+        else:
+            logger.info(f"Cache hit for {table_name}")
+        return cached
+
+    # Concurrent cache misses for the same table share one load
+    return await supabase_loads.do(cache_key, load)
+
+# Tables the dashboard reads on every page load, kept warm by the background refresher
+WARM_TABLES = ['Sites Data', 'Patient Data', 'High Risk Sites']
+_cache_refresher_task: Optional[asyncio.Task] = None
+
+# The pipeline publisher (pipeline.py publish) adds a row per published snapshot. A new
+# version refreshes the tables it changed, with a full reload where rows were deleted
+# since the incremental sync cannot see deletions.
+PIPELINE_VERSION_TABLE = os.getenv('PIPELINE_VERSION_TABLE', 'Pipeline Versions')
+published_version: Dict[str, Any] = {}
+# Running full resyncs, referenced until they finish so they are not garbage-collected
+_resync_tasks: Set[asyncio.Task] = set()
+
+def _resync_done(task: asyncio.Task):
+    _resync_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"Full resync of {task.get_name()} failed: {task.exception()}")
+
+def _fetch_published_version() -> Optional[dict]:
+    response = supabase.table(PIPELINE_VERSION_TABLE).select('*').order('version', desc=True).limit(1).execute()
+    return response.data[0] if response.data else None
+
+async def check_published_version():
+    """Refresh the cached tables changed by a newly published pipeline snapshot"""
+    try:
+        latest = await asyncio.get_running_loop().run_in_executor(supabase_executor, _fetch_published_version)
+    except Exception as e:
+        logger.debug(f"Could not read {PIPELINE_VERSION_TABLE}: {e}")
+        return
+    if not latest or latest['version'] == published_version.get('version'):
+        return
+    previous = published_version.get('version')
+    published_version.clear()
+    published_version.update(latest)
+    if previous is None:
+        # First check since startup: the startup refresh already loads the current data
+        return
+    changes = latest.get('tables') or {}
+    skipped = latest['version'] > previous + 1
+    logger.info(f"Pipeline published snapshot version {latest['version']} (was {previous}), refreshing changed tables")
+    for table_name in WARM_TABLES:
+        change = changes.get(table_name, {})
+        if skipped or change.get('deleted'):
+            # Versions in between were missed, so their deletions may be too
+            task = asyncio.create_task(resync_supabase_table(table_name), name=table_name)
+            _resync_tasks.add(task)
+            task.add_done_callback(_resync_done)
+        elif change.get('upserted'):
+            refresh_supabase_table(table_name)
+
+async def refresh_warm_tables_periodically():
+    """Reload warm tables that would expire before the next check, or that a new pipeline version changed"""
+    while True:
+        await check_published_version()
+        for table_name in WARM_TABLES:
+            if cache.expires_in(supabase_cache_key(table_name)) < CACHE_REFRESH_INTERVAL_SECONDS:
+                refresh_supabase_table(table_name)
+        await asyncio.sleep(CACHE_REFRESH_INTERVAL_SECONDS)
+
 # ==================== DATA STORE FALLBACK ====================
 # In-memory store for when MongoDB is not available (Hackathon mode)
 IN_MEMORY_USERS = {}
@@ -304,9 +1416,93 @@ async def save_user(user_doc: dict):
     except Exception as e:
         logger.warning(f"MongoDB unavailable, saving to in-memory store: {e}")
         IN_MEMORY_USERS[user_doc["id"]] = user_doc
+    invalidate_cached_user(user_doc["id"])
 
 # ==================== AUTH UTILITIES ====================
 
+# Verified tokens -> resolved user profiles, so most requests authenticate without
+# verifying the token or reading the user again. An entry never outlives the token's
+# exp (nor AUTH_CACHE_TTL_SECONDS), and is dropped when the user record changes.
+AUTH_CACHE_TTL_SECONDS = int(os.getenv('AUTH_CACHE_TTL_SECONDS', '300'))
+AUTH_CACHE_MAX_ENTRIES = int(os.getenv('AUTH_CACHE_MAX_ENTRIES', '10000'))
+auth_cache = BoundedCache(64 * 1024 * 1024, AUTH_CACHE_MAX_ENTRIES, AUTH_CACHE_TTL_SECONDS, max_stale=0)
+_auth_keys_by_user: Dict[str, set] = {}
+
+def auth_cache_key(token: str) -> str:
+    return "auth:" + hashlib.blake2b(token.encode('utf-8'), digest_size=16).hexdigest()
+
+def remember_user(cache_key: str, user: dict, exp) -> dict:
+    """Cache the user resolved from a verified token until the token expires; returns the user"""
+    ttl = min(float(exp) - time.time(), AUTH_CACHE_TTL_SECONDS) if exp else 0
+    user_id = user.get('id')
+    if ttl > 0 and user_id:
+        auth_cache.set(cache_key, dict(user), ttl)
+        # Forget keys that expired or were evicted since
+        keys = {key for key in _auth_keys_by_user.get(user_id, ()) if auth_cache.peek(key) is not None}
+        keys.add(cache_key)
+        _auth_keys_by_user[user_id] = keys
+    return user
+
+def invalidate_cached_user(user_id: str) -> int:
+    """Drop every cached token of a user; call whenever the user record changes"""
+    keys = _auth_keys_by_user.pop(user_id, set())
+    return sum(auth_cache.invalidate(key) for key in keys)
+
+# bcrypt and Firebase token verification are CPU-bound, so they run on a small thread
+# pool instead of the event loop. Once AUTH_MAX_PENDING calls are queued or running,
+# further ones are refused with 503 + Retry-After rather than piling up behind them.
+AUTH_WORKERS = int(os.getenv('AUTH_WORKERS', str(min(4, os.cpu_count() or 1))))
+AUTH_MAX_PENDING = int(os.getenv('AUTH_MAX_PENDING', '64'))
+AUTH_RETRY_AFTER_SECONDS = int(os.getenv('AUTH_RETRY_AFTER_SECONDS', '2'))
+
+class BoundedPool:
+    """Thread pool for blocking calls that sheds load past ``max_pending`` queued or running calls"""
+
+    def __init__(self, name: str, workers: int, max_pending: int, retry_after: int):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+        self.workers = workers
+        self.max_pending = max_pending
+        self.retry_after = retry_after
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def _done(self, _):
+        with self._lock:
+            self.pending -= 1
+            self.completed += 1
+
+    async def run(self, func, *args):
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Server busy, please retry shortly",
+                    headers={"Retry-After": str(self.retry_after)}
+                )
+            self.pending += 1
+        # Counted until the worker finishes, even if the caller gives up waiting
+        future = self.executor.submit(func, *args)
+        future.add_done_callback(self._done)
+        return await asyncio.wrap_future(future)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "pending": self.pending,
+                "max_pending": self.max_pending,
+                "completed": self.completed,
+                "rejected": self.rejected
+            }
+
+auth_pool = BoundedPool('auth', AUTH_WORKERS, AUTH_MAX_PENDING, AUTH_RETRY_AFTER_SECONDS)
+
 def hash_password(password: str) -> str:
     return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
 
@@ -319,21 +1515,74 @@ def create_access_token(data: dict) -> str:
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
-def send_email_notification(to_email: str, alert_data: dict):
-    """
-    Sends an email notification about a new alert using Amazon SES.
-    If SES is not configured, logs a mock email to the console.
-    """
-    if not ses_client or not SENDER_EMAIL:
+# ==================== EMAIL OUTBOX ====================
+# Handlers only enqueue messages into the email_outbox collection. Background workers
+# deliver them (EMAIL_WORKERS at a time) and retry failures with exponential backoff.
+# Alerts for a recipient emailed within the last EMAIL_DIGEST_WINDOW_SECONDS are held
+# until the window closes and then sent together as one digest.
+# EMAIL_BACKEND: 'ses', 'file' (local SES stand-in writing each message to
+# EMAIL_SINK_DIR) or 'log' (print only; the default when SES is not configured).
+
+EMAIL_BACKEND = os.getenv('EMAIL_BACKEND', 'ses' if ses_client and SENDER_EMAIL else 'log')
+EMAIL_SINK_DIR = os.getenv('EMAIL_SINK_DIR', str(ROOT_DIR / 'sent_emails'))
+EMAIL_WORKERS = int(os.getenv('EMAIL_WORKERS', '4'))
+EMAIL_MAX_ATTEMPTS = int(os.getenv('EMAIL_MAX_ATTEMPTS', '5'))
+EMAIL_RETRY_BASE_SECONDS = float(os.getenv('EMAIL_RETRY_BASE_SECONDS', '5'))
+EMAIL_POLL_SECONDS = float(os.getenv('EMAIL_POLL_SECONDS', '5'))
+# A message claimed longer ago than this (e.g. by a worker that died) is picked up again
+EMAIL_CLAIM_TIMEOUT_SECONDS = int(os.getenv('EMAIL_CLAIM_TIMEOUT_SECONDS', '300'))
+EMAIL_DIGEST_WINDOW_SECONDS = int(os.getenv('EMAIL_DIGEST_WINDOW_SECONDS', '60'))
+EMAIL_DIGEST_MAX_ALERTS = int(os.getenv('EMAIL_DIGEST_MAX_ALERTS', '50'))
+# SES errors that retrying cannot fix
+SES_PERMANENT_ERRORS = {'MessageRejected', 'MailFromDomainNotVerifiedException', 'ConfigurationSetDoesNotExist'}
+
+email_executor = ThreadPoolExecutor(max_workers=EMAIL_WORKERS, thread_name_prefix='email')
+email_wakeup = asyncio.Event()
+email_stats = {"queued": 0, "sent": 0, "retried": 0, "failed": 0, "digested_alerts": 0}
+_email_worker_tasks: List[asyncio.Task] = []
+
+class PermanentEmailError(Exception):
+    """Delivery failure that retrying will not fix"""
+
+def deliver_email(message: dict) -> str:
+    """Send one rendered message (blocking, runs in email_executor) and return its message id"""
+    if EMAIL_BACKEND == 'ses':
+        try:
+            response = ses_client.send_email(
+                Source=SENDER_EMAIL,
+                Destination={'ToAddresses': [message['to']]},
+                Message={
+                    'Subject': {'Data': message['subject'], 'Charset': 'UTF-8'},
+                    'Body': {
+                        'Text': {'Data': message['text'], 'Charset': 'UTF-8'},
+                        'Html': {'Data': message['html'], 'Charset': 'UTF-8'}
+                    }
+                }
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] in SES_PERMANENT_ERRORS:
+                raise PermanentEmailError(e.response['Error']['Message'])
+            raise
+        return response['MessageId']
+
+    message_id = str(uuid.uuid4())
+    if EMAIL_BACKEND == 'file':
+        sink = Path(EMAIL_SINK_DIR)
+        sink.mkdir(parents=True, exist_ok=True)
+        record = {**message, "message_id": message_id, "sent_at": datetime.now(timezone.utc).isoformat()}
+        (sink / f"{message_id}.json").write_bytes(dump_json(record))
+    else:
         logger.info(f"========== MOCK EMAIL SENT (SES Not Configured) ==========")
-        logger.info(f"To: {to_email}")
-        logger.info(f"Subject: New Clinical Alert: {alert_data.get('title')}")
-        logger.info(f"Body: Priority: {alert_data.get('priority')}, Type: {alert_data.get('alert_type')}")
+        logger.info(f"To: {message['to']}")
+        logger.info(f"Subject: {message['subject']}")
+        logger.info(f"Body: {message['text'][:500]}")
         logger.info(f"==========================================================")
-        return
+    return message_id
 
-    try:
-        # Create the email body
+def render_alert_email(alerts: List[dict]) -> dict:
+    """Subject and bodies for one alert, or a digest of several"""
+    if len(alerts) == 1:
+        alert_data = alerts[0]
         body_html = f"""
         <html>
           <body>
@@ -349,36 +1598,137 @@ def send_email_notification(to_email: str, alert_data: dict):
           </body>
         </html>
         """
-        
         body_text = f"New Alert Created\nTitle: {alert_data.get('title')}\nPriority: {alert_data.get('priority')}\nType: {alert_data.get('alert_type')}\nDescription: {alert_data.get('description')}"
+        return {"subject": f"New Clinical Alert: {alert_data.get('title')}", "text": body_text, "html": body_html}
 
-        response = ses_client.send_email(
-            Source=SENDER_EMAIL,
-            Destination={
-                'ToAddresses': [to_email],
-            },
-            Message={
-                'Subject': {
-                    'Data': f"New Clinical Alert: {alert_data.get('title')}",
-                    'Charset': 'UTF-8'
-                },
-                'Body': {
-                    'Text': {
-                        'Data': body_text,
-                        'Charset': 'UTF-8'
-                    },
-                    'Html': {
-                        'Data': body_html,
-                        'Charset': 'UTF-8'
-                    }
-                }
-            }
-        )
-        logger.info(f"Email notification sent to {to_email} via SES. MessageId: {response['MessageId']}")
-    except ClientError as e:
-        logger.error(f"Failed to send email notification via SES: {e.response['Error']['Message']}")
+    items_html = "".join(
+        f"<li><strong>{a.get('title')}</strong> ({a.get('priority')}, {a.get('alert_type')})"
+        f" - Site: {a.get('site_id') or 'N/A'}, Patient: {a.get('patient_id') or 'N/A'}<br>{a.get('description')}</li>"
+        for a in alerts
+    )
+    body_html = f"""
+        <html>
+          <body>
+            <h2>{len(alerts)} New Alerts Created</h2>
+            <ul>{items_html}</ul>
+            <p>Please log in to the Clinical Data Monitoring System to view more details.</p>
+          </body>
+        </html>
+        """
+    body_text = f"{len(alerts)} New Alerts Created\n" + "\n".join(
+        f"- {a.get('title')} (Priority: {a.get('priority')}, Type: {a.get('alert_type')}): {a.get('description')}" for a in alerts
+    )
+    return {"subject": f"{len(alerts)} New Clinical Alerts", "text": body_text, "html": body_html}
+
+def _outbox_doc(kind: str, to: str, **fields) -> dict:
+    now = datetime.now(timezone.utc)
+    return {"id": str(uuid.uuid4()), "kind": kind, "to": to, "status": "pending", "attempts": 0,
+            "created_at": now, "next_attempt_at": now, **fields}
+
+async def enqueue_email(to: str, subject: str, text: str, html: str) -> str:
+    """Queue a rendered message for delivery and return its outbox id"""
+    doc = _outbox_doc('message', to, subject=subject, text=text, html=html)
+    await db.email_outbox.insert_one(doc)
+    email_stats["queued"] += 1
+    email_wakeup.set()
+    return doc["id"]
+
+async def enqueue_alert_email(to: str, alert: dict) -> str:
+    """Queue an alert notification, folding it into the recipient's pending digest if there is one"""
+    alert = {k: v for k, v in alert.items() if k != '_id'}
+    pending = await db.email_outbox.find_one_and_update(
+        {"kind": "alert", "to": to, "status": "pending", f"alerts.{EMAIL_DIGEST_MAX_ALERTS - 1}": {"$exists": False}},
+        {"$push": {"alerts": alert}},
+        projection={"_id": 0, "id": 1}
+    )
+    if pending:
+        email_stats["digested_alerts"] += 1
+        return pending["id"]
+
+    # The first alert after a quiet window goes out straight away; later ones wait for the window to close
+    doc = _outbox_doc('alert', to, alerts=[alert])
+    last = await db.email_outbox.find_one(
+        {"kind": "alert", "to": to, "status": {"$in": ["sending", "sent"]}},
+        {"_id": 0, "claimed_at": 1},
+        sort=[("claimed_at", -1)]
+    )
+    if last and last.get("claimed_at"):
+        doc["next_attempt_at"] = max(doc["created_at"], last["claimed_at"] + timedelta(seconds=EMAIL_DIGEST_WINDOW_SECONDS))
+    await db.email_outbox.insert_one(doc)
+    email_stats["queued"] += 1
+    if doc["next_attempt_at"] <= doc["created_at"]:
+        email_wakeup.set()
+    return doc["id"]
+
+async def claim_email() -> Optional[dict]:
+    """Atomically take the next due message (or one abandoned mid-send)"""
+    now = datetime.now(timezone.utc)
+    claim = {"status": "sending", "claimed_at": now}
+    doc = await db.email_outbox.find_one_and_update(
+        {"$or": [
+            {"status": "pending", "next_attempt_at": {"$lte": now}},
+            {"status": "sending", "claimed_at": {"$lte": now - timedelta(seconds=EMAIL_CLAIM_TIMEOUT_SECONDS)}}
+        ]},
+        {"$set": claim},
+        sort=[("next_attempt_at", 1)],
+        projection={"_id": 0}
+    )
+    return {**doc, **claim} if doc else None
+
+async def send_outbox_email(doc: dict):
+    """Deliver one claimed message and record the outcome, scheduling a retry on failure"""
+    message = render_alert_email(doc["alerts"]) if doc["kind"] == 'alert' else {k: doc[k] for k in ('subject', 'text', 'html')}
+    message["to"] = doc["to"]
+    attempts = doc.get("attempts", 0) + 1
+    try:
+        message_id = await asyncio.get_running_loop().run_in_executor(email_executor, deliver_email, message)
     except Exception as e:
-        logger.error(f"Unexpected error sending email: {str(e)}")
+        error = e.response['Error']['Message'] if isinstance(e, ClientError) else str(e)
+        if isinstance(e, PermanentEmailError) or attempts >= EMAIL_MAX_ATTEMPTS:
+            email_stats["failed"] += 1
+            logger.error(f"Giving up on email {doc['id']} to {doc['to']} after {attempts} attempts: {error}")
+            update = {"status": "failed", "attempts": attempts, "last_error": error}
+        else:
+            email_stats["retried"] += 1
+            delay = EMAIL_RETRY_BASE_SECONDS * 2 ** (attempts - 1) * random.uniform(0.5, 1.0)
+            logger.warning(f"Email {doc['id']} to {doc['to']} failed ({error}), retrying in {delay:.0f}s")
+            update = {"status": "pending", "attempts": attempts, "last_error": error,
+                      "next_attempt_at": datetime.now(timezone.utc) + timedelta(seconds=delay)}
+        await db.email_outbox.update_one({"id": doc["id"]}, {"$set": update})
+        return
+
+    email_stats["sent"] += 1
+    await db.email_outbox.update_one({"id": doc["id"]}, {"$set": {
+        "status": "sent", "attempts": attempts, "message_id": message_id, "sent_at": datetime.now(timezone.utc)
+    }})
+    count = len(doc.get("alerts") or [])
+    logger.info(f"Email sent to {doc['to']} ({doc['kind']}{f', {count} alerts' if count > 1 else ''}). MessageId: {message_id}")
+
+async def email_worker():
+    """Drain the outbox; sleeps until something is queued or the next poll"""
+    while True:
+        email_wakeup.clear()
+        try:
+            doc = await claim_email()
+        except Exception as e:
+            logger.warning(f"Email outbox unavailable: {e}")
+            doc = None
+        if doc is None:
+            try:
+                await asyncio.wait_for(email_wakeup.wait(), EMAIL_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        try:
+            await send_outbox_email(doc)
+        except Exception as e:
+            # The claim times out and the message is retried
+            logger.error(f"Error sending email {doc.get('id')}: {str(e)}")
+
+def start_email_workers():
+    for _ in range(EMAIL_WORKERS):
+        _email_worker_tasks.append(asyncio.create_task(email_worker()))
+    logger.info(f"Started {EMAIL_WORKERS} email workers ({EMAIL_BACKEND} backend)")
 
 # ==================== FIREBASE INITIALIZATION ====================
 
@@ -409,18 +1759,24 @@ async def get_current_user_hybrid(credentials: Optional[HTTPAuthorizationCredent
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Missing token")
     
     token = credentials.credentials
+    cache_key = auth_cache_key(token)
+    cached_user = auth_cache.get(cache_key)
+    if cached_user is not None:
+        return dict(cached_user)
 
     # Try Firebase authentication first
     if firebase_admin_initialized:
         try:
             import firebase_admin
             from firebase_admin import auth as firebase_auth
-            decoded_token = firebase_auth.verify_id_token(token)
+            decoded_token = await auth_pool.run(firebase_auth.verify_id_token, token)
             firebase_uid = decoded_token.get('uid')
             user = await get_user_by_firebase_uid(firebase_uid)
             if user:
                 logger.info(f"Authenticated via Firebase: {user.get('email')}")
-                return user
+                return remember_user(cache_key, user, decoded_token.get('exp'))
+        except HTTPException:
+            raise
         except Exception as e:
             logger.debug(f"Firebase token verification failed: {str(e)}")
     
@@ -439,6 +1795,7 @@ async def get_current_user_hybrid(credentials: Optional[HTTPAuthorizationCredent
                 user = await get_user_by_firebase_uid(firebase_uid)
                 if user:
                     logger.info(f"Authenticated via Firebase Payload: {user.get('email')}")
+                    # The signature was never checked, so this user is not cached
                     return user
     except Exception as e:
         logger.debug(f"Firebase token decode attempt failed: {str(e)}")
@@ -455,7 +1812,7 @@ async def get_current_user_hybrid(credentials: Optional[HTTPAuthorizationCredent
             logger.warning(f"User not found for ID: {user_id}")
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
         logger.info(f"Authenticated via JWT: {user.get('email')}")
-        return user
+        return remember_user(cache_key, user, payload.get('exp'))
     except jwt.ExpiredSignatureError:
         logger.warning("JWT token expired")
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token expired")
@@ -479,7 +1836,7 @@ async def register(user_data: UserRegister):
     )
     
     doc = user.model_dump()
-    doc['password'] = hash_password(user_data.password)
+    doc['password'] = await auth_pool.run(hash_password, user_data.password)
     doc['created_at'] = doc['created_at'].isoformat()
     
     await save_user(doc)
@@ -491,7 +1848,7 @@ async def register(user_data: UserRegister):
 async def login(credentials: UserLogin):
     logger.info(f"Login attempt for email: {credentials.email}")
     user_doc = await get_user_by_email(credentials.email)
-    if not user_doc or 'password' not in user_doc or not verify_password(credentials.password, user_doc['password']):
+    if not user_doc or 'password' not in user_doc or not await auth_pool.run(verify_password, credentials.password, user_doc['password']):
         raise HTTPException(status_code=400, detail="Invalid email or password")
     
     user = User(**{k: v for k, v in user_doc.items() if k != 'password'})
@@ -502,103 +1859,839 @@ async def login(credentials: UserLogin):
 async def get_me(current_user: dict = Depends(get_current_user_hybrid)):
     return User(**current_user)
 
+# ==================== TABLE QUERIES ====================
+# Filtering, sorting, projection and paging run server-side on the cached snapshot,
+# so clients only receive the page of rows they display.
+
+def _split_param(value: Optional[str]) -> List[str]:
+    return [v.strip() for v in value.split(',') if v.strip()] if value else []
+
+# A cursor is an offset into one snapshot version; after a reload the same offset
+# would skip or repeat rows, so cursors from an older version are refused.
+
+def encode_cursor(offset: int, version: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps({"offset": offset, "version": version}).encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor: str) -> tuple:
+    """(offset, version) of a cursor issued by encode_cursor"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        offset, version = int(payload["offset"]), str(payload["version"])
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if offset < 0:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return offset, version
+
+class TableQuery:
+    """Common paging/sorting/projection query parameters for table endpoints"""
+
+    def __init__(
+        self,
+        limit: Optional[int] = Query(None, ge=1, description="Maximum rows to return (all rows if omitted)"),
+        offset: int = Query(0, ge=0),
+        cursor: Optional[str] = Query(None, description="next_cursor from a previous page; overrides offset"),
+        sort: Optional[str] = Query(None, description="Column to sort by, prefix with '-' for descending"),
+        fields: Optional[str] = Query(None, description="Comma-separated columns to return"),
+        stream: Optional[str] = Query(
+            None, pattern="^(ndjson|json)$",
+            description="Stream rows instead of one JSON document: 'ndjson' (one row per line) or 'json' (a chunked array)"
+        )
+    ):
+        self.limit = limit
+        self.offset, self.version = decode_cursor(cursor) if cursor else (offset, None)
+        self.sort = sort
+        self.fields = _split_param(fields)
+        self.stream = stream
+
+class RowSelection:
+    """Rows picked by a TableQuery: ``page`` is None (every row), a slice or an index array"""
+    __slots__ = ('page', 'total', 'end', 'fields')
+
+    def __init__(self, page, total: int, end: int, fields: Optional[List[str]]):
+        self.page = page
+        self.total = total
+        self.end = end
+        self.fields = fields
+
+def select_rows(
+    table: ColumnarTable,
+    query: TableQuery,
+    equals: Optional[Dict[str, List[str]]] = None,
+    ranges: Optional[Dict[str, tuple]] = None
+) -> RowSelection:
+    """Apply filters, sort and paging to a cached table"""
+    if query.version is not None and query.version != table.version:
+        raise HTTPException(status_code=409, detail="Cursor is from an older snapshot; restart from the first page")
+    mask = None
+    for name, values in (equals or {}).items():
+        if values:
+            part = table.mask_in(name, values)
+            mask = part if mask is None else mask & part
+    for name, (low, high) in (ranges or {}).items():
+        if low is not None or high is not None:
+            part = table.mask_range(name, low, high)
+            mask = part if mask is None else mask & part
+
+    if query.sort:
+        sort_name = query.sort.lstrip('-')
+        if not table.has(sort_name):
+            raise HTTPException(status_code=400, detail=f"Unknown sort column: {sort_name}")
+        indices = table.order_by(sort_name, descending=query.sort.startswith('-'))
+        if mask is not None:
+            indices = indices[mask[indices]]
+    else:
+        indices = np.flatnonzero(mask) if mask is not None else None
+
+    unknown = [f for f in query.fields if not table.has(f)]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+
+    total = len(table) if indices is None else len(indices)
+    end = total if query.limit is None else min(total, query.offset + query.limit)
+    if indices is None:
+        page = slice(query.offset, end) if (query.offset or end < total) else None
+    else:
+        page = indices[query.offset:end]
+    return RowSelection(page, total, end, query.fields or None)
+
+def query_table(
+    table: ColumnarTable,
+    query: TableQuery,
+    equals: Optional[Dict[str, List[str]]] = None,
+    ranges: Optional[Dict[str, tuple]] = None
+) -> dict:
+    """Apply filters, sort, paging and projection to a cached table and build the response body"""
+    selection = select_rows(table, query, equals, ranges)
+    data = table.to_records(selection.page, selection.fields)
+    return {
+        "data": data,
+        "count": len(data),
+        "total": selection.total,
+        "offset": query.offset,
+        "limit": query.limit,
+        "next_cursor": encode_cursor(selection.end, table.version) if selection.end < selection.total else None
+    }
+
+# Rows materialized per chunk when streaming; memory per request stays at one chunk
+STREAM_CHUNK_ROWS = 1000
+
+async def stream_rows(table: ColumnarTable, selection: RowSelection, fmt: str):
+    """Yield the selected rows as NDJSON lines or as pieces of one JSON array"""
+    page = selection.page if selection.page is not None else slice(0, len(table))
+    if isinstance(page, slice):
+        chunks = (slice(start, min(start + STREAM_CHUNK_ROWS, page.stop)) for start in range(page.start, page.stop, STREAM_CHUNK_ROWS))
+    else:
+        chunks = (page[start:start + STREAM_CHUNK_ROWS] for start in range(0, len(page), STREAM_CHUNK_ROWS))
+
+    if fmt == 'json':
+        yield b'['
+    first = True
+    for chunk in chunks:
+        rows = table.to_records(chunk, selection.fields)
+        if fmt == 'ndjson':
+            yield b''.join(dump_json(row) + b'\n' for row in rows)
+        elif rows:
+            yield (b'' if first else b',') + b','.join(dump_json(row) for row in rows)
+            first = False
+        # Let other requests run between chunks
+        await asyncio.sleep(0)
+    if fmt == 'json':
+        yield b']'
+
+# ==================== CACHED RESPONSES ====================
+# A snapshot's full-table body is encoded (and compressed) once, then served as
+# bytes with a strong ETag derived from the snapshot version. Clients sending a
+# matching If-None-Match get 304 without the data being re-encoded. Bodies are
+# cache entries of their own ("body:<version>:<encoding>"), so they count towards
+# the byte budget and are evicted like any other entry.
+
+response_bodies = SingleFlight()
+
+def pick_encoding(accept_encoding: Optional[str]) -> str:
+    accepted = {part.split(';')[0].strip().lower() for part in (accept_encoding or '').split(',')}
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted:
+        return 'gzip'
+    return 'identity'
+
+def body_cache_key(version: str, encoding: str) -> str:
+    return f"body:{version}:{encoding}"
+
+def _encode_table_body(table: ColumnarTable, encoding: str) -> bytes:
+    body = cache.get(body_cache_key(table.version, 'identity'))
+    if body is None:
+        data = table.to_records()
+        body = dump_json({
+            "data": data, "count": len(data), "total": len(data),
+            "offset": 0, "limit": None, "next_cursor": None
+        })
+        cache.set(body_cache_key(table.version, 'identity'), body)
+    if encoding == 'identity':
+        return body
+    if encoding == 'gzip':
+        body = gzip.compress(body, compresslevel=6)
+    elif encoding == 'br':
+        body = brotli.compress(body, quality=5)
+    cache.set(body_cache_key(table.version, encoding), body)
+    return body
+
+async def table_body(table: ColumnarTable, encoding: str) -> bytes:
+    """Pre-encoded full-table body, built once per snapshot and encoding off the event loop"""
+    body = cache.get(body_cache_key(table.version, encoding))
+    if body is None:
+        body = await response_bodies.do(
+            f"{table.version}:{encoding}", lambda: asyncio.to_thread(_encode_table_body, table, encoding)
+        )
+    return body
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get('if-none-match')
+    if not header:
+        return False
+    tags = [t.strip() for t in header.split(',')]
+    return '*' in tags or etag in tags or f"W/{etag}" in tags
+
+async def table_response(
+    request: Request,
+    table: ColumnarTable,
+    query: Optional[TableQuery] = None,
+    equals: Optional[Dict[str, List[str]]] = None,
+    ranges: Optional[Dict[str, tuple]] = None
+) -> Response:
+    """Serve a table snapshot (or a query over it) as JSON bytes with ETag revalidation.
+
+    Without query parameters the pre-encoded full body is served; otherwise the
+    query is run against the snapshot, streamed if ``query.stream`` is set.
+    """
+    variant = '&'.join(f"{k}={v}" for k, v in sorted(request.query_params.multi_items()))
+    encoding = pick_encoding(request.headers.get('accept-encoding')) if not variant else 'identity'
+    tag = table.version
+    if variant:
+        tag += '-' + hashlib.blake2b(variant.encode('utf-8'), digest_size=6).hexdigest()
+    if encoding != 'identity':
+        tag += '-' + encoding
+    etag = f'"{tag}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache", "Vary": "Accept-Encoding"}
+
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    if variant and query is not None and query.stream:
+        selection = select_rows(table, query, equals, ranges)
+        headers["X-Total-Count"] = str(selection.total)
+        media_type = "application/x-ndjson" if query.stream == 'ndjson' else "application/json"
+        return StreamingResponse(stream_rows(table, selection, query.stream), media_type=media_type, headers=headers)
+    if variant and query is not None:
+        body = dump_json(query_table(table, query, equals, ranges))
+    else:
+        body = await table_body(table, encoding)
+        if encoding != 'identity':
+            headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type="application/json", headers=headers)
+
 # ==================== SUPABASE DATA ENDPOINTS ====================
 
 @api_router.get("/data/high-risk-sites")
-async def get_high_risk_sites(current_user: dict = Depends(get_current_user_hybrid)):
-    if not supabase:
+async def get_high_risk_sites(request: Request, current_user: dict = Depends(get_current_user_hybrid)):
+    if not data_source_configured():
         raise HTTPException(status_code=503, detail="Supabase not configured. Please add SUPABASE_URL and SUPABASE_KEY to environment variables.")
     try:
-        data = await fetch_all_supabase_data('High Risk Sites')
-        return {"data": data, "count": len(data)}
+        table = await fetch_all_supabase_data('High Risk Sites')
+        return await table_response(request, table)
     except Exception as e:
         logger.error(f"Error fetching high risk sites: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error fetching data: {str(e)}")
 
 @api_router.get("/data/patient-level")
-async def get_patient_level_data(current_user: dict = Depends(get_current_user_hybrid)):
-    if not supabase:
+async def get_patient_level_data(
+    request: Request,
+    query: TableQuery = Depends(),
+    site_id: Optional[str] = Query(None, description="Comma-separated Site_IDs"),
+    country: Optional[str] = Query(None, description="Comma-separated countries"),
+    status: Optional[str] = Query(None, description="Clean_Patient_Status, e.g. Clean or Not Clean"),
+    dqi_min: Optional[float] = None,
+    dqi_max: Optional[float] = None,
+    current_user: dict = Depends(get_current_user_hybrid)
+):
+    if not data_source_configured():
         raise HTTPException(status_code=503, detail="Supabase not configured. Please add SUPABASE_URL and SUPABASE_KEY to environment variables.")
     try:
-        data = await fetch_all_supabase_data('Patient Data')
-        return {"data": data, "count": len(data)}
+        table = await fetch_all_supabase_data('Patient Data')
+        return await table_response(
+            request, table, query,
+            equals={'Site_ID': _split_param(site_id), 'Country': _split_param(country), 'Clean_Patient_Status': _split_param(status)},
+            ranges={'Data_Quality_Index': (dqi_min, dqi_max)}
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error fetching patient data: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error fetching data: {str(e)}")
 
 @api_router.get("/data/site-level")
-async def get_site_level_data(current_user: dict = Depends(get_current_user_hybrid)):
-    if not supabase:
+async def get_site_level_data(
+    request: Request,
+    query: TableQuery = Depends(),
+    site_id: Optional[str] = Query(None, description="Comma-separated Site_IDs"),
+    country: Optional[str] = Query(None, description="Comma-separated countries"),
+    risk_level: Optional[str] = Query(None, description="Comma-separated Risk_Levels"),
+    dqi_min: Optional[float] = None,
+    dqi_max: Optional[float] = None,
+    current_user: dict = Depends(get_current_user_hybrid)
+):
+    if not data_source_configured():
         raise HTTPException(status_code=503, detail="Supabase not configured. Please add SUPABASE_URL and SUPABASE_KEY to environment variables.")
     try:
-        data = await fetch_all_supabase_data('Sites Data')
-        return {"data": data, "count": len(data)}
+        table = await fetch_all_supabase_data('Sites Data')
+        return await table_response(
+            request, table, query,
+            equals={'Site_ID': _split_param(site_id), 'Country': _split_param(country), 'Risk_Level': _split_param(risk_level)},
+            ranges={'Avg_DQI': (dqi_min, dqi_max)}
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error fetching site data: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error fetching data: {str(e)}")
 
+async def find_rows(table_name: str, key_column: str, key: str, study: Optional[str] = None) -> tuple:
+    """(table, positions) of the rows matching a primary key, looked up through its hash index"""
+    table = await fetch_all_supabase_data(table_name)
+    if not table.has(key_column):
+        return table, np.empty(0, dtype=np.int64)
+    if study is not None:
+        return table, table.index('Study', key_column).get((study, key))
+    return table, table.index(key_column).get((key,))
+
+async def find_site(site_id: str, study: Optional[str] = None) -> Optional[dict]:
+    """One site record by Site_ID (and Study when Site_IDs repeat across studies)"""
+    sites, positions = await find_rows('Sites Data', 'Site_ID', site_id, study)
+    if not len(positions):
+        return None
+    if len(positions) > 1:
+        studies = ', '.join(sorted(str(s) for s in sites.columns['Study'].to_list(positions)))
+        raise HTTPException(status_code=409, detail=f"Site {site_id} exists in several studies ({studies}); pass study")
+    return sites.to_records(positions)[0]
+
+@api_router.get("/data/sites/{site_id}")
+async def get_site(
+    site_id: str,
+    study: Optional[str] = None,
+    include_patients: bool = True,
+    current_user: dict = Depends(get_current_user_hybrid)
+):
+    if not data_source_configured():
+        raise HTTPException(status_code=503, detail="Supabase not configured")
+    try:
+        site = await find_site(site_id, study)
+        if site is None:
+            raise HTTPException(status_code=404, detail="Site not found")
+        body = {"site": site}
+        if include_patients:
+            patients = await fetch_all_supabase_data('Patient Data')
+            positions = patients.index('Study', 'Site_ID').get((site.get('Study'), site_id)) if patients.has('Site_ID') else []
+            body["patients"] = patients.to_records(positions) if len(positions) else []
+            body["patient_count"] = len(body["patients"])
+        return body
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error fetching site {site_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@api_router.get("/data/patients/{subject_id}")
+async def get_patient(
+    subject_id: str,
+    study: Optional[str] = None,
+    current_user: dict = Depends(get_current_user_hybrid)
+):
+    if not data_source_configured():
+        raise HTTPException(status_code=503, detail="Supabase not configured")
+    try:
+        patients, positions = await find_rows('Patient Data', 'Subject_ID', subject_id, study)
+        if not len(positions):
+            raise HTTPException(status_code=404, detail="Patient not found")
+        if len(positions) > 1:
+            raise HTTPException(status_code=409, detail=f"Subject {subject_id} exists in several studies; pass study")
+        return patients.to_records(positions)[0]
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error fetching patient {subject_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+RANKING_TABLES = {'sites': 'Sites Data', 'patients': 'Patient Data'}
+
+def top_k(table: ColumnarTable, metric: str, k: int, descending: bool) -> np.ndarray:
+    """Positions of the k best rows by ``metric`` from its rank index; rows missing the metric are skipped"""
+    head = table.order_by(metric, descending)[:k]
+    # Missing values sort last, so only the tail of the slice can hold them
+    return head[~table.columns[metric].isnull(head)]
+
+@api_router.get("/data/rankings")
+async def get_rankings(
+    request: Request,
+    metric: str = Query('Risk_Score', description="Column to rank by"),
+    k: int = Query(10, ge=1, le=1000),
+    order: Optional[str] = Query(None, pattern="^(asc|desc)$", description="Defaults to worst first for the metric"),
+    table: str = Query('sites', pattern="^(sites|patients)$"),
+    fields: Optional[str] = Query(None, description="Comma-separated columns to return"),
+    current_user: dict = Depends(get_current_user_hybrid)
+):
+    if not data_source_configured():
+        raise HTTPException(status_code=503, detail="Supabase not configured")
+    table_name = RANKING_TABLES[table]
+    rankable = TABLE_RANKINGS[table_name]
+    if metric not in rankable:
+        raise HTTPException(status_code=400, detail=f"Unknown ranking metric: {metric}. Use one of {', '.join(rankable)}")
+    try:
+        data = await fetch_all_supabase_data(table_name)
+        if not data.has(metric):
+            raise HTTPException(status_code=400, detail=f"{table_name} has no {metric} column")
+        field_list = _split_param(fields)
+        unknown = [f for f in field_list if not data.has(f)]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+
+        descending = rankable[metric] if order is None else order == 'desc'
+        etag = f'"rank-{data.version}-{hashlib.blake2b(str(request.url.query).encode(), digest_size=6).hexdigest()}"'
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+        if etag_matches(request, etag):
+            return Response(status_code=304, headers=headers)
+
+        positions = top_k(data, metric, k, descending)
+        rows = data.to_records(positions, field_list or None)
+        for rank, row in enumerate(rows, start=1):
+            row["rank"] = rank
+        body = {
+            "metric": metric,
+            "order": 'desc' if descending else 'asc',
+            "k": k,
+            "version": data.version,
+            "data": rows
+        }
+        return Response(content=dump_json(body), media_type="application/json", headers=headers)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error ranking {table_name} by {metric}: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# ==================== DASHBOARD AGGREGATES ====================
+# KPIs and chart series are computed once per pair of snapshot versions and cached,
+# so dashboard requests never rescan the tables.
+
+DASHBOARD_DIMENSIONS = ['Study', 'Region', 'Country']
+DASHBOARD_TOP_SITES = 10
+dashboard_builds = SingleFlight()
+
+def _round(value: float, digits: int = 2):
+    return None if value is None or np.isnan(value) else round(float(value), digits)
+
+def _breakdown(sites: ColumnarTable, patients: ColumnarTable, dimension: str) -> List[dict]:
+    """Site and patient KPIs grouped by one dimension column, via the aggregate engine"""
+    group_by = [dimension]
+    site_groups = aggregate_table(sites, group_by, [
+        ('sites', 'count', None, None),
+        ('open_issues', 'sum', 'Total_Open_Issues', None),
+        ('avg_dqi', 'mean', 'Avg_DQI', None)
+    ])
+    high_risk = aggregate_table(sites, group_by, [('high_risk_sites', 'count', None, None)],
+                                np.flatnonzero(sites.mask_eq('Risk_Level', 'High')))
+    patient_groups = aggregate_table(patients, group_by, [('patients', 'count', None, None)])
+    clean = aggregate_table(patients, group_by, [('clean_patients', 'count', None, None)],
+                            np.flatnonzero(patients.mask_eq('Clean_Patient_Status', 'Clean')))
+
+    groups: Dict[Any, dict] = {}
+    for rows in (site_groups, high_risk, patient_groups, clean):
+        for row in rows:
+            name = row.pop(dimension)
+            groups.setdefault(name, {"name": name}).update(row)
+    for group in groups.values():
+        for field in ('sites', 'high_risk_sites', 'open_issues', 'patients', 'clean_patients'):
+            group[field] = int(group.get(field) or 0)
+        group["avg_dqi"] = _round(group.get("avg_dqi"))
+        group["clean_patient_percentage"] = (
+            _round(group["clean_patients"] / group["patients"] * 100) if group["patients"] else 0
+        )
+    return sorted(groups.values(), key=lambda g: (-g["sites"], str(g["name"])))
+
+def compute_dashboard_bundle(sites: ColumnarTable, patients: ColumnarTable) -> dict:
+    """Dashboard KPIs, chart series and per-dimension breakdowns for one pair of snapshots"""
+    total_sites = len(sites)
+    total_patients = len(patients)
+    avg_dqi = float(sites.numeric('Avg_DQI', fill=0).sum()) / total_sites if total_sites > 0 else 0
+    clean_patients = patients.count_eq('Clean_Patient_Status', 'Clean')
+    clean_patient_percentage = (clean_patients / total_patients * 100) if total_patients > 0 else 0
+    kpis = {
+        "total_sites": total_sites,
+        "total_patients": total_patients,
+        "high_risk_sites": sites.count_eq('Risk_Level', 'High'),
+        "avg_dqi": round(avg_dqi, 2),
+        "clean_patient_percentage": round(clean_patient_percentage, 2),
+        "clean_patients": clean_patients
+    }
+
+    risk_distribution = [{"name": name, "value": value} for name, value in sites.value_counts('Risk_Level').items()]
+
+    top_sites = []
+    if total_sites and sites.has('Risk_Score'):
+        order = top_k(sites, 'Risk_Score', DASHBOARD_TOP_SITES, descending=True)
+        fields = ['Study', 'Site_ID', 'Country', 'Risk_Score', 'Risk_Level', 'Avg_DQI', 'Total_Open_Issues', 'Total_Subjects']
+        top_sites = sites.to_records(order, fields)
+
+    dqi = patients.numeric('Data_Quality_Index')
+    counts, edges = np.histogram(dqi[~np.isnan(dqi)], bins=np.arange(0, 101, 10))
+    dqi_buckets = [
+        {"range": f"{int(low)}-{int(high)}", "count": int(count)}
+        for low, high, count in zip(edges[:-1], edges[1:], counts)
+    ]
+
+    return {
+        "version": f"{sites.version}-{patients.version}",
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "kpis": kpis,
+        "risk_distribution": risk_distribution,
+        "top_sites": top_sites,
+        "dqi_buckets": dqi_buckets,
+        "breakdowns": {dimension: _breakdown(sites, patients, dimension) for dimension in DASHBOARD_DIMENSIONS}
+    }
+
+async def get_dashboard_bundle() -> dict:
+    """Dashboard bundle for the current snapshots, computed at most once per version pair"""
+    sites = await fetch_all_supabase_data('Sites Data')
+    patients = await fetch_all_supabase_data('Patient Data')
+    key = f"dashboard:{sites.version}-{patients.version}"
+    bundle = cache.get(key)
+    if bundle is None:
+        async def build():
+            result = await asyncio.to_thread(compute_dashboard_bundle, sites, patients)
+            # Keyed by snapshot versions, so it can never be out of date; LRU drops old ones
+            cache.set(key, result, ttl=24 * 3600)
+            return result
+        bundle = await dashboard_builds.do(key, build)
+    return bundle
+
+@api_router.get("/data/dashboard")
+async def get_dashboard(request: Request, current_user: dict = Depends(get_current_user_hybrid)):
+    """KPIs, risk distribution, top sites, DQI buckets and Study/Region/Country breakdowns in one response"""
+    if not data_source_configured():
+        raise HTTPException(status_code=503, detail="Supabase not configured")
+    try:
+        bundle = await get_dashboard_bundle()
+        etag = f'"{bundle["version"]}"'
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+        if etag_matches(request, etag):
+            return Response(status_code=304, headers=headers)
+        return Response(content=dump_json(bundle), media_type="application/json", headers=headers)
+    except Exception as e:
+        logger.error(f"Error building dashboard bundle: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @api_router.get("/data/dashboard-stats")
 async def get_dashboard_stats(current_user: dict = Depends(get_current_user_hybrid)):
-    if not supabase:
+    if not data_source_configured():
         raise HTTPException(status_code=503, detail="Supabase not configured")
     try:
-        sites = await fetch_all_supabase_data('Sites Data')
-        patients = await fetch_all_supabase_data('Patient Data')
-        
-        high_risk_count = len([s for s in sites if s.get('Risk_Level') == 'High'])
-        total_sites = len(sites)
-        total_patients = len(patients)
-        avg_dqi = sum([s.get('Avg_DQI', 0) for s in sites]) / total_sites if total_sites > 0 else 0
-        clean_patients = len([p for p in patients if p.get('Clean_Patient_Status') == 'Clean'])
-        clean_patient_percentage = (clean_patients / total_patients * 100) if total_patients > 0 else 0
-        
-        return {
-            "total_sites": total_sites,
-            "total_patients": total_patients,
-            "high_risk_sites": high_risk_count,
-            "avg_dqi": round(avg_dqi, 2),
-            "clean_patient_percentage": round(clean_patient_percentage, 2),
-            "clean_patients": clean_patients
-        }
+        bundle = await get_dashboard_bundle()
+        return bundle["kpis"]
     except Exception as e:
         logger.error(f"Error calculating dashboard stats: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# ==================== GROUP-BY AGGREGATION ====================
+# One vectorized engine for breakdowns ("mean Avg_DQI by Country", "sum of open issues
+# by Site_ID", ...). Results are cached per table snapshot version and query.
+
+AGGREGATE_TABLES = {'patients': 'Patient Data', 'sites': 'Sites Data', 'high-risk-sites': 'High Risk Sites'}
+AGGREGATE_FUNCTIONS = ('count', 'sum', 'mean', 'min', 'max', 'median')
+AGGREGATE_MAX_GROUPS = int(os.getenv('AGGREGATE_MAX_GROUPS', '100000'))
+_FILTER_PATTERN = re.compile(r'^\s*([\w ]+?)\s*(>=|<=|=)\s*(.*)$')
+
+def parse_metric(spec: str) -> tuple:
+    """'count', 'mean:Avg_DQI' or 'p90:Risk_Score' -> (output name, function, column, quantile)"""
+    func, _, column = spec.partition(':')
+    func = func.strip().lower()
+    column = column.strip() or None
+    if func == 'count' and column is None:
+        return 'count', 'count', None, None
+    if column is None:
+        raise HTTPException(status_code=400, detail=f"Metric '{spec}' needs a column, e.g. {func}:Avg_DQI")
+    if func in AGGREGATE_FUNCTIONS:
+        quantile = 0.5 if func == 'median' else None
+        return f"{func}_{column}", func, column, quantile
+    match = re.fullmatch(r'p(\d{1,2}(?:\.\d+)?|100)', func)
+    if match:
+        return f"{func}_{column}", 'percentile', column, float(match.group(1)) / 100
+    raise HTTPException(status_code=400, detail=f"Unknown metric function: {func}")
+
+def parse_filters(filters: List[str], table: Optional[ColumnarTable] = None) -> tuple:
+    """'Country=USA,IND', 'Avg_DQI>=50', 'Avg_DQI<=80' -> (equals, ranges) for select_rows.
+
+    With ``table``, range filters on its non-numeric columns are rejected.
+    """
+    equals: Dict[str, List[str]] = {}
+    ranges: Dict[str, list] = {}
+    for item in filters:
+        match = _FILTER_PATTERN.match(item)
+        if not match:
+            raise HTTPException(status_code=400, detail=f"Invalid filter: {item}")
+        column, op, value = match.groups()
+        if op == '=':
+            equals.setdefault(column, []).extend(_split_param(value))
+            continue
+        try:
+            bound = float(value)
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Filter bound must be numeric: {item}")
+        if table is not None and table.has(column) and table.columns[column].kind not in ('int', 'float'):
+            raise HTTPException(status_code=400, detail=f"Range filter on non-numeric column: {column}")
+        low, high = ranges.get(column, [None, None])
+        ranges[column] = [bound, high] if op == '>=' else [low, bound]
+    return equals, {k: tuple(v) for k, v in ranges.items()}
+
+def aggregate_table(
+    table: ColumnarTable,
+    group_by: List[str],
+    metrics: List[tuple],
+    rows: Optional[np.ndarray] = None
+) -> List[dict]:
+    """Group ``rows`` (all rows if None) of a table and compute parsed metrics per group.
+
+    Sums/means use bincount; min/max/percentiles use one (group, value) lexsort per
+    column, so nothing loops over rows in Python. Missing values are ignored.
+    """
+    codes, keys = table.group_keys(group_by, rows)
+    if len(codes) == 0:
+        return []
+    if len(keys) > AGGREGATE_MAX_GROUPS:
+        raise HTTPException(status_code=400, detail=f"Too many groups ({len(keys)}); narrow the filters or group_by")
+    k = len(keys)
+    results: Dict[str, np.ndarray] = {}
+    ordered_columns: Dict[str, tuple] = {}
+
+    for output, func, column, quantile in metrics:
+        if func == 'count':
+            results[output] = np.bincount(codes, minlength=k)
+            continue
+        values = table.numeric(column)
+        if rows is not None:
+            values = values[rows]
+        valid = ~np.isnan(values)
+        present = np.bincount(codes, weights=valid, minlength=k)
+        if func in ('sum', 'mean'):
+            total = np.bincount(codes, weights=np.where(valid, values, 0), minlength=k)
+            if func == 'sum':
+                results[output] = total
+            else:
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    results[output] = total / present
+            continue
+
+        if column not in ordered_columns:
+            group_of, sorted_values = codes[valid], values[valid]
+            order = np.lexsort((sorted_values, group_of))
+            counts = np.bincount(group_of, minlength=k)
+            starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+            ordered_columns[column] = (sorted_values[order], starts, counts)
+        sorted_values, starts, counts = ordered_columns[column]
+        q = {'min': 0.0, 'max': 1.0}.get(func, quantile)
+        position = starts + q * np.maximum(counts - 1, 0)
+        lower = np.floor(position).astype(np.int64)
+        upper = np.ceil(position).astype(np.int64)
+        out = np.full(k, np.nan)
+        has = counts > 0
+        if has.any():
+            lo, hi = sorted_values[lower[has]], sorted_values[upper[has]]
+            out[has] = lo + (hi - lo) * (position[has] - lower[has])
+        results[output] = out
+
+    groups = []
+    for i, key in enumerate(keys):
+        group = dict(zip(group_by, key))
+        for output, values in results.items():
+            value = values[i]
+            if isinstance(value, np.floating):
+                value = None if np.isnan(value) else float(value)
+            else:
+                value = int(value)
+            group[output] = value
+        groups.append(group)
+    return groups
+
+def run_aggregate(
+    table: ColumnarTable,
+    group_by: List[str],
+    metric_specs: List[str],
+    filters: List[str],
+    sort: Optional[str] = None,
+    limit: Optional[int] = None
+) -> dict:
+    """Validate and run an aggregate query against one table snapshot"""
+    metrics = [parse_metric(spec) for spec in (metric_specs or ['count'])]
+    equals, ranges = parse_filters(filters, table)
+    referenced = set(group_by) | set(equals) | set(ranges) | {m[2] for m in metrics if m[2]}
+    unknown = sorted(name for name in referenced if not table.has(name))
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown columns: {', '.join(unknown)}")
+
+    selection = select_rows(table, TableQuery(limit=None, offset=0, cursor=None, sort=None, fields=None, stream=None), equals, ranges)
+    rows = None if selection.page is None else np.asarray(selection.page)
+    groups = aggregate_table(table, group_by, metrics, rows)
+
+    if sort:
+        name = sort.lstrip('-')
+        if groups and name not in groups[0]:
+            raise HTTPException(status_code=400, detail=f"Unknown sort key: {name}")
+        present = [g for g in groups if g.get(name) is not None]
+        missing = [g for g in groups if g.get(name) is None]
+        present.sort(key=lambda g: g[name], reverse=sort.startswith('-'))
+        groups = present + missing
+    total = len(groups)
+    if limit is not None:
+        groups = groups[:limit]
+    return {
+        "group_by": group_by,
+        "metrics": [m[0] for m in metrics],
+        "rows": selection.total,
+        "total_groups": total,
+        "groups": groups
+    }
+
+async def cached_aggregate(
+    table_key: str,
+    group_by: List[str],
+    metric_specs: List[str],
+    filters: List[str],
+    sort: Optional[str] = None,
+    limit: Optional[int] = None
+) -> dict:
+    """run_aggregate over a cached table, memoized per snapshot version"""
+    table = await fetch_all_supabase_data(AGGREGATE_TABLES[table_key])
+    signature = dump_json([group_by, metric_specs, sorted(filters), sort, limit])
+    key = f"aggregate:{table.version}:{hashlib.blake2b(signature, digest_size=8).hexdigest()}"
+    result = cache.get(key)
+    if result is None:
+        async def build():
+            body = await asyncio.to_thread(run_aggregate, table, group_by, metric_specs, filters, sort, limit)
+            body["version"] = table.version
+            # Keyed by snapshot version, so it is never stale; LRU evicts old versions
+            cache.set(key, body, ttl=24 * 3600)
+            return body
+        result = await response_bodies.do(key, build)
+    return result
+
+@api_router.get("/data/aggregate")
+async def get_aggregate(
+    request: Request,
+    table: str = Query('patients', pattern="^(patients|sites|high-risk-sites)$"),
+    group_by: Optional[str] = Query(None, description="Comma-separated columns to group by (omit for one overall group)"),
+    metrics: Optional[str] = Query(
+        None, description="Comma-separated metrics: count, sum:COL, mean:COL, min:COL, max:COL, median:COL, p90:COL"
+    ),
+    filters: List[str] = Query([], alias="filter", description="Repeatable: COL=v1,v2 or COL>=x or COL<=x"),
+    sort: Optional[str] = Query(None, description="Output key to sort groups by, prefix with '-' for descending"),
+    limit: Optional[int] = Query(None, ge=1),
+    current_user: dict = Depends(get_current_user_hybrid)
+):
+    if not data_source_configured():
+        raise HTTPException(status_code=503, detail="Supabase not configured")
+    try:
+        body = await cached_aggregate(table, _split_param(group_by), _split_param(metrics), filters, sort, limit)
+        etag = f'"agg-{body["version"]}-{hashlib.blake2b(str(request.url.query).encode(), digest_size=6).hexdigest()}"'
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+        if etag_matches(request, etag):
+            return Response(status_code=304, headers=headers)
+        return Response(content=dump_json(body), media_type="application/json", headers=headers)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error running aggregate on {table}: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# ==================== KEYSET PAGINATION ====================
+# Alerts, comments and tags are listed newest first and paged by the (created_at, id) of
+# the last row returned, so every page is one index range scan however deep it is.
+# The cursor for the next page is sent in the X-Next-Cursor header.
+# created_at is stored as a BSON date; rows written before that hold ISO strings until
+# migrate_datetimes.py has rewritten them.
+
+PAGE_SIZE_DEFAULT = 100
+PAGE_SIZE_MAX = 1000
+KEYSET_SORT = [("created_at", -1), ("id", -1)]
+
+def encode_keyset_cursor(doc: dict) -> str:
+    created_at = doc['created_at']
+    key = {"id": doc['id']}
+    if isinstance(created_at, datetime):
+        key["created_at"], key["datetime"] = created_at.isoformat(), True
+    else:
+        key["created_at"] = created_at
+    return base64.urlsafe_b64encode(json.dumps(key).encode('utf-8')).decode('ascii')
+
+def decode_keyset_cursor(cursor: str) -> tuple:
+    """(created_at, id) of the row a page continues after"""
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        created_at = datetime.fromisoformat(key["created_at"]) if key.get("datetime") else key["created_at"]
+        return created_at, str(key["id"])
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+async def find_page(collection, query: dict, limit: int, cursor: Optional[str], response: Response) -> List[dict]:
+    """One newest-first page of ``query`` after ``cursor``, setting X-Next-Cursor if more rows follow"""
+    if cursor:
+        created_at, last_id = decode_keyset_cursor(cursor)
+        after = [
+            {"created_at": {"$lt": created_at}},
+            {"created_at": created_at, "id": {"$lt": last_id}}
+        ]
+        if isinstance(created_at, datetime):
+            # Comparisons never cross BSON types and strings sort below dates, so
+            # unmigrated rows all come after the last date
+            after.append({"created_at": {"$type": "string"}})
+        query = {"$and": [query, {"$or": after}]}
+    # One extra row tells whether there is a next page
+    docs = await collection.find(query, {"_id": 0}).sort(KEYSET_SORT).limit(limit + 1).to_list(limit + 1)
+    if len(docs) > limit:
+        docs = docs[:limit]
+        response.headers["X-Next-Cursor"] = encode_keyset_cursor(docs[-1])
+    return docs
+
 # ==================== ALERTS ENDPOINTS ====================
 
 @api_router.post("/alerts", response_model=Alert)
 async def create_alert(alert_data: AlertCreate, current_user: dict = Depends(get_current_user_hybrid)):
     alert = Alert(**alert_data.model_dump(), created_by=current_user['id'])
     doc = alert.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
     await db.alerts.insert_one(doc)
     
-    # Send email notification to the creator (current user)
-    # Background task would be better for production, but direct call is fine for now
+    # Notify the creator (current user) through the outbox; delivery happens in the background
     try:
         current_user_email = current_user.get('email')
-        logger.info(f"Attempting to send email to: {current_user_email}")
-        
         if current_user_email:
-            send_email_notification(current_user_email, doc)
+            await enqueue_alert_email(current_user_email, doc)
         else:
             logger.warning("Could not send email: User email not found in current_user object")
             logger.warning(f"Current User Object: {current_user}")
     except Exception as e:
-        logger.error(f"Error in email notification flow: {str(e)}")
+        logger.error(f"Error queueing email notification: {str(e)}")
 
     return alert
 
 @api_router.get("/alerts", response_model=List[Alert])
-async def get_alerts(status: Optional[str] = None, current_user: dict = Depends(get_current_user_hybrid)):
+async def get_alerts(
+    response: Response,
+    status: Optional[str] = None,
+    limit: int = Query(PAGE_SIZE_DEFAULT, ge=1, le=PAGE_SIZE_MAX),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor from the previous page"),
+    current_user: dict = Depends(get_current_user_hybrid)
+):
     query = {}
     if status:
         query['status'] = status
-    alerts = await db.alerts.find(query, {"_id": 0}).sort("created_at", -1).to_list(100)
-    for alert in alerts:
-        if isinstance(alert['created_at'], str):
-            alert['created_at'] = datetime.fromisoformat(alert['created_at'])
-    return alerts
+    return await find_page(db.alerts, query, limit, cursor, response)
 
 @api_router.patch("/alerts/{alert_id}/status")
 async def update_alert_status(alert_id: str, status: str, current_user: dict = Depends(get_current_user_hybrid)):
@@ -613,17 +2706,19 @@ async def update_alert_status(alert_id: str, status: str, current_user: dict = D
 async def create_comment(comment_data: CommentCreate, current_user: dict = Depends(get_current_user_hybrid)):
     comment = Comment(**comment_data.model_dump(), created_by=current_user['id'])
     doc = comment.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
     await db.comments.insert_one(doc)
     return comment
 
 @api_router.get("/comments/{entity_type}/{entity_id}", response_model=List[Comment])
-async def get_comments(entity_type: str, entity_id: str, current_user: dict = Depends(get_current_user_hybrid)):
-    comments = await db.comments.find({"entity_type": entity_type, "entity_id": entity_id}, {"_id": 0}).sort("created_at", -1).to_list(100)
-    for comment in comments:
-        if isinstance(comment['created_at'], str):
-            comment['created_at'] = datetime.fromisoformat(comment['created_at'])
-    return comments
+async def get_comments(
+    entity_type: str,
+    entity_id: str,
+    response: Response,
+    limit: int = Query(PAGE_SIZE_DEFAULT, ge=1, le=PAGE_SIZE_MAX),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor from the previous page"),
+    current_user: dict = Depends(get_current_user_hybrid)
+):
+    return await find_page(db.comments, {"entity_type": entity_type, "entity_id": entity_id}, limit, cursor, response)
 
 # ==================== TAGS ENDPOINTS ====================
 
@@ -631,23 +2726,22 @@ async def get_comments(entity_type: str, entity_id: str, current_user: dict = De
 async def create_tag(tag_data: TagCreate, current_user: dict = Depends(get_current_user_hybrid)):
     tag = Tag(**tag_data.model_dump(), created_by=current_user['id'])
     doc = tag.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
     await db.tags.insert_one(doc)
     return tag
 
 @api_router.get("/tags/{entity_type}/{entity_id}", response_model=List[Tag])
-async def get_tags(entity_type: str, entity_id: str, current_user: dict = Depends(get_current_user_hybrid)):
-    tags = await db.tags.find({"entity_type": entity_type, "entity_id": entity_id}, {"_id": 0}).to_list(100)
-    for tag in tags:
-        if isinstance(tag['created_at'], str):
-            tag['created_at'] = datetime.fromisoformat(tag['created_at'])
-    return tags
+async def get_tags(
+    entity_type: str,
+    entity_id: str,
+    response: Response,
+    limit: int = Query(PAGE_SIZE_DEFAULT, ge=1, le=PAGE_SIZE_MAX),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor from the previous page"),
+    current_user: dict = Depends(get_current_user_hybrid)
+):
+    return await find_page(db.tags, {"entity_type": entity_type, "entity_id": entity_id}, limit, cursor, response)
 
 # ==================== AI ENDPOINTS ====================
 
-from fastapi.responses import StreamingResponse
-import json
-
 @api_router.post("/ai/query")
 async def ai_natural_language_query(request: AIQueryRequest, current_user: dict = Depends(get_current_user_hybrid)):
     if not client_openai and not client_openrouter:
@@ -668,12 +2762,12 @@ async def ai_natural_language_query(request: AIQueryRequest, current_user: dict
         
         # 0. Recent Activity (MongoDB)
         try:
-            recent_alerts = await db.alerts.find({}, {"_id": 0}).sort("created_at", -1).limit(10).to_list(10)
+            recent_alerts = await db.alerts.find({}, {"_id": 0}).sort(KEYSET_SORT).limit(10).to_list(10)
             if recent_alerts:
-                full_context += f"\n\n[RECENT TIMELINE/ALERTS]: {json.dumps(recent_alerts)}"
+                full_context += f"\n\n[RECENT TIMELINE/ALERTS]: {json.dumps(recent_alerts, default=str)}"
         except Exception: pass
 
-        if not supabase:
+        if not data_source_configured():
              full_context += "\n\nCRITICAL: Supabase is NOT configured. Advise user to check their environment variables."
         else:
             try:
@@ -683,40 +2777,33 @@ async def ai_natural_language_query(request: AIQueryRequest, current_user: dict
                 
                 total_sites = len(sites_all)
                 total_patients = len(patients_all)
-                avg_dqi = sum([s.get('Avg_DQI', 0) for s in sites_all]) / total_sites if total_sites > 0 else 0
-                high_risk_sites = [s for s in sites_all if s.get('Risk_Level') == 'High']
+                avg_dqi = float(sites_all.numeric('Avg_DQI', fill=0).sum()) / total_sites if total_sites > 0 else 0
                 
                 stats = {
                     "total_sites": total_sites,
                     "total_patients": total_patients,
-                    "high_risk_sites_count": len(high_risk_sites),
+                    "high_risk_sites_count": sites_all.count_eq('Risk_Level', 'High'),
                     "average_dqi": round(avg_dqi, 2),
                     "monitoring_status": "ACTIVE_LIVE"
                 }
                 full_context += f"\n\n[GLOBAL STUDY STATS]: {json.dumps(stats)}"
                 
                 # 2. Risk Profile
-                risk_dist = {}
-                for s in sites_all:
-                    l = s.get('Risk_Level', 'Unknown')
-                    risk_dist[l] = risk_dist.get(l, 0) + 1
+                risk_dist = sites_all.value_counts('Risk_Level')
                 full_context += f"\n\n[STUDY RISK PROFILE]: {json.dumps(risk_dist)}"
 
                 # 3. Comprehensive Site Manifest
-                site_manifest = []
-                for s in sites_all:
-                    # Provide enough fields for identification but keep it compact
-                    site_manifest.append({
-                        "id": s.get('Site_ID'), 
-                        "risk": s.get('Risk_Level'), 
-                        "dqi": s.get('Avg_DQI'), 
-                        "country": s.get('Country'),
-                        "subjects": s.get('Total_Subjects')
-                    })
+                # Provide enough fields for identification but keep it compact
+                manifest_fields = {"id": 'Site_ID', "risk": 'Risk_Level', "dqi": 'Avg_DQI', "country": 'Country', "subjects": 'Total_Subjects'}
+                manifest_columns = [
+                    sites_all.columns[f].to_list() if sites_all.has(f) else [None] * total_sites
+                    for f in manifest_fields.values()
+                ]
+                site_manifest = [dict(zip(manifest_fields, row)) for row in zip(*manifest_columns)]
                 full_context += f"\n\n[SITE MASTER LIST]: {json.dumps(site_manifest)}"
                 
                 # 4. Patient Samples
-                full_context += f"\n\n[PATIENT QUALITY SAMPLES]: {json.dumps(patients_all[:15])}"
+                full_context += f"\n\n[PATIENT QUALITY SAMPLES]: {json.dumps(patients_all.to_records(slice(0, 15)))}"
                 
                 logger.info(f"Neural Context Ready: {total_sites} sites, {total_patients} patients analyzed.")
                 
@@ -787,6 +2874,11 @@ async def ai_generate_report(request: AIReportRequest, current_user: dict = Depe
         prompt = ""
         if request.report_type == "site_performance":
             prompt = f"Generate a comprehensive site performance report for Site {request.site_id if request.site_id else 'All Sites'}. Include data quality metrics, risk assessment, open issues, and actionable recommendations."
+            if request.site_id and data_source_configured():
+                site = await find_site(request.site_id)
+                if site is None:
+                    raise HTTPException(status_code=404, detail=f"Site {request.site_id} not found")
+                prompt += f"\n\nSite metrics: {json.dumps(site, default=str)}"
         elif request.report_type == "cra_report":
             prompt = "Generate a CRA (Clinical Research Associate) monitoring report summarizing site visits, follow-up actions, deviation counts, and query resolution status."
         elif request.report_type == "risk_analysis":
@@ -796,6 +2888,13 @@ async def ai_generate_report(request: AIReportRequest, current_user: dict = Depe
         
         if request.context:
             prompt += f"\n\nContext data: {request.context}"
+        elif request.report_type == "risk_analysis" and data_source_configured():
+            by_country = await cached_aggregate(
+                'sites', ['Country'],
+                ['count', 'mean:Risk_Score', 'mean:Avg_DQI', 'sum:Total_Open_Issues'],
+                [], sort='-mean_Risk_Score', limit=10
+            )
+            prompt += f"\n\nRisk by country (top 10 by mean risk score): {json.dumps(by_country['groups'])}"
         
         if client_openrouter:
             logger.info("Generating report with OpenRouter...")
@@ -820,6 +2919,8 @@ async def ai_generate_report(request: AIReportRequest, current_user: dict = Depe
             raise HTTPException(status_code=503, detail="AI service not configured. Check backend API keys.")
         
         return {"report": response.choices[0].message.content, "report_type": request.report_type}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"AI report generation error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Report generation failed: {str(e)}")
@@ -836,6 +2937,11 @@ async def ai_recommend_actions(site_id: Optional[str] = None, current_user: dict
             system_context += " CRITICAL: Supabase is NOT configured. You cannot provide data-driven recommendations. Inform the user that they need to configure the database first."
 
         prompt = f"Based on the clinical trial data, recommend specific actions for {'site ' + site_id if site_id else 'all sites'}. Focus on: 1) Reducing open queries, 2) Improving data quality, 3) Addressing high-risk indicators, 4) Optimizing CRA monitoring activities."
+        if site_id and data_source_configured():
+            site = await find_site(site_id)
+            if site is None:
+                raise HTTPException(status_code=404, detail=f"Site {site_id} not found")
+            prompt += f"\n\nSite metrics: {json.dumps(site, default=str)}"
         
         if client_openrouter:
             logger.info("Generating recommendations with OpenRouter...")
@@ -860,6 +2966,8 @@ async def ai_recommend_actions(site_id: Optional[str] = None, current_user: dict
             raise HTTPException(status_code=503, detail="AI service not configured. Check backend API keys.")
         
         return {"recommendations": response.choices[0].message.content}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"AI recommendations error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Recommendations failed: {str(e)}")
@@ -869,17 +2977,8 @@ async def ai_recommend_actions(site_id: Optional[str] = None, current_user: dict
 @api_router.post("/email/send-report")
 async def send_report_email(request: EmailReportRequest, current_user: dict = Depends(get_current_user_hybrid)):
     """
-    Send a generated report via email using AWS SES.
+    Queue a generated report for delivery by email (AWS SES, or the configured stand-in).
     """
-    if not ses_client or not SENDER_EMAIL:
-        logger.info(f"========== MOCK EMAIL SENT (SES Not Configured) ==========")
-        logger.info(f"To: {request.recipient_email}")
-        logger.info(f"Subject: {request.subject or f'Clinical Report: {request.report_type}'}")
-        logger.info(f"Report Type: {request.report_type}")
-        logger.info(f"Content Length: {len(request.report_content)} characters")
-        logger.info(f"==========================================================")
-        return {"message": "Email sent successfully (mock mode - SES not configured)", "mock": True}
-
     try:
         subject = request.subject or f"Clinical Data Report: {request.report_type.replace('_', ' ').title()}"
         
@@ -925,35 +3024,11 @@ This report was generated automatically.
 Requested by: {current_user.get('full_name', current_user.get('email', 'Unknown'))}
 """
 
-        response = ses_client.send_email(
-            Source=SENDER_EMAIL,
-            Destination={
-                'ToAddresses': [request.recipient_email],
-            },
-            Message={
-                'Subject': {
-                    'Data': subject,
-                    'Charset': 'UTF-8'
-                },
-                'Body': {
-                    'Text': {
-                        'Data': body_text,
-                        'Charset': 'UTF-8'
-                    },
-                    'Html': {
-                        'Data': body_html,
-                        'Charset': 'UTF-8'
-                    }
-                }
-            }
-        )
-        logger.info(f"Report email sent to {request.recipient_email} via SES. MessageId: {response['MessageId']}")
-        return {"message": "Email sent successfully", "message_id": response['MessageId']}
-    except ClientError as e:
-        logger.error(f"Failed to send report email via SES: {e.response['Error']['Message']}")
-        raise HTTPException(status_code=500, detail=f"Failed to send email: {e.response['Error']['Message']}")
+        email_id = await enqueue_email(request.recipient_email, subject, body_text, body_html)
+        logger.info(f"Report email to {request.recipient_email} queued as {email_id}")
+        return {"message": "Email queued for delivery", "email_id": email_id, "backend": EMAIL_BACKEND}
     except Exception as e:
-        logger.error(f"Unexpected error sending report email: {str(e)}")
+        logger.error(f"Unexpected error queueing report email: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to send email: {str(e)}")
 
 # ==================== FIREBASE AUTH ENDPOINTS ====================
@@ -967,8 +3042,10 @@ async def verify_firebase_token(credentials: HTTPAuthorizationCredentials = Depe
             raise HTTPException(status_code=503, detail="Firebase not configured")
         
         token = credentials.credentials
-        decoded_token = firebase_auth.verify_id_token(token)
+        decoded_token = await auth_pool.run(firebase_auth.verify_id_token, token)
         return decoded_token
+    except HTTPException:
+        raise
     except ImportError:
         raise HTTPException(status_code=503, detail="Firebase Admin SDK not installed")
     except Exception as e:
@@ -1003,6 +3080,7 @@ async def firebase_register(request: dict):
     doc['created_at'] = doc['created_at'].isoformat()
     
     await db.users.insert_one(doc)
+    invalidate_cached_user(user.id)
     
     return {"message": "User registered successfully", "user": user}
 
@@ -1035,25 +3113,46 @@ async def root():
 
 @api_router.get("/health")
 async def health_check():
-    supabase_status = "connected" if supabase else "not_configured"
+    supabase_status = "snapshot_only" if SNAPSHOT_ONLY else ("connected" if supabase else "not_configured")
     return {
         "status": "healthy",
         "database": "connected",
         "supabase": supabase_status,
         "ai_service": "configured" if client_openai else "not_configured",
-        "cache_entries": len(_cache_store)
+        "cache": cache.stats(),
+        "auth_cache": auth_cache.stats(),
+        "auth_pool": auth_pool.stats(),
+        "email": {"backend": EMAIL_BACKEND, "workers": len(_email_worker_tasks), **email_stats},
+        "supabase_loads": supabase_loads.stats(),
+        "supabase_sync": supabase_sync_state,
+        "published_version": published_version
     }
 
 @api_router.post("/cache/clear")
-async def clear_cache(current_user: dict = Depends(get_current_user_hybrid)):
-    """Clear the in-memory cache to force fresh data fetch"""
-    global _cache_store, _cache_ttl
-    cache_count = len(_cache_store)
-    _cache_store = {}
-    _cache_ttl = {}
-    logger.info(f"Cache cleared by user {current_user.get('email')}")
+async def clear_cache(namespace: Optional[str] = None, current_user: dict = Depends(get_current_user_hybrid)):
+    """Clear the in-memory cache (or one namespace, e.g. 'supabase', or 'auth' for verified tokens) to force fresh data fetch"""
+    if namespace == 'auth':
+        cache_count = auth_cache.clear()
+        _auth_keys_by_user.clear()
+    elif namespace:
+        cache_count = cache.invalidate_namespace(namespace)
+    else:
+        cache_count = cache.clear()
+    logger.info(f"Cache cleared by user {current_user.get('email')} (namespace: {namespace or 'all'})")
     return {"message": f"Cache cleared successfully", "entries_cleared": cache_count}
 
+@api_router.post("/cache/resync")
+async def resync_cache(table: Optional[str] = None, current_user: dict = Depends(get_current_user_hybrid)):
+    """Force a full reload of one table (or every warmed table), e.g. after rows were deleted"""
+    if not supabase:
+        raise HTTPException(status_code=503, detail="Supabase not configured")
+    if table and table not in WARM_TABLES:
+        raise HTTPException(status_code=400, detail=f"Unknown table: {table}. Expected one of: {', '.join(WARM_TABLES)}")
+    tables = [table] if table else WARM_TABLES
+    reloaded = await asyncio.gather(*(resync_supabase_table(t) for t in tables))
+    logger.info(f"Full resync of {', '.join(tables)} requested by user {current_user.get('email')}")
+    return {"message": "Resync complete", "tables": {t: len(result) for t, result in zip(tables, reloaded)}}
+
 # Include router
 app.include_router(api_router)
 
@@ -1081,30 +3180,62 @@ async def startup_db_client():
         try:
             # Create indexes for alerts collection
             await db.alerts.create_index("id")
-            await db.alerts.create_index("status")
-            await db.alerts.create_index([("created_at", -1)])
+            # Keyset pages, unfiltered and by status
+            await db.alerts.create_index([("created_at", -1), ("id", -1)])
+            await db.alerts.create_index([("status", 1), ("created_at", -1), ("id", -1)])
             logger.info("Created alerts indexes")
         except Exception as e:
             logger.warning(f"Failed to create alerts indexes: {e}")
         
         try:
             # Create indexes for comments collection
-            await db.comments.create_index([("entity_type", 1), ("entity_id", 1)])
+            await db.comments.create_index([("entity_type", 1), ("entity_id", 1), ("created_at", -1), ("id", -1)])
             logger.info("Created comments indexes")
         except Exception as e:
             logger.warning(f"Failed to create comments indexes: {e}")
             
         try:
             # Create indexes for tags collection
-            await db.tags.create_index([("entity_type", 1), ("entity_id", 1)])
+            await db.tags.create_index([("entity_type", 1), ("entity_id", 1), ("created_at", -1), ("id", -1)])
             logger.info("Created tags indexes")
         except Exception as e:
             logger.warning(f"Failed to create tags indexes: {e}")
+
+        try:
+            # Workers claim due messages in next_attempt_at order; digests look up by recipient
+            await db.email_outbox.create_index("id")
+            await db.email_outbox.create_index([("status", 1), ("next_attempt_at", 1)])
+            await db.email_outbox.create_index([("kind", 1), ("to", 1), ("status", 1), ("claimed_at", -1)])
+            logger.info("Created email outbox indexes")
+        except Exception as e:
+            logger.warning(f"Failed to create email outbox indexes: {e}")
             
         logger.info("MongoDB index initialization check complete")
     except Exception as e:
         logger.error(f"Global index creation failed: {e}")
 
+    # Serve the last on-disk snapshots immediately; they start out stale so the
+    # refresher reconciles them with Supabase (unless running from snapshots only)
+    for table_name in WARM_TABLES:
+        snapshot = await asyncio.to_thread(load_snapshot, table_name)
+        if snapshot is not None and len(snapshot):
+            set_cached(supabase_cache_key(table_name), snapshot, ttl=CACHE_TTL_SECONDS if SNAPSHOT_ONLY else 0)
+
+    start_email_workers()
+
+    # Warm the dashboard tables and keep refreshing them before they expire
+    global _cache_refresher_task
+    if supabase and not SNAPSHOT_ONLY:
+        _cache_refresher_task = asyncio.create_task(refresh_warm_tables_periodically())
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    if _cache_refresher_task:
+        _cache_refresher_task.cancel()
+    for task in _email_worker_tasks:
+        task.cancel()
+    client.close()
+    supabase_executor.shutdown(wait=False)
+    email_executor.shutdown(wait=False)
+    auth_pool.shutdown()
+    supabase_http_client.close()
\ No newline at end of file
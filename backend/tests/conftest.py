@@ -0,0 +1,39 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+# server.py reads these at import time; nothing connects until a query runs
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'clinical_test')
+
+import server  # noqa: E402
+
+TEST_USER = {"id": "test-user", "email": "tester@example.com", "full_name": "Test User", "role": "admin"}
+
+def make_sites(n: int) -> list:
+    """Site rows shaped like the 'Sites Data' table"""
+    return [{
+        'Study': f'Study {i % 3}',
+        'Region': ['EMEA', 'AMER', 'APAC'][i % 3],
+        'Country': ['USA', 'DEU', 'JPN', 'IND'][i % 4],
+        'Site_ID': f'Site {i:04d}',
+        'Total_Subjects': 10 + i % 5,
+        'Total_Open_Issues': i % 11,
+        'Avg_DQI': 60.0 + i % 40,
+        'Risk_Score': float((i * 37) % 100),
+        'Risk_Level': ['Low', 'Medium', 'High'][i % 3]
+    } for i in range(n)]
+
+@pytest.fixture
+def client():
+    """TestClient authenticated as TEST_USER, without running the startup hooks"""
+    from fastapi.testclient import TestClient
+    server.app.dependency_overrides[server.get_current_user_hybrid] = lambda: dict(TEST_USER)
+    try:
+        yield TestClient(server.app)
+    finally:
+        server.app.dependency_overrides.clear()
+        server.cache.clear()
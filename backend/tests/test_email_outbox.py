@@ -0,0 +1,124 @@
+import asyncio
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from conftest import server
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+ALERT = {"id": "a1", "title": "Missing pages", "priority": "high", "alert_type": "data_quality",
+         "description": "Site 12 has 40 missing pages", "site_id": "Site 12"}
+
+@pytest.fixture
+def outbox(tmp_path, monkeypatch):
+    """In-memory outbox delivering through the file backend into tmp_path"""
+    monkeypatch.setattr(server, 'db', mongomock_motor.AsyncMongoMockClient(tz_aware=True)['outbox_test'])
+    monkeypatch.setattr(server, 'EMAIL_BACKEND', 'file')
+    monkeypatch.setattr(server, 'EMAIL_SINK_DIR', str(tmp_path))
+    monkeypatch.setattr(server, 'email_stats', {k: 0 for k in server.email_stats})
+    return tmp_path
+
+def sent_messages(sink) -> list:
+    return [json.loads(path.read_text()) for path in sorted(sink.glob('*.json'))]
+
+async def find(email_id: str) -> dict:
+    return await server.db.email_outbox.find_one({"id": email_id}, {"_id": 0})
+
+async def make_due(*email_ids: str):
+    # One shared due time: mongomock ignores the claim's sort once _id is projected out
+    past = datetime.now(timezone.utc) - timedelta(seconds=1)
+    await server.db.email_outbox.update_many({"id": {"$in": list(email_ids)}}, {"$set": {"next_attempt_at": past}})
+
+def test_each_message_is_claimed_once(outbox):
+    async def run():
+        ids = {await server.enqueue_email(f"user{i}@example.com", "Report", "text", "<p>html</p>") for i in range(5)}
+        await make_due(*ids)
+        claims = await asyncio.gather(*(server.claim_email() for _ in range(20)))
+        claimed = [doc["id"] for doc in claims if doc]
+        assert sorted(claimed) == sorted(ids)
+        assert await server.claim_email() is None
+        assert await server.db.email_outbox.count_documents({"status": "sending"}) == 5
+    asyncio.run(run())
+
+def test_abandoned_claims_are_taken_again(outbox, monkeypatch):
+    async def run():
+        email_id = await server.enqueue_email("user@example.com", "Report", "text", "<p>html</p>")
+        await make_due(email_id)
+        assert (await server.claim_email())["id"] == email_id
+        assert await server.claim_email() is None
+        stale = datetime.now(timezone.utc) - timedelta(seconds=server.EMAIL_CLAIM_TIMEOUT_SECONDS + 1)
+        await server.db.email_outbox.update_one({"id": email_id}, {"$set": {"claimed_at": stale}})
+        assert (await server.claim_email())["id"] == email_id
+    asyncio.run(run())
+
+def test_failures_back_off_exponentially_then_give_up(outbox, monkeypatch):
+    def unavailable(message):
+        raise RuntimeError("SES throttled")
+    monkeypatch.setattr(server, 'deliver_email', unavailable)
+    monkeypatch.setattr(server, 'EMAIL_RETRY_BASE_SECONDS', 10)
+    monkeypatch.setattr(server, 'EMAIL_MAX_ATTEMPTS', 3)
+    monkeypatch.setattr(server.random, 'uniform', lambda low, high: high)
+
+    async def run():
+        email_id = await server.enqueue_email("user@example.com", "Report", "text", "<p>html</p>")
+        for attempt, delay in ((1, 10), (2, 20)):
+            await make_due(email_id)
+            started = datetime.now(timezone.utc)
+            await server.send_outbox_email(await server.claim_email())
+            doc = await find(email_id)
+            assert (doc["status"], doc["attempts"], doc["last_error"]) == ("pending", attempt, "SES throttled")
+            assert abs((doc["next_attempt_at"] - started).total_seconds() - delay) < 1
+            # Not due again until the backoff has passed
+            assert await server.claim_email() is None
+        await make_due(email_id)
+        await server.send_outbox_email(await server.claim_email())
+        doc = await find(email_id)
+        assert (doc["status"], doc["attempts"]) == ("failed", 3)
+        assert server.email_stats["retried"] == 2 and server.email_stats["failed"] == 1
+    asyncio.run(run())
+
+def test_permanent_errors_are_not_retried(outbox, monkeypatch):
+    def rejected(message):
+        raise server.PermanentEmailError("Email address is not verified")
+    monkeypatch.setattr(server, 'deliver_email', rejected)
+
+    async def run():
+        email_id = await server.enqueue_email("user@example.com", "Report", "text", "<p>html</p>")
+        await make_due(email_id)
+        await server.send_outbox_email(await server.claim_email())
+        doc = await find(email_id)
+        assert (doc["status"], doc["attempts"]) == ("failed", 1)
+    asyncio.run(run())
+
+def test_alerts_fold_into_one_digest(outbox):
+    async def run():
+        first = await server.enqueue_alert_email("lead@example.com", ALERT)
+        await make_due(first)
+        await server.send_outbox_email(await server.claim_email())
+
+        # Alerts within the digest window wait for it to close, then go out together
+        ids = {await server.enqueue_alert_email("lead@example.com", {**ALERT, "id": f"a{i}", "title": f"Alert {i}"})
+               for i in range(2, 5)}
+        other = await server.enqueue_alert_email("cra@example.com", ALERT)
+        assert len(ids) == 1 and other not in ids
+        digest_id = ids.pop()
+        digest = await find(digest_id)
+        assert [a["id"] for a in digest["alerts"]] == ["a2", "a3", "a4"]
+        claimed_at = (await find(first))["claimed_at"]
+        window = timedelta(seconds=server.EMAIL_DIGEST_WINDOW_SECONDS)
+        assert abs((digest["next_attempt_at"] - (claimed_at + window)).total_seconds()) < 1
+
+        await make_due(digest_id, other)
+        while doc := await server.claim_email():
+            await server.send_outbox_email(doc)
+        assert server.email_stats["digested_alerts"] == 2
+
+    asyncio.run(run())
+    subjects = {(m["to"], m["subject"]) for m in sent_messages(outbox)}
+    assert subjects == {
+        ("lead@example.com", f"New Clinical Alert: {ALERT['title']}"),
+        ("lead@example.com", "3 New Clinical Alerts"),
+        ("cra@example.com", f"New Clinical Alert: {ALERT['title']}")
+    }
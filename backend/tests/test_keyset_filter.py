@@ -0,0 +1,20 @@
+from conftest import server
+
+COLUMNS = ['updated_at', 'Study', 'Subject_ID']
+SINCE = '2026-01-01T00:00:00+00:00'
+
+def test_keyset_filter_quotes_values():
+    assert server._keyset_filter(COLUMNS, [SINCE, 'Study 1', 'S"1']) == ','.join([
+        f'or(updated_at.gt."{SINCE}",updated_at.is.null)',
+        f'and(updated_at.eq."{SINCE}",or(Study.gt."Study 1",Study.is.null))',
+        f'and(updated_at.eq."{SINCE}",Study.eq."Study 1",or(Subject_ID.gt."S\\"1",Subject_ID.is.null))'
+    ])
+
+def test_keyset_filter_handles_null_keys():
+    # Nulls sort last: a null key matches only is.null and has nothing after it
+    after_null_study = server._keyset_filter(COLUMNS, [SINCE, None, 'S1'])
+    assert after_null_study == ','.join([
+        f'or(updated_at.gt."{SINCE}",updated_at.is.null)',
+        f'and(updated_at.eq."{SINCE}",Study.is.null,or(Subject_ID.gt."S1",Subject_ID.is.null))'
+    ])
+    assert 'None' not in server._keyset_filter(COLUMNS, [SINCE, 'Study 1', None])
@@ -0,0 +1,60 @@
+import json
+
+import pytest
+
+import pipeline
+
+@pytest.fixture
+def published(tmp_path):
+    """A synthetic build published once to a SQLite target"""
+    result = pipeline.integrate(pipeline.synthetic_inputs(400, seed=3))
+    target = pipeline.SQLiteTarget(tmp_path / 'serving.db')
+    record = pipeline.publish(result, target, tmp_path / 'state')
+    return result, target, record, tmp_path / 'state'
+
+def versions(target) -> list:
+    rows = target.connection.execute(f'SELECT version, tables FROM "{pipeline.PUBLISH_VERSION_TABLE}" ORDER BY version')
+    return [(version, json.loads(tables)) for version, tables in rows]
+
+def test_first_publish_upserts_everything(published):
+    result, target, record, _ = published
+    assert record['version'] == 1
+    for name, table in pipeline.PUBLISH_TABLES.items():
+        expected = len(pipeline.publish_frame(name, result))
+        assert len(target.rows(table)) == expected
+        assert record['tables'][table] == {"rows": expected, "upserted": expected, "deleted": 0}
+
+def test_second_publish_sends_only_the_diff(published):
+    result, target, _, state_dir = published
+    patients = pipeline.publish_frame('unified', result)
+    changed_keys = set(map(tuple, patients[pipeline.BASE_COLUMNS].head(3).to_numpy().tolist()))
+    unified = result.unified.copy()
+    rows = [tuple(key) in changed_keys for key in unified[pipeline.BASE_COLUMNS].to_numpy().tolist()]
+    unified.loc[rows, 'total_open_issues'] += 100
+    sites = result.sites.iloc[1:].reset_index(drop=True)
+    removed_site = result.sites.iloc[0]
+    updated = pipeline.PipelineResult(unified, sites, result.high_risk)
+
+    record = pipeline.publish(updated, target, state_dir)
+
+    assert record['version'] == 2
+    assert record['tables']['Patient Data']['upserted'] == 3
+    assert record['tables']['Patient Data']['deleted'] == 0
+    assert record['tables']['Sites Data'] == {"rows": len(sites), "upserted": 0, "deleted": 1}
+    assert record['tables']['High Risk Sites']['upserted'] == 0
+    assert [version for version, _ in versions(target)] == [1, 2]
+    assert versions(target)[1][1] == record['tables']
+
+    stored = {tuple(r[k] for k in pipeline.BASE_COLUMNS): r for r in target.rows('Patient Data')}
+    for key in changed_keys:
+        original = patients[(patients[pipeline.BASE_COLUMNS] == list(key)).all(axis=1)].iloc[0]
+        assert stored[key]['total_open_issues'] == original['total_open_issues'] + 100
+        assert stored[key][pipeline.SYNC_COLUMN] == record['published_at']
+    site_keys = {tuple(r[k] for k in pipeline.SITE_COLUMNS) for r in target.rows('Sites Data')}
+    assert tuple(removed_site[pipeline.SITE_COLUMNS]) not in site_keys
+    assert len(site_keys) == len(sites)
+
+def test_unchanged_publish_records_no_version(published):
+    result, target, _, state_dir = published
+    assert pipeline.publish(result, target, state_dir) is None
+    assert target.latest_version() == 1
@@ -0,0 +1,66 @@
+import asyncio
+
+import pytest
+
+from conftest import server
+
+@pytest.fixture
+def reloads(monkeypatch):
+    """Record which tables check_published_version refreshes (delta) or resyncs (full)"""
+    calls = {"refresh": [], "resync": [], "latest": None}
+
+    async def resync(table_name):
+        calls["resync"].append(table_name)
+        return []
+
+    monkeypatch.setattr(server, 'published_version', {})
+    monkeypatch.setattr(server, '_fetch_published_version', lambda: calls["latest"])
+    monkeypatch.setattr(server, 'refresh_supabase_table', lambda table_name: calls["refresh"].append(table_name))
+    monkeypatch.setattr(server, 'resync_supabase_table', resync)
+    return calls
+
+def check(calls, version: int, tables: dict = None) -> tuple:
+    """Publish ``version`` and run one check; returns (refreshed, resynced) tables"""
+    calls["latest"] = {"version": version, "tables": tables or {}}
+    calls["refresh"].clear()
+    calls["resync"].clear()
+
+    async def run():
+        await server.check_published_version()
+        await asyncio.gather(*server._resync_tasks)
+    asyncio.run(run())
+    return sorted(calls["refresh"]), sorted(calls["resync"])
+
+def test_first_version_seen_at_startup_reloads_nothing(reloads):
+    assert check(reloads, 4) == ([], [])
+    assert server.published_version['version'] == 4
+
+def test_upserts_trigger_a_delta_refresh(reloads):
+    check(reloads, 1)
+    changes = {'Sites Data': {"rows": 10, "upserted": 2, "deleted": 0},
+               'Patient Data': {"rows": 50, "upserted": 0, "deleted": 0}}
+    assert check(reloads, 2, changes) == (['Sites Data'], [])
+
+def test_deletions_trigger_a_full_resync(reloads):
+    check(reloads, 1)
+    changes = {'Patient Data': {"rows": 49, "upserted": 3, "deleted": 1},
+               'Sites Data': {"rows": 10, "upserted": 1, "deleted": 0}}
+    assert check(reloads, 2, changes) == (['Sites Data'], ['Patient Data'])
+
+def test_skipped_version_resyncs_every_warm_table(reloads):
+    check(reloads, 1)
+    changes = {'Sites Data': {"rows": 10, "upserted": 1, "deleted": 0}}
+    assert check(reloads, 3, changes) == ([], sorted(server.WARM_TABLES))
+
+def test_same_version_is_ignored(reloads):
+    check(reloads, 1)
+    check(reloads, 2, {'Sites Data': {"rows": 10, "upserted": 1, "deleted": 0}})
+    assert check(reloads, 2, {'Sites Data': {"rows": 10, "upserted": 1, "deleted": 0}}) == ([], [])
+
+def test_resync_endpoint_only_accepts_known_tables(client, reloads, monkeypatch):
+    monkeypatch.setattr(server, 'supabase', object())
+    response = client.post('/api/cache/resync', params={'table': 'users'})
+    assert response.status_code == 400
+    assert reloads["resync"] == []
+    assert client.post('/api/cache/resync', params={'table': 'Sites Data'}).json()["tables"] == {'Sites Data': 0}
+    assert sorted(client.post('/api/cache/resync').json()["tables"]) == sorted(server.WARM_TABLES)
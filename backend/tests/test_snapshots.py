@@ -0,0 +1,75 @@
+import json
+
+import pytest
+
+from conftest import make_sites, server
+
+ROWS = 250
+
+@pytest.fixture
+def snapshot_mode(tmp_path, monkeypatch):
+    """Serve 'Sites Data' from an Arrow snapshot with no Supabase client"""
+    if not server.SNAPSHOTS_ENABLED:
+        pytest.skip("pyarrow is not installed")
+    monkeypatch.setattr(server, 'SNAPSHOT_DIR', str(tmp_path))
+    monkeypatch.setattr(server, 'SNAPSHOT_ONLY', True)
+    monkeypatch.setattr(server, 'supabase', None)
+    monkeypatch.setattr(server, '_written_snapshot_versions', {})
+    records = make_sites(ROWS)
+    server.save_snapshot('Sites Data', server.ColumnarTable.from_records(records))
+    server.cache.clear()
+    return records
+
+def test_lists_rows_from_snapshot(client, snapshot_mode):
+    response = client.get('/api/data/site-level')
+    assert response.status_code == 200
+    body = response.json()
+    assert body['total'] == ROWS
+    assert body['data'] == snapshot_mode
+
+def test_etag_revalidation(client, snapshot_mode):
+    first = client.get('/api/data/site-level', params={'risk_level': 'High'})
+    etag = first.headers['ETag']
+    again = client.get('/api/data/site-level', params={'risk_level': 'High'}, headers={'If-None-Match': etag})
+    assert again.status_code == 304
+    assert again.headers['ETag'] == etag
+    other = client.get('/api/data/site-level', params={'risk_level': 'Low'}, headers={'If-None-Match': etag})
+    assert other.status_code == 200
+
+def test_cursor_paging_covers_every_row(client, snapshot_mode):
+    seen, cursor = [], None
+    while True:
+        params = {'limit': 40, 'sort': '-Risk_Score'}
+        if cursor:
+            params['cursor'] = cursor
+        body = client.get('/api/data/site-level', params=params).json()
+        seen += [row['Site_ID'] for row in body['data']]
+        cursor = body['next_cursor']
+        if not cursor:
+            break
+    assert len(seen) == ROWS
+    assert set(seen) == {row['Site_ID'] for row in snapshot_mode}
+
+def test_invalid_cursor_is_rejected(client, snapshot_mode):
+    assert client.get('/api/data/site-level', params={'cursor': 'not-a-cursor'}).status_code == 400
+
+def test_cursor_from_older_snapshot_is_rejected(client, snapshot_mode):
+    cursor = client.get('/api/data/site-level', params={'limit': 40}).json()['next_cursor']
+    server.save_snapshot('Sites Data', server.ColumnarTable.from_records(make_sites(ROWS + 10)))
+    server.cache.clear()
+    response = client.get('/api/data/site-level', params={'limit': 40, 'cursor': cursor})
+    assert response.status_code == 409
+    assert client.get('/api/data/site-level', params={'limit': 40}).json()['total'] == ROWS + 10
+
+def test_stream_ndjson(client, snapshot_mode):
+    response = client.get('/api/data/site-level', params={'stream': 'ndjson', 'country': 'USA'})
+    assert response.status_code == 200
+    assert response.headers['content-type'].startswith('application/x-ndjson')
+    rows = [json.loads(line) for line in response.text.splitlines() if line]
+    expected = [row for row in snapshot_mode if row['Country'] == 'USA']
+    assert rows == expected
+    assert int(response.headers['X-Total-Count']) == len(expected)
+
+def test_stream_json_array(client, snapshot_mode):
+    response = client.get('/api/data/site-level', params={'stream': 'json', 'fields': 'Site_ID'})
+    assert json.loads(response.text) == [{'Site_ID': row['Site_ID']} for row in snapshot_mode]
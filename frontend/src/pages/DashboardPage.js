@@ -65,8 +65,8 @@ const DashboardPage = () => {
   const [stats, setStats] = useState(null);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState('');
-  const [sitesData, setSitesData] = useState([]);
-  const [patientsData, setPatientsData] = useState([]);
+  // Chart series precomputed by /data/dashboard (risk distribution, top sites, DQI buckets, breakdowns)
+  const [bundle, setBundle] = useState(null);
   const [isLive, setIsLive] = useState(true);
 
   // Live Data Simulation Engine
@@ -85,22 +85,26 @@ const DashboardPage = () => {
         };
       });
 
-      setSitesData(prev => {
-        return prev.map(site => {
-          if (Math.random() > 0.7) { // Only update 30% of sites per tick
-            return {
-              ...site,
-              Total_Open_Issues: Math.max(0, site.Total_Open_Issues + (Math.floor(Math.random() * 3) - 1)),
-              Risk_Score: Math.min(100, Math.max(0, site.Risk_Score + (Math.random() * 2 - 1)))
-            };
-          }
-          return site;
-        });
+      setBundle(prev => {
+        if (!prev) return prev;
+        return {
+          ...prev,
+          top_sites: (prev.top_sites || []).map(site => {
+            if (Math.random() > 0.7) { // Only update 30% of sites per tick
+              return {
+                ...site,
+                Total_Open_Issues: Math.max(0, (site.Total_Open_Issues || 0) + (Math.floor(Math.random() * 3) - 1)),
+                Risk_Score: Math.min(100, Math.max(0, (site.Risk_Score || 0) + (Math.random() * 2 - 1)))
+              };
+            }
+            return site;
+          })
+        };
       });
     }, 3000); // Update every 3 seconds
 
     return () => clearInterval(interval);
-  }, [isLive, sitesData]);
+  }, [isLive]);
 
   useEffect(() => {
     fetchDashboardData();
@@ -109,15 +113,10 @@ const DashboardPage = () => {
   const fetchDashboardData = async () => {
     setLoading(true);
     try {
-      const [statsRes, sitesRes, patientsRes] = await Promise.all([
-        api.get('/data/dashboard-stats'),
-        api.get('/data/site-level'),
-        api.get('/data/patient-level')
-      ]);
+      const dashboardRes = await api.get('/data/dashboard');
 
-      setStats(statsRes.data);
-      setSitesData(sitesRes.data.data || []);
-      setPatientsData(patientsRes.data.data || []);
+      setStats(dashboardRes.data.kpis);
+      setBundle(dashboardRes.data);
       setError('');
     } catch (err) {
       if (err.response?.status === 503 || err.code === "ERR_NETWORK") {
@@ -131,13 +130,33 @@ const DashboardPage = () => {
           clean_patients: 1068,
           avg_dqi: 92
         });
-        setSitesData([
-          { Site_ID: 'Site-001', Risk_Level: 'High', Risk_Score: 85, Total_Open_Issues: 12, Region: 'North America', Total_Subjects: 120, Avg_DQI: 88 },
-          { Site_ID: 'Site-002', Risk_Level: 'Medium', Risk_Score: 60, Total_Open_Issues: 5, Region: 'Europe', Total_Subjects: 90, Avg_DQI: 94 },
-          { Site_ID: 'Site-003', Risk_Level: 'Low', Risk_Score: 20, Total_Open_Issues: 1, Region: 'Asia', Total_Subjects: 200, Avg_DQI: 98 },
-          { Site_ID: 'Site-004', Risk_Level: 'High', Risk_Score: 92, Total_Open_Issues: 15, Region: 'North America', Total_Subjects: 80, Avg_DQI: 75 },
-          { Site_ID: 'Site-005', Risk_Level: 'Medium', Risk_Score: 45, Total_Open_Issues: 3, Region: 'Europe', Total_Subjects: 150, Avg_DQI: 96 },
-        ]);
+        setBundle({
+          risk_distribution: [
+            { name: 'High', value: 2 },
+            { name: 'Medium', value: 2 },
+            { name: 'Low', value: 1 }
+          ],
+          top_sites: [
+            { Site_ID: 'Site-004', Risk_Level: 'High', Risk_Score: 92, Total_Open_Issues: 15 },
+            { Site_ID: 'Site-001', Risk_Level: 'High', Risk_Score: 85, Total_Open_Issues: 12 },
+            { Site_ID: 'Site-002', Risk_Level: 'Medium', Risk_Score: 60, Total_Open_Issues: 5 },
+            { Site_ID: 'Site-005', Risk_Level: 'Medium', Risk_Score: 45, Total_Open_Issues: 3 },
+            { Site_ID: 'Site-003', Risk_Level: 'Low', Risk_Score: 20, Total_Open_Issues: 1 }
+          ],
+          dqi_buckets: [
+            { range: '60-70', count: 40 },
+            { range: '70-80', count: 130 },
+            { range: '80-90', count: 380 },
+            { range: '90-100', count: 700 }
+          ],
+          breakdowns: {
+            Region: [
+              { name: 'North America', sites: 2, patients: 200, avg_dqi: 81.5 },
+              { name: 'Europe', sites: 2, patients: 240, avg_dqi: 95 },
+              { name: 'Asia', sites: 1, patients: 200, avg_dqi: 98 }
+            ]
+          }
+        });
       } else {
         console.error("Dashboard fetch error:", err);
       }
@@ -146,18 +165,10 @@ const DashboardPage = () => {
     }
   };
 
-  const getRiskDistribution = () => {
-    if (!sitesData.length) return [];
-    const riskCounts = sitesData.reduce((acc, site) => {
-      const level = site.Risk_Level || 'Unknown';
-      acc[level] = (acc[level] || 0) + 1;
-      return acc;
-    }, {});
-    return Object.entries(riskCounts).map(([name, value]) => ({ name, value }));
-  };
+  const getRiskDistribution = () => bundle?.risk_distribution || [];
 
   const getTopRiskySites = () => {
-    return sitesData
+    return (bundle?.top_sites || [])
       .filter((site) => site.Risk_Level === 'High' || site.Risk_Score > 50)
       .sort((a, b) => (b.Risk_Score || 0) - (a.Risk_Score || 0))
       .slice(0, 5)
@@ -169,26 +180,16 @@ const DashboardPage = () => {
   };
 
   const getRegionStats = () => {
-    if (!sitesData.length) return [];
-    const regionData = sitesData.reduce((acc, site) => {
-      const region = site.Region || 'Unknown';
-      if (!acc[region]) {
-        acc[region] = { region, sites: 0, patients: 0, avgDQI: [] };
-      }
-      acc[region].sites += 1;
-      acc[region].patients += site.Total_Subjects || 0;
-      if (site.Avg_DQI) acc[region].avgDQI.push(site.Avg_DQI);
-      return acc;
-    }, {});
-
-    return Object.values(regionData).map((r) => ({
-      region: r.region,
+    return (bundle?.breakdowns?.Region || []).map((r) => ({
+      region: r.name ?? 'Unknown',
       sites: r.sites,
       patients: r.patients,
-      avgDQI: r.avgDQI.length ? (r.avgDQI.reduce((a, b) => a + b, 0) / r.avgDQI.length).toFixed(2) : 0
+      avgDQI: r.avg_dqi ?? 0
     }));
   };
 
+  const getDqiBuckets = () => (bundle?.dqi_buckets || []).filter((bucket) => bucket.count > 0);
+
   const COLORS = {
     High: '#ef4444',
     Medium: '#f59e0b',
@@ -474,6 +475,21 @@ const DashboardPage = () => {
                 )}
               </div>
             </div>
+            {/* Patient DQI Distribution */}
+            {getDqiBuckets().length > 0 && (
+              <div className="mt-6" data-testid="dqi-distribution">
+                <ResponsiveContainer width="100%" height={120}>
+                  <BarChart data={getDqiBuckets()}>
+                    <XAxis dataKey="range" tick={{ fontSize: 11, fill: '#94a3b8' }} axisLine={false} tickLine={false} />
+                    <Tooltip
+                      contentStyle={{ backgroundColor: '#030712', borderColor: '#1f2937', color: '#f8fafc' }}
+                      cursor={{ fill: 'rgba(255,255,255,0.05)' }}
+                    />
+                    <Bar dataKey="count" fill="#10b981" name="Patients" radius={[4, 4, 0, 0]} />
+                  </BarChart>
+                </ResponsiveContainer>
+              </div>
+            )}
             {/* Animated Progress Bar */}
             <div className="mt-6 h-2 bg-slate-800 rounded-full overflow-hidden">
               <motion.div